@@ -507,6 +507,8 @@ library Math128x128 {
                     invert := iszero(invert)
                 }
 
+                // The squarings are skipped by groups once the remaining bits of absY are all zero,
+                // they would only feed bits that are not set so the result is unchanged
                 if and(absY, 0x1) {
                     result := shr(128, mul(result, pow))
                 }
@@ -538,53 +540,59 @@ library Math128x128 {
                 if and(absY, 0x80) {
                     result := shr(128, mul(result, pow))
                 }
-                pow := shr(128, mul(pow, pow))
-                if and(absY, 0x100) {
-                    result := shr(128, mul(result, pow))
-                }
-                pow := shr(128, mul(pow, pow))
-                if and(absY, 0x200) {
-                    result := shr(128, mul(result, pow))
-                }
-                pow := shr(128, mul(pow, pow))
-                if and(absY, 0x400) {
-                    result := shr(128, mul(result, pow))
-                }
-                pow := shr(128, mul(pow, pow))
-                if and(absY, 0x800) {
-                    result := shr(128, mul(result, pow))
-                }
-                pow := shr(128, mul(pow, pow))
-                if and(absY, 0x1000) {
-                    result := shr(128, mul(result, pow))
-                }
-                pow := shr(128, mul(pow, pow))
-                if and(absY, 0x2000) {
-                    result := shr(128, mul(result, pow))
-                }
-                pow := shr(128, mul(pow, pow))
-                if and(absY, 0x4000) {
-                    result := shr(128, mul(result, pow))
-                }
-                pow := shr(128, mul(pow, pow))
-                if and(absY, 0x8000) {
-                    result := shr(128, mul(result, pow))
-                }
-                pow := shr(128, mul(pow, pow))
-                if and(absY, 0x10000) {
-                    result := shr(128, mul(result, pow))
-                }
-                pow := shr(128, mul(pow, pow))
-                if and(absY, 0x20000) {
-                    result := shr(128, mul(result, pow))
-                }
-                pow := shr(128, mul(pow, pow))
-                if and(absY, 0x40000) {
-                    result := shr(128, mul(result, pow))
-                }
-                pow := shr(128, mul(pow, pow))
-                if and(absY, 0x80000) {
-                    result := shr(128, mul(result, pow))
+                if shr(8, absY) {
+                    pow := shr(128, mul(pow, pow))
+                    if and(absY, 0x100) {
+                        result := shr(128, mul(result, pow))
+                    }
+                    pow := shr(128, mul(pow, pow))
+                    if and(absY, 0x200) {
+                        result := shr(128, mul(result, pow))
+                    }
+                    pow := shr(128, mul(pow, pow))
+                    if and(absY, 0x400) {
+                        result := shr(128, mul(result, pow))
+                    }
+                    pow := shr(128, mul(pow, pow))
+                    if and(absY, 0x800) {
+                        result := shr(128, mul(result, pow))
+                    }
+                    if shr(12, absY) {
+                        pow := shr(128, mul(pow, pow))
+                        if and(absY, 0x1000) {
+                            result := shr(128, mul(result, pow))
+                        }
+                        pow := shr(128, mul(pow, pow))
+                        if and(absY, 0x2000) {
+                            result := shr(128, mul(result, pow))
+                        }
+                        pow := shr(128, mul(pow, pow))
+                        if and(absY, 0x4000) {
+                            result := shr(128, mul(result, pow))
+                        }
+                        pow := shr(128, mul(pow, pow))
+                        if and(absY, 0x8000) {
+                            result := shr(128, mul(result, pow))
+                        }
+                        if shr(16, absY) {
+                            pow := shr(128, mul(pow, pow))
+                            if and(absY, 0x10000) {
+                                result := shr(128, mul(result, pow))
+                            }
+                            pow := shr(128, mul(pow, pow))
+                            if and(absY, 0x20000) {
+                                result := shr(128, mul(result, pow))
+                            }
+                            pow := shr(128, mul(pow, pow))
+                            if and(absY, 0x40000) {
+                                result := shr(128, mul(result, pow))
+                            }
+                            pow := shr(128, mul(pow, pow))
+                            if and(absY, 0x80000) {
+                                result := shr(128, mul(result, pow))
+                            }
+                        }
+                    }
                 }
             }
         }
@@ -646,3 +654,151 @@ library BinHelper {
         }
     }
 }
+
+library TreeMath {
+    using BitMath for uint256;
+
+    /// @notice Returns whether `_id` is set in the tree
+    /// @param _tree The storage slot of the tree
+    /// @param _id The bin id
+    /// @return Whether the bin is in the tree
+    function contains(mapping(uint256 => uint256)[3] storage _tree, uint256 _id)
+        internal
+        view
+        returns (bool)
+    {
+        return (_tree[2][_id >> 8] >> (_id & 255)) & 1 == 1;
+    }
+
+    /// @notice Returns the first id that is set in the tree, strictly on the right (lower ids)
+    /// or on the left (higher ids) of `_id`
+    /// @param _tree The storage slot of the tree
+    /// @param _id The bin id to start searching from, excluded
+    /// @param _rightSide Whether we're searching for lower ids (true) or higher ids (false)
+    /// @return The closest id that is set in the tree. If there is none, it returns max(uint256)
+    function findFirstBin(
+        mapping(uint256 => uint256)[3] storage _tree,
+        uint256 _id,
+        bool _rightSide
+    ) internal view returns (uint256) {
+        unchecked {
+            uint256 _key2 = _id >> 8;
+            uint256 _key1 = _key2 >> 8;
+
+            // Search in depth 2
+            uint256 _bit = _closestBit(_tree[2][_key2], _id & 255, _rightSide);
+            if (_bit != type(uint256).max) return (_key2 << 8) + _bit;
+
+            // Search in depth 1
+            _bit = _closestBit(_tree[1][_key1], _key2 & 255, _rightSide);
+            if (_bit != type(uint256).max) {
+                _key2 = (_key1 << 8) + _bit;
+                return (_key2 << 8) + _tree[2][_key2].significantBit(_rightSide);
+            }
+
+            // Search in depth 0
+            _bit = _closestBit(_tree[0][0], _key1, _rightSide);
+            if (_bit == type(uint256).max) return type(uint256).max;
+
+            _key2 = (_bit << 8) + _tree[1][_bit].significantBit(_rightSide);
+            return (_key2 << 8) + _tree[2][_key2].significantBit(_rightSide);
+        }
+    }
+
+    /// @notice Returns the lowest id set in the tree, the tree needs to be non empty
+    /// @param _tree The storage slot of the tree
+    /// @return The lowest id
+    function findLowestBin(mapping(uint256 => uint256)[3] storage _tree)
+        internal
+        view
+        returns (uint256)
+    {
+        unchecked {
+            uint256 _key1 = _tree[0][0].leastSignificantBit();
+            uint256 _key2 = (_key1 << 8) + _tree[1][_key1].leastSignificantBit();
+            return (_key2 << 8) + _tree[2][_key2].leastSignificantBit();
+        }
+    }
+
+    /// @notice Returns the highest id set in the tree, the tree needs to be non empty
+    /// @param _tree The storage slot of the tree
+    /// @return The highest id
+    function findHighestBin(mapping(uint256 => uint256)[3] storage _tree)
+        internal
+        view
+        returns (uint256)
+    {
+        unchecked {
+            uint256 _key1 = _tree[0][0].mostSignificantBit();
+            uint256 _key2 = (_key1 << 8) + _tree[1][_key1].mostSignificantBit();
+            return (_key2 << 8) + _tree[2][_key2].mostSignificantBit();
+        }
+    }
+
+    /// @notice Adds `_id` to the tree
+    /// @param _tree The storage slot of the tree
+    /// @param _id The bin id, needs to fit in a uint24
+    /// @return Whether the id was added (false if it was already in the tree)
+    function addToTree(mapping(uint256 => uint256)[3] storage _tree, uint256 _id)
+        internal
+        returns (bool)
+    {
+        uint256 _key2 = _id >> 8;
+        uint256 _leaf = _tree[2][_key2];
+        uint256 _mask = 1 << (_id & 255);
+        if (_leaf & _mask != 0) return false;
+
+        _tree[2][_key2] = _leaf | _mask;
+        if (_leaf == 0) {
+            uint256 _key1 = _id >> 16;
+            uint256 _branch = _tree[1][_key1];
+            _tree[1][_key1] = _branch | (1 << (_key2 & 255));
+            if (_branch == 0) {
+                _tree[0][0] |= 1 << _key1;
+            }
+        }
+        return true;
+    }
+
+    /// @notice Removes `_id` from the tree
+    /// @param _tree The storage slot of the tree
+    /// @param _id The bin id, needs to fit in a uint24
+    /// @return Whether the id was removed (false if it was not in the tree)
+    function removeFromTree(mapping(uint256 => uint256)[3] storage _tree, uint256 _id)
+        internal
+        returns (bool)
+    {
+        uint256 _key2 = _id >> 8;
+        uint256 _leaf = _tree[2][_key2];
+        uint256 _mask = 1 << (_id & 255);
+        if (_leaf & _mask == 0) return false;
+
+        _leaf &= ~_mask;
+        _tree[2][_key2] = _leaf;
+        if (_leaf == 0) {
+            uint256 _key1 = _id >> 16;
+            uint256 _branch = _tree[1][_key1] & ~(1 << (_key2 & 255));
+            _tree[1][_key1] = _branch;
+            if (_branch == 0) {
+                _tree[0][0] &= ~(1 << _key1);
+            }
+        }
+        return true;
+    }
+
+    /// @notice Returns the closest non-zero bit of `_integer` strictly on the right (or left) of `_bit`
+    /// @param _integer The integer as a uint256
+    /// @param _bit The bit index, excluded from the search
+    /// @param _rightSide Whether we're searching on the right side (true) or the left side (false)
+    /// @return The index of the closest non-zero bit. If there is no closest bit, it returns max(uint256)
+    function _closestBit(
+        uint256 _integer,
+        uint256 _bit,
+        bool _rightSide
+    ) private pure returns (uint256) {
+        if (_rightSide) {
+            return _bit == 0 ? type(uint256).max : _integer.closestBitRight(uint8(_bit - 1));
+        }
+        return _bit == 255 ? type(uint256).max : _integer.closestBitLeft(uint8(_bit + 1));
+    }
+}
@@ -3,6 +3,7 @@ pragma solidity ^0.8.0;
 
 import "@openzeppelin/contracts/token/ERC20/utils/SafeERC20.sol";
 import "@openzeppelin/contracts/utils/structs/EnumerableSet.sol";
+import "@openzeppelin/contracts/utils/math/SafeCast.sol";
 import "@openzeppelin/contracts/token/ERC20/extensions/IERC20Metadata.sol";
 import "@openzeppelinUpgradeable/contracts/proxy/utils/Initializable.sol";
 import "@openzeppelinUpgradeable/contracts/access/OwnableUpgradeable.sol";
@@ -17,6 +18,7 @@ import "interfaces/ILBToken.sol";
 import "interfaces/IOracleHelper.sol";
 import "interfaces/IStrategy.sol";
 import "interfaces/IViewHelper.sol";
+import "./BinHelper.sol";
 
 /// @title Locker
 /// @author Vector Team
@@ -28,7 +30,9 @@ contract LBPool is
     ReentrancyGuardUpgradeable
 {
     using SafeERC20 for IERC20;
+    using SafeCast for uint256;
     using EnumerableSet for EnumerableSet.UintSet;
+    using TreeMath for mapping(uint256 => uint256)[3];
 
     address public tokenX;
     address public tokenY;
@@ -45,24 +49,79 @@ contract LBPool is
     IOracleHelper public oracle;
     uint256 public constant PRECISION = 10000;
     uint256 constant EPSILON = 1000;
+    uint256 public constant DEFAULT_MAX_DEPOSITED_BINS = 49;
+    /// @notice Highest maxDepositedBins, deposits, withdrawals and rebalances still go through every deposited bin
+    uint256 public constant MAX_DEPOSITED_BINS_CEILING = 100;
+    /// @dev Bumped with every storage change that needs a migration, see migrateLayout
+    uint256 private constant LAYOUT_VERSION = 1;
 
+    /// @dev Replaced by depositedBinsTree, only kept to preserve the storage layout. See migrateLayout
     EnumerableSet.UintSet private depositedIds;
 
-    uint256 public withdrawalFee;
-    uint256 public withdrawalFeeDelay;
+    /// @dev Replaced by config, only kept to preserve the storage layout. See migrateLayout
+    uint256 private legacyWithdrawalFee;
+    uint256 private legacyWithdrawalFeeDelay;
 
-    uint256 public swapThreshold;
-    uint256 public depositThreshold;
-    uint256 public addLiquidityThreshold;
+    uint256 private legacySwapThreshold;
+    uint256 private legacyDepositThreshold;
+    uint256 private legacyAddLiquidityThreshold;
 
-    uint256 public swapMaxValue;
-    uint256 public swapMinimumThreshold;
-    uint256 public deltaSwapSafeguard;
-    uint256 public lastSwap;
-    uint256 public delayBetweenSwaps;
+    uint256 private legacySwapMaxValue;
+    uint256 private legacySwapMinimumThreshold;
+    uint256 private legacyDeltaSwapSafeguard;
+    uint256 private legacyLastSwap;
+    uint256 private legacyDelayBetweenSwaps;
 
     mapping(address => uint256) public lastDepositedTime;
 
+    mapping(uint256 => uint256)[3] private depositedBinsTree;
+    uint256 public depositedBinsCount;
+
+    /// @dev Receipt tokens held by the receipts manager in each bin, kept up to date on every add and remove
+    mapping(uint256 => uint256) public binReceiptBalance;
+
+    /// @dev Settings and timestamps of the vault, packed in 3 slots grouped by the entry points reading them
+    struct Config {
+        // Read by deposits, withdrawals and additions of liquidity
+        uint64 depositThreshold;
+        uint64 addLiquidityThreshold;
+        uint16 withdrawalFee;
+        uint32 withdrawalFeeDelay;
+        // 0 means DEFAULT_MAX_DEPOSITED_BINS, see maxDepositedBins
+        uint16 maxDepositedBins;
+        uint32 harvestInterval;
+        uint32 lastHarvest;
+        // Read by swaps, and by deposits checking the pending fees
+        uint64 swapThreshold;
+        uint32 deltaSwapSafeguard;
+        uint32 lastSwap;
+        uint32 delayBetweenSwaps;
+        uint96 minHarvestValue;
+        // Read by swaps
+        uint128 swapMaxValue;
+        uint128 swapMinimumThreshold;
+    }
+
+    Config private config;
+
+    /// @dev Last layout the storage was migrated to, see migrateLayout
+    uint256 private layoutVersion;
+
+    /// @dev State of the vault read once per transaction and reused by every share and amount computation
+    struct Valuation {
+        uint256 oraclePrice;
+        uint256 activeId;
+        uint256 balanceX;
+        uint256 balanceY;
+        uint256[] bins;
+        uint256[] reservesX;
+        uint256[] reservesY;
+        uint256[] receiptBalances;
+        uint256 totalX;
+        uint256 totalY;
+        uint256 totalSupply;
+    }
+
     event SetDelayBetweenSwaps(uint256);
     event SetDeltaSwapSafeguard(uint256);
     event SetSwapMinimumThreshold(uint256);
@@ -72,6 +131,8 @@ contract LBPool is
     event SetDepositThreshold(uint256);
     event SetStrategy(address);
     event SetWithdrawalFee(uint256 delay, uint256 value);
+    event SetHarvestPolicy(uint256 interval, uint256 minValue);
+    event SetMaxDepositedBins(uint256);
     event SetOracle(address);
     event SetReceiptsManager(address);
     event ParamsSet(int256[] _deltaIds, uint256[] _distributionX, uint256[] _distributionY);
@@ -115,6 +176,21 @@ contract LBPool is
         receiptToken = ILBToken(_pair);
         receiptToken.setApprovalForAll(_router, true);
         viewHelper = IViewHelper(_viewHelper);
+        layoutVersion = LAYOUT_VERSION;
+    }
+
+    /**
+     * @notice Moves the storage of a vault deployed before the bin tree, the receipt mirror and the packed config
+     * @dev To be called by the proxy admin through upgradeAndCall, so the vault never runs the new implementation
+     * with an empty bin tree, receipt mirror or config. The bins are moved first as the mirror is read from them.
+     * It only moves state, so it is left open, and runs once per layout.
+     */
+    function migrateLayout() external {
+        require(layoutVersion < LAYOUT_VERSION, "Already migrated");
+        layoutVersion = LAYOUT_VERSION;
+        _migrateDepositedIds();
+        _syncReceiptBalances(getDepositedBins());
+        _migrateConfig();
     }
 
     modifier onlyStrategy() {
@@ -133,48 +209,173 @@ contract LBPool is
     }
 
     function setWithdrawalFee(uint256 delay, uint256 value) external onlyOwner {
-        withdrawalFee = value;
-        withdrawalFeeDelay = delay;
+        require(value <= PRECISION, "Too high");
+        config.withdrawalFee = value.toUint16();
+        config.withdrawalFeeDelay = delay.toUint32();
         emit SetWithdrawalFee(delay, value);
     }
 
+    /**
+     * @notice Sets when deposits harvest, explicit harvests and withdrawals are not affected
+     * @dev A deposit skipping the harvest values the pending fees net of the harvest fees, see _harvestIfDue
+     * @param interval minimum time between two harvests done by deposits
+     * @param minValue minimum pending fees, in tokenY, for a deposit to harvest. 0 to not check pending fees
+     */
+    function setHarvestPolicy(uint256 interval, uint256 minValue) external onlyOwner {
+        config.harvestInterval = interval.toUint32();
+        config.minHarvestValue = minValue.toUint96();
+        emit SetHarvestPolicy(interval, minValue);
+    }
+
+    /**
+     * @notice Sets how many bins the vault can have liquidity in
+     * @dev Above a few dozens of bins, use the paginated functions to withdraw all, harvest or read the reserves.
+     * Up to MAX_DEPOSITED_BINS_CEILING, so that the paths that are not paginated fit in a transaction
+     * @param _value maximum number of deposited bins, 0 for DEFAULT_MAX_DEPOSITED_BINS
+     */
+    function setMaxDepositedBins(uint256 _value) external onlyOwner {
+        require(_value <= MAX_DEPOSITED_BINS_CEILING, "Too high");
+        config.maxDepositedBins = _value.toUint16();
+        emit SetMaxDepositedBins(_value);
+    }
+
+    function maxDepositedBins() public view returns (uint256) {
+        uint256 value = config.maxDepositedBins;
+        return value == 0 ? DEFAULT_MAX_DEPOSITED_BINS : value;
+    }
+
+    function withdrawalFee() external view returns (uint256) {
+        return config.withdrawalFee;
+    }
+
+    function withdrawalFeeDelay() external view returns (uint256) {
+        return config.withdrawalFeeDelay;
+    }
+
+    function swapThreshold() external view returns (uint256) {
+        return config.swapThreshold;
+    }
+
+    function depositThreshold() external view returns (uint256) {
+        return config.depositThreshold;
+    }
+
+    function addLiquidityThreshold() external view returns (uint256) {
+        return config.addLiquidityThreshold;
+    }
+
+    function swapMaxValue() external view returns (uint256) {
+        return config.swapMaxValue;
+    }
+
+    function swapMinimumThreshold() external view returns (uint256) {
+        return config.swapMinimumThreshold;
+    }
+
+    function deltaSwapSafeguard() external view returns (uint256) {
+        return config.deltaSwapSafeguard;
+    }
+
+    function lastSwap() external view returns (uint256) {
+        return config.lastSwap;
+    }
+
+    function delayBetweenSwaps() external view returns (uint256) {
+        return config.delayBetweenSwaps;
+    }
+
+    function harvestInterval() external view returns (uint256) {
+        return config.harvestInterval;
+    }
+
+    function minHarvestValue() external view returns (uint256) {
+        return config.minHarvestValue;
+    }
+
+    function lastHarvest() external view returns (uint256) {
+        return config.lastHarvest;
+    }
+
+    /// @dev Moves the settings stored before the packed config into it, clearing each legacy value once moved
+    function _migrateConfig() private {
+        Config storage _config = config;
+        if (legacyWithdrawalFee > 0 || legacyWithdrawalFeeDelay > 0) {
+            _config.withdrawalFee = legacyWithdrawalFee.toUint16();
+            _config.withdrawalFeeDelay = legacyWithdrawalFeeDelay.toUint32();
+            delete legacyWithdrawalFee;
+            delete legacyWithdrawalFeeDelay;
+        }
+        if (legacySwapThreshold > 0) {
+            _config.swapThreshold = legacySwapThreshold.toUint64();
+            delete legacySwapThreshold;
+        }
+        if (legacyDepositThreshold > 0) {
+            _config.depositThreshold = legacyDepositThreshold.toUint64();
+            delete legacyDepositThreshold;
+        }
+        if (legacyAddLiquidityThreshold > 0) {
+            _config.addLiquidityThreshold = legacyAddLiquidityThreshold.toUint64();
+            delete legacyAddLiquidityThreshold;
+        }
+        if (legacySwapMaxValue > 0) {
+            _config.swapMaxValue = legacySwapMaxValue.toUint128();
+            delete legacySwapMaxValue;
+        }
+        if (legacySwapMinimumThreshold > 0) {
+            _config.swapMinimumThreshold = legacySwapMinimumThreshold.toUint128();
+            delete legacySwapMinimumThreshold;
+        }
+        if (legacyDeltaSwapSafeguard > 0) {
+            _config.deltaSwapSafeguard = legacyDeltaSwapSafeguard.toUint32();
+            delete legacyDeltaSwapSafeguard;
+        }
+        if (legacyLastSwap > 0) {
+            _config.lastSwap = legacyLastSwap.toUint32();
+            delete legacyLastSwap;
+        }
+        if (legacyDelayBetweenSwaps > 0) {
+            _config.delayBetweenSwaps = legacyDelayBetweenSwaps.toUint32();
+            delete legacyDelayBetweenSwaps;
+        }
+    }
+
     function setStrategy(address _strategy) external onlyOwner {
         strategy = _strategy;
         emit SetStrategy(strategy);
     }
 
     function setDepositThreshold(uint256 _value) external onlyOwner {
-        depositThreshold = _value;
+        config.depositThreshold = _value.toUint64();
         emit SetDepositThreshold(_value);
     }
 
     function setAddLiquidityThreshold(uint256 _value) external onlyOwner {
-        addLiquidityThreshold = _value;
+        config.addLiquidityThreshold = _value.toUint64();
         emit SetAddLiquidityThreshold(_value);
     }
 
     function setSwapThreshold(uint256 _value) external onlyOwner {
-        swapThreshold = _value;
+        config.swapThreshold = _value.toUint64();
         emit SetSwapThreshold(_value);
     }
 
     function setSwapMaxValue(uint256 _value) external onlyOwner {
-        swapMaxValue = _value;
+        config.swapMaxValue = _value.toUint128();
         emit SetSwapMaxValue(_value);
     }
 
     function setSwapMinimumThreshold(uint256 _value) external onlyOwner {
-        swapMinimumThreshold = _value;
+        config.swapMinimumThreshold = _value.toUint128();
         emit SetSwapMinimumThreshold(_value);
     }
 
     function setDeltaSwapSafeguard(uint256 _value) external onlyOwner {
-        deltaSwapSafeguard = _value;
+        config.deltaSwapSafeguard = _value.toUint32();
         emit SetDeltaSwapSafeguard(_value);
     }
 
     function setDelayBetweenSwaps(uint256 _value) external onlyOwner {
-        delayBetweenSwaps = _value;
+        config.delayBetweenSwaps = _value.toUint32();
         emit SetDelayBetweenSwaps(_value);
     }
 
@@ -189,26 +390,50 @@ contract LBPool is
 
     function checkPrice(uint256 threshold) public view {
         if (threshold > 0) {
-            uint256 activeBinPrice = getPriceFromActiveBin();
-            uint256 oraclePrice = getOraclePrice();
-            uint256 delta = activeBinPrice > oraclePrice
-                ? activeBinPrice - oraclePrice
-                : oraclePrice - activeBinPrice;
-            require((delta * 10**18) / oraclePrice < threshold, "Price out of bounds");
+            (, , uint256 activeId) = getPairInfos();
+            _checkPrice(threshold, getOraclePrice(), activeId);
+        }
+    }
+
+    function _checkPrice(
+        uint256 threshold,
+        uint256 oraclePrice,
+        uint256 activeId
+    ) internal view {
+        if (threshold > 0) {
+            _checkActiveBinPrice(
+                threshold,
+                oraclePrice,
+                viewHelper.getPriceFromBin(activeId, binStep)
+            );
         }
     }
 
+    function _checkActiveBinPrice(
+        uint256 threshold,
+        uint256 oraclePrice,
+        uint256 activeBinPrice
+    ) internal pure {
+        uint256 delta = activeBinPrice > oraclePrice
+            ? activeBinPrice - oraclePrice
+            : oraclePrice - activeBinPrice;
+        require((delta * 10**18) / oraclePrice < threshold, "Price out of bounds");
+    }
+
     function checkSwapStatus(uint256 amountIn, address _for) public view {
         uint256 oraclePrice = getOraclePrice();
         (uint256 reserveX, uint256 reserveY) = getTotalFunds();
         uint256 tvlFor = tokenX == _for ? (reserveX * oraclePrice) / 10**18 : reserveY;
         uint256 tvlOther = tokenX == _for ? reserveY : (reserveX * oraclePrice) / 10**18;
         require(
-            tvlFor <= ((swapMinimumThreshold * tvlOther) / 10**18),
+            tvlFor <= ((config.swapMinimumThreshold * tvlOther) / 10**18),
             "Only if under swapMinimumThreshold"
         );
         uint256 reserveOther = tokenX == _for ? reserveY : reserveX;
-        require(amountIn <= ((swapMaxValue * reserveOther) / 10**18), "Only a swapMaxValue swap");
+        require(
+            amountIn <= ((config.swapMaxValue * reserveOther) / 10**18),
+            "Only a swapMaxValue swap"
+        );
     }
 
     function getPairInfos()
@@ -223,24 +448,77 @@ contract LBPool is
         (reservesX, reservesY, activeId) = pair.getReservesAndId();
     }
 
+    /**
+     * @notice Returns the deposited bins, sorted by ascending id
+     * @return _depositedIds list of deposited bins
+     */
     function getDepositedBins() public view returns (uint256[] memory _depositedIds) {
-        _depositedIds = depositedIds.values();
+        uint256 length = depositedBinsCount;
+        _depositedIds = new uint256[](length);
+        if (length > 0) {
+            uint256 bin = depositedBinsTree.findLowestBin();
+            _depositedIds[0] = bin;
+            for (uint256 i = 1; i < length; i++) {
+                bin = depositedBinsTree.findFirstBin(bin, false);
+                _depositedIds[i] = bin;
+            }
+        }
     }
 
-    function getHighestAndLowestBin() public view returns (uint256 highestBin, uint256 lowestBin) {
-        uint256 length = depositedIds.length();
-        if (length > 0) {
-            lowestBin = depositedIds.at(0);
-            highestBin = depositedIds.at(0);
-            for (uint256 i; i < length; i++) {
-                uint256 bin = depositedIds.at(i);
-                if (bin < lowestBin) {
-                    lowestBin = bin;
-                } else if (bin > highestBin) {
-                    highestBin = bin;
-                }
+    /**
+     * @notice Returns a page of the deposited bins, sorted by ascending id
+     * @param cursor first bin of the page, 0 to start from the lowest deposited bin
+     * @param maxBins maximum number of bins in the page
+     * @return bins deposited bins of the page
+     * @return nextCursor first bin of the next page, 0 if this page is the last one
+     */
+    function getDepositedBinsPage(uint256 cursor, uint256 maxBins)
+        public
+        view
+        returns (uint256[] memory bins, uint256 nextCursor)
+    {
+        bins = new uint256[](maxBins < depositedBinsCount ? maxBins : depositedBinsCount);
+        uint256 length;
+        uint256 bin = type(uint256).max;
+        if (depositedBinsCount > 0) {
+            if (cursor == 0) {
+                bin = depositedBinsTree.findLowestBin();
+            } else if (depositedBinsTree.contains(cursor)) {
+                bin = cursor;
+            } else {
+                bin = depositedBinsTree.findFirstBin(cursor, false);
             }
         }
+        while (length < bins.length && bin != type(uint256).max) {
+            bins[length] = bin;
+            length += 1;
+            bin = depositedBinsTree.findFirstBin(bin, false);
+        }
+        nextCursor = bin == type(uint256).max ? 0 : bin;
+        assembly {
+            mstore(bins, length)
+        }
+    }
+
+    function getHighestAndLowestBin() public view returns (uint256 highestBin, uint256 lowestBin) {
+        if (depositedBinsCount > 0) {
+            highestBin = depositedBinsTree.findHighestBin();
+            lowestBin = depositedBinsTree.findLowestBin();
+        }
+    }
+
+    /**
+     * @notice Returns the closest deposited bin strictly below or above a given bin
+     * @param bin bin to start searching from, excluded
+     * @param lower whether to search for lower (true) or higher (false) bins
+     * @return nextBin closest deposited bin, type(uint256).max if there is none
+     */
+    function getNextDepositedBin(uint256 bin, bool lower) public view returns (uint256 nextBin) {
+        nextBin = depositedBinsTree.findFirstBin(bin, lower);
+    }
+
+    function isDepositedBin(uint256 bin) public view returns (bool) {
+        return depositedBinsTree.contains(bin);
     }
 
     function getTotalReserveForBin(uint256 bin)
@@ -260,12 +538,84 @@ contract LBPool is
     }
 
     function getAllReserves() public view returns (uint256 totalReserveX, uint256 totalReserveY) {
-        uint256 length = depositedIds.length();
+        (, , , totalReserveX, totalReserveY) = _getReservesForBins(getDepositedBins());
+    }
+
+    /**
+     * @notice Returns the reserves owned in each bin, using the mirrored receipt balances
+     * @param bins list of bins
+     * @return reservesX amount of tokenX owned in each bin
+     * @return reservesY amount of tokenY owned in each bin
+     * @return receiptBalances amount of receipt tokens owned in each bin
+     * @return totalReserveX total amount of tokenX owned in the bins
+     * @return totalReserveY total amount of tokenY owned in the bins
+     */
+    function _getReservesForBins(uint256[] memory bins)
+        internal
+        view
+        returns (
+            uint256[] memory reservesX,
+            uint256[] memory reservesY,
+            uint256[] memory receiptBalances,
+            uint256 totalReserveX,
+            uint256 totalReserveY
+        )
+    {
+        uint256 length = bins.length;
+        receiptBalances = new uint256[](length);
         for (uint256 i; i < length; i++) {
-            (uint256 binReserveX, uint256 binReserveY) = getReserveForBin(depositedIds.at(i));
-            totalReserveX += binReserveX;
-            totalReserveY += binReserveY;
+            receiptBalances[i] = binReceiptBalance[bins[i]];
         }
+        (reservesX, reservesY, totalReserveX, totalReserveY) = viewHelper.getReservesForReceipts(
+            address(pair),
+            bins,
+            receiptBalances
+        );
+    }
+
+    /**
+     * @notice Sets the mirrored receipt balances from the pair
+     * @dev Removing liquidity reverts in a bin whose mirror is below its balance, so every deposited bin is required
+     * @param bins bins to synchronize, in ascending order
+     */
+    function syncReceiptBalances(uint256[] calldata bins) external onlyOwner {
+        _syncReceiptBalances(bins);
+    }
+
+    function _syncReceiptBalances(uint256[] memory bins) private {
+        uint256 length = bins.length;
+        uint256 depositedBinsSynced;
+        for (uint256 i; i < length; i++) {
+            uint256 bin = bins[i];
+            require(i == 0 || bin > bins[i - 1], "Not ascending order");
+            binReceiptBalance[bin] = receiptToken.balanceOf(address(receiptsManager), bin);
+            if (depositedBinsTree.contains(bin)) {
+                depositedBinsSynced += 1;
+            }
+        }
+        require(depositedBinsSynced == depositedBinsCount, "Deposited bins not synced");
+    }
+
+    /**
+     * @notice Returns the reserves of a page of the deposited bins, see getDepositedBinsPage
+     * @param cursor first bin of the page, 0 to start from the lowest deposited bin
+     * @param maxBins maximum number of bins in the page
+     * @return totalReserveX amount of tokenX in the bins of the page
+     * @return totalReserveY amount of tokenY in the bins of the page
+     * @return nextCursor first bin of the next page, 0 if this page is the last one
+     */
+    function getAllReservesPage(uint256 cursor, uint256 maxBins)
+        public
+        view
+        returns (
+            uint256 totalReserveX,
+            uint256 totalReserveY,
+            uint256 nextCursor
+        )
+    {
+        uint256[] memory bins;
+        (bins, nextCursor) = getDepositedBinsPage(cursor, maxBins);
+        (, , , totalReserveX, totalReserveY) = _getReservesForBins(bins);
     }
 
     function getBalances() public view returns (uint256 tokenXbalance, uint256 tokenYBalance) {
@@ -302,6 +652,54 @@ contract LBPool is
         return (amount * totalSupply) / totalDeposits;
     }
 
+    /**
+     * @notice Reads the state needed to value the vault: oracle price, active bin, balances, per-bin reserves and supply
+     * @return valuation snapshot of the vault, only valid until the next state change
+     */
+    function _getValuation() internal view returns (Valuation memory valuation) {
+        valuation.oraclePrice = getOraclePrice();
+        (, , valuation.activeId) = getPairInfos();
+        (valuation.balanceX, valuation.balanceY) = getBalances();
+        _readDepositedBins(valuation);
+        valuation.totalX += valuation.balanceX;
+        valuation.totalY += valuation.balanceY;
+        valuation.totalSupply = totalSupply();
+    }
+
+    /**
+     * @notice Fills the deposited bins of the valuation with the reserves owned in each of them
+     * @param valuation snapshot of the vault, totalX and totalY are set to the reserves in the bins
+     */
+    function _readDepositedBins(Valuation memory valuation) internal view {
+        valuation.bins = getDepositedBins();
+        (
+            valuation.reservesX,
+            valuation.reservesY,
+            valuation.receiptBalances,
+            valuation.totalX,
+            valuation.totalY
+        ) = _getReservesForBins(valuation.bins);
+    }
+
+    /**
+     * @notice Calculate shares amount for a given amount of depositToken, from a valuation snapshot
+     * @param amount deposit token amount
+     * @param valuation snapshot of the vault, see _getValuation
+     * @return number of shares
+     */
+    function _getSharesForDepositTokens(uint256 amount, Valuation memory valuation)
+        internal
+        view
+        returns (uint256)
+    {
+        uint256 totalDeposits = (valuation.totalY +
+            ((valuation.totalX * valuation.oraclePrice) / 10**18));
+        if (valuation.totalSupply == 0 || totalDeposits == 0) {
+            return amount * 10**(18 - IERC20Metadata(tokenX).decimals() + 12);
+        }
+        return (amount * valuation.totalSupply) / totalDeposits;
+    }
+
     /**
      * @notice Returns reserves outside of the active bin
      * @dev Useful in order to compute withdraw amount
@@ -313,14 +711,38 @@ contract LBPool is
         view
         returns (uint256 totalReserveX, uint256 totalReserveY)
     {
-        uint256 length = depositedIds.length();
-        (uint256 reservesX, uint256 reservesY, uint256 activeId) = getPairInfos();
+        (, , uint256 activeId) = getPairInfos();
+        (totalReserveX, totalReserveY, , ) = _getReservesAroundActive(activeId);
+    }
+
+    /**
+     * @notice Returns the reserves outside and inside of the active bin, reading all the bins in one batch
+     * @param activeId id of the active bin
+     * @return outsideReserveX amount of tokenX available outside of the active bin
+     * @return outsideReserveY amount of tokenY available outside of the active bin
+     * @return activeReserveX amount of tokenX available in the active bin
+     * @return activeReserveY amount of tokenY available in the active bin
+     */
+    function _getReservesAroundActive(uint256 activeId)
+        internal
+        view
+        returns (
+            uint256 outsideReserveX,
+            uint256 outsideReserveY,
+            uint256 activeReserveX,
+            uint256 activeReserveY
+        )
+    {
+        uint256[] memory bins = getDepositedBins();
+        (uint256[] memory reservesX, uint256[] memory reservesY, , , ) = _getReservesForBins(bins);
+        uint256 length = bins.length;
         for (uint256 i; i < length; i++) {
-            uint256 currentBin = depositedIds.at(i);
-            if (currentBin != activeId) {
-                (uint256 binReserveX, uint256 binReserveY) = getReserveForBin(currentBin);
-                totalReserveX += binReserveX;
-                totalReserveY += binReserveY;
+            if (bins[i] == activeId) {
+                activeReserveX = reservesX[i];
+                activeReserveY = reservesY[i];
+            } else {
+                outsideReserveX += reservesX[i];
+                outsideReserveY += reservesY[i];
             }
         }
     }
@@ -354,12 +776,53 @@ contract LBPool is
      * @param callerFeeRecipient user to send callerFee to
      */
     function harvest(address callerFeeRecipient) public {
-        uint256 length = depositedIds.length();
-        uint256[] memory depositedBins = new uint256[](length);
-        for (uint256 i; i < length; i++) {
-            depositedBins[i] = depositedIds.at(i);
+        _harvestBins(getDepositedBins());
+    }
+
+    /**
+     * @notice Harvest fees of a page of the deposited bins, see getDepositedBinsPage
+     * @param cursor first bin of the page, 0 to start from the lowest deposited bin
+     * @param maxBins maximum number of bins in the page
+     * @return nextCursor first bin of the next page, 0 if this page is the last one
+     */
+    function harvestPage(uint256 cursor, uint256 maxBins) public returns (uint256 nextCursor) {
+        uint256[] memory bins;
+        (bins, nextCursor) = getDepositedBinsPage(cursor, maxBins);
+        if (nextCursor == 0) {
+            config.lastHarvest = block.timestamp.toUint32();
         }
-        receiptsManager.harvest(depositedBins, msg.sender);
+        receiptsManager.harvest(bins, msg.sender);
+    }
+
+    /**
+     * @notice Harvests unless the harvest policy says it is not worth it yet, see setHarvestPolicy
+     * @return pendingX fees of tokenX left pending for the vault, net of the harvest fees. 0 once harvested
+     * @return pendingY fees of tokenY left pending for the vault, net of the harvest fees. 0 once harvested
+     */
+    function _harvestIfDue() internal returns (uint256 pendingX, uint256 pendingY) {
+        Config storage _config = config;
+        uint256[] memory bins = getDepositedBins();
+        bool due = block.timestamp >= uint256(_config.lastHarvest) + _config.harvestInterval;
+        uint256 minValue = _config.minHarvestValue;
+        if (due && minValue == 0) {
+            _harvestBins(bins);
+            return (0, 0);
+        }
+        (pendingX, pendingY) = pair.pendingFees(address(receiptsManager), bins);
+        if (due && (pendingX * getOraclePrice()) / 10**18 + pendingY >= minValue) {
+            _harvestBins(bins);
+            return (0, 0);
+        }
+        if (pendingX > 0 || pendingY > 0) {
+            uint256 harvestFee = receiptsManager.getHarvestFee();
+            pendingX -= (pendingX * harvestFee) / PRECISION;
+            pendingY -= (pendingY * harvestFee) / PRECISION;
+        }
+    }
+
+    function _harvestBins(uint256[] memory bins) private {
+        config.lastHarvest = block.timestamp.toUint32();
+        receiptsManager.harvest(bins, msg.sender);
     }
 
     /**
@@ -381,12 +844,15 @@ contract LBPool is
         uint256 amountY,
         address _for
     ) internal {
-        checkPrice(depositThreshold);
-        harvest(msg.sender);
-        uint256 oraclePrice = oracle.getPriceOfXInYUnits(tokenX, tokenY);
+        (uint256 pendingX, uint256 pendingY) = _harvestIfDue();
+        Valuation memory valuation = _getValuation();
+        // The fees left in the pair belong to the current holders
+        valuation.totalX += pendingX;
+        valuation.totalY += pendingY;
+        _checkPrice(config.depositThreshold, valuation.oraclePrice, valuation.activeId);
         uint256 depositValueY = amountY;
-        uint256 depositValueX = (amountX * oraclePrice) / 10**18;
-        uint256 shares = getSharesForDepositTokens(depositValueX + depositValueY, oraclePrice);
+        uint256 depositValueX = (amountX * valuation.oraclePrice) / 10**18;
+        uint256 shares = _getSharesForDepositTokens(depositValueX + depositValueY, valuation);
         IERC20(tokenX).safeTransferFrom(msg.sender, address(this), amountX);
         IERC20(tokenY).safeTransferFrom(msg.sender, address(this), amountY);
         emit Deposit(_for, amountX, amountY);
@@ -396,23 +862,54 @@ contract LBPool is
     }
 
     /**
-     * @notice Internal function to add liquidity, checks approval and handles the depositedIds
+     * @notice Internal function to add liquidity, checks approval and handles the deposited bins
      * @param parameters parameters of the liquidity to be added see ILBRouter.LiquidityParameters
+     * @param activeBinPrice price of the active bin, only read when addLiquidityThreshold is set
      */
-    function _addLiquidity(ILBRouter.LiquidityParameters memory parameters) internal {
-        checkPrice(addLiquidityThreshold);
-        //will revert if more than 50 bins
+    function _addLiquidity(ILBRouter.LiquidityParameters memory parameters, uint256 activeBinPrice)
+        internal
+    {
+        uint256 threshold = config.addLiquidityThreshold;
+        if (threshold > 0) {
+            _checkActiveBinPrice(threshold, getOraclePrice(), activeBinPrice);
+        }
+        //will revert if more than maxDepositedBins bins
 
         IERC20(tokenX).safeTransfer(address(receiptsManager), parameters.amountX);
         IERC20(tokenY).safeTransfer(address(receiptsManager), parameters.amountY);
 
-        uint256[] memory depositIds = receiptsManager.addLiquidity(parameters);
+        (uint256[] memory depositIds, uint256[] memory liquidityMinted) = receiptsManager
+            .addLiquidity(parameters);
 
         uint256 length = depositIds.length;
         for (uint256 i; i < length; i++) {
-            depositedIds.add(depositIds[i]);
+            if (liquidityMinted[i] > 0) {
+                binReceiptBalance[depositIds[i]] += liquidityMinted[i];
+                _addDepositedBin(depositIds[i]);
+            }
+        }
+        require(depositedBinsCount <= maxDepositedBins(), "Too much bins deposited");
+    }
+
+    function _addDepositedBin(uint256 bin) internal {
+        if (depositedBinsTree.addToTree(bin)) {
+            depositedBinsCount += 1;
+        }
+    }
+
+    function _removeDepositedBin(uint256 bin) internal {
+        if (depositedBinsTree.removeFromTree(bin)) {
+            depositedBinsCount -= 1;
+        }
+    }
+
+    /// @dev Moves the bins tracked by the legacy set into the bin tree
+    function _migrateDepositedIds() private {
+        for (uint256 i = depositedIds.length(); i > 0; i--) {
+            uint256 bin = depositedIds.at(i - 1);
+            depositedIds.remove(bin);
+            _addDepositedBin(bin);
         }
-        require(depositedIds.length() < 50, "Too much bins deposited");
     }
 
     /**
@@ -454,12 +951,20 @@ contract LBPool is
         bool respectRatio
     ) public onlyStrategy {
         (, , uint256 activeId) = getPairInfos();
+        // Priced once for both the ratio and the price check
+        uint256 activeBinPrice;
+        if (respectRatio || config.addLiquidityThreshold > 0) {
+            activeBinPrice = viewHelper.getPriceFromBin(activeId, binStep);
+        }
         if (respectRatio) {
-            (uint256 reserveX, uint256 reserveY) = getTotalReserveForBin(activeId);
-            uint256 ratio = (reserveX * getPriceFromActiveBin()) / (reserveY + EPSILON);
+            uint256 ratio;
+            {
+                (uint256 reserveX, uint256 reserveY) = getTotalReserveForBin(activeId);
+                ratio = (reserveX * activeBinPrice) / (reserveY + EPSILON);
+            }
             (_deltaIds, _distributionX, _distributionY) = viewHelper
                 .computeDistributionToRespectRatio(
-                    (amountX * getPriceFromActiveBin()) / 1e18,
+                    (amountX * activeBinPrice) / 1e18,
                     amountY,
                     ratio,
                     _deltaIds,
@@ -485,7 +990,7 @@ contract LBPool is
         });
         emit LiquidityAdded(_deltaIds, _distributionX, _distributionY, amountX, amountY);
 
-        _addLiquidity(parameters);
+        _addLiquidity(parameters, activeBinPrice);
     }
 
     /**
@@ -501,10 +1006,11 @@ contract LBPool is
         uint256 amountIn,
         uint256 amountOutMin
     ) public onlyStrategy returns (uint256 amountOut) {
-        require(lastSwap + delayBetweenSwaps < block.timestamp);
-        lastSwap = block.timestamp;
+        Config storage _config = config;
+        require(uint256(_config.lastSwap) + _config.delayBetweenSwaps < block.timestamp);
+        _config.lastSwap = block.timestamp.toUint32();
         checkSwapStatus(amountIn, _for);
-        checkPrice(swapThreshold);
+        checkPrice(_config.swapThreshold);
         (, , uint256 previousId) = getPairInfos();
         require(_for == tokenX || _for == tokenY, "Swap : Bad token");
         address otherToken = _for == tokenX ? tokenY : tokenX;
@@ -523,7 +1029,7 @@ contract LBPool is
         ); // use the router instead of pair to delegate the handling of minAmount
         (, , uint256 newId) = getPairInfos();
         uint256 delta = (newId > previousId) ? (newId - previousId) : (previousId - newId);
-        require(delta < deltaSwapSafeguard, "deltaSwapSafeguard");
+        require(delta < config.deltaSwapSafeguard, "deltaSwapSafeguard");
         emit SwapToken(otherToken, amountIn, _for, amountOut);
     }
 
@@ -539,37 +1045,45 @@ contract LBPool is
         uint256 amountY,
         bool _harvest
     ) external nonReentrant {
-        _withdraw(amountX, amountY, _harvest);
+        if (_harvest) {
+            harvest(msg.sender);
+        }
+        _withdraw(amountX, amountY, _getValuation());
     }
 
+    /**
+     * @notice Burns the shares needed for amountX and amountY and sends the tokens
+     * @param amountX amount of token X to withdraw
+     * @param amountY amount of token Y to withdraw
+     * @param valuation snapshot of the vault taken in the same transaction, see _getValuation
+     */
     function _withdraw(
         uint256 amountX,
         uint256 amountY,
-        bool _harvest
+        Valuation memory valuation
     ) internal {
         emit Withdrawal(msg.sender, amountX, amountY);
-        if (_harvest) {
-            harvest(msg.sender);
-        }
-        uint256 oraclePrice = oracle.getPriceOfXInYUnits(tokenX, tokenY);
-        uint256 neededShares = getSharesForDepositTokens(
-            (amountX * oraclePrice) / 10**18 + amountY + 1,
-            oraclePrice
+        uint256 neededShares = _getSharesForDepositTokens(
+            (amountX * valuation.oraclePrice) / 10**18 + amountY + 1,
+            valuation
         ) + 1;
 
         _burn(msg.sender, neededShares);
 
-        uint256 fee = block.timestamp < lastDepositedTime[msg.sender] + withdrawalFeeDelay
-            ? withdrawalFee
-            : 0;
+        uint256 fee;
+        {
+            Config storage _config = config;
+            if (block.timestamp < lastDepositedTime[msg.sender] + _config.withdrawalFeeDelay) {
+                fee = _config.withdrawalFee;
+            }
+        }
         {
             uint256 amountXAfterFee = amountX - (amountX * fee) / PRECISION;
             uint256 amountYAfterFee = amountY - (amountY * fee) / PRECISION;
-            (uint256 balanceX, uint256 balanceY) = getBalances();
-            amountX = _diffOrZero(amountXAfterFee, balanceX);
-            amountY = _diffOrZero(amountYAfterFee, balanceY);
+            amountX = _diffOrZero(amountXAfterFee, valuation.balanceX);
+            amountY = _diffOrZero(amountYAfterFee, valuation.balanceY);
             if (amountX > 0 || amountY > 0) {
-                _withdrawLiquidity(amountX, amountY);
+                _withdrawLiquidity(amountX, amountY, valuation);
             }
             if (amountX > 0) {
                 uint256 balance = IERC20(tokenX).balanceOf(address(this));
@@ -599,38 +1113,55 @@ contract LBPool is
         if (_harvest) {
             harvest(msg.sender);
         }
-        uint256 oraclePrice = oracle.getPriceOfXInYUnits(tokenX, tokenY);
+        Valuation memory valuation = _getValuation();
 
-        (uint256 availableAmountX, uint256 availableAmountY) = getTotalFunds();
-
-        uint256 effectiveShares = shares - (getSharesForDepositTokens(1, oraclePrice) + 1);
-        uint256 amountX = (availableAmountX * effectiveShares) / totalSupply();
-        uint256 amountY = (availableAmountY * effectiveShares) / totalSupply();
+        uint256 effectiveShares = shares - (_getSharesForDepositTokens(1, valuation) + 1);
+        uint256 amountX = (valuation.totalX * effectiveShares) / valuation.totalSupply;
+        uint256 amountY = (valuation.totalY * effectiveShares) / valuation.totalSupply;
         require(
-            getSharesForDepositTokens((amountX * oraclePrice) / 10**18 + amountY + 1, oraclePrice) +
+            _getSharesForDepositTokens(
+                (amountX * valuation.oraclePrice) / 10**18 + amountY + 1,
+                valuation
+            ) +
                 1 <=
                 shares
         );
 
-        _withdraw(amountX, amountY, false);
+        _withdraw(amountX, amountY, valuation);
     }
 
     /**
      * @notice Withdraw all liquidity of the vault, only strategist
      */
     function withdrawAllLiquidity() public onlyStrategy {
-        uint256 length = depositedIds.length();
+        _withdrawAllFromBins(getDepositedBins());
+    }
+
+    /**
+     * @notice Withdraw all liquidity of a page of the deposited bins, only strategist
+     * @dev Withdrawn bins leave the deposited bins, the returned cursor stays valid for the next page
+     * @param cursor first bin of the page, 0 to start from the lowest deposited bin
+     * @param maxBins maximum number of bins in the page
+     * @return nextCursor first bin of the next page, 0 if this page is the last one
+     */
+    function withdrawAllLiquidityPage(uint256 cursor, uint256 maxBins)
+        public
+        onlyStrategy
+        returns (uint256 nextCursor)
+    {
+        uint256[] memory bins;
+        (bins, nextCursor) = getDepositedBinsPage(cursor, maxBins);
+        _withdrawAllFromBins(bins);
+    }
+
+    function _withdrawAllFromBins(uint256[] memory _ids) internal {
+        uint256 length = _ids.length;
         if (length > 0) {
             uint256[] memory receiptBalances = new uint256[](length);
-            uint256[] memory _ids = new uint256[](length);
             for (uint256 i; i < length; i++) {
-                uint256 binNumber = depositedIds.at(i);
-                uint256 binBalance = receiptToken.balanceOf(address(receiptsManager), binNumber);
-                receiptBalances[i] = binBalance;
-                _ids[i] = binNumber;
+                receiptBalances[i] = binReceiptBalance[_ids[i]];
             }
             _removeLiquidity(_ids, receiptBalances);
-            emit LiquidityRemoved(_ids, receiptBalances);
         }
     }
 
@@ -648,6 +1179,62 @@ contract LBPool is
         addAllLiquidity(ids, distributionX, distributionY, respectRatio);
     }
 
+    /**
+     * @notice Executes rebalance based on the current params, only moving the liquidity that differs from them
+     * @dev Bins above their target are partially burnt, bins outside of the params are emptied and the missing
+     * liquidity is added, see ViewHelper.computeIncrementalRebalance
+     * @param respectRatio see trader joe fee based on deposit.
+     */
+    function executeIncrementalRebalance(
+        int256[] memory ids,
+        uint256[] memory distributionX,
+        uint256[] memory distributionY,
+        bool respectRatio
+    ) external onlyStrategy {
+        Valuation memory valuation;
+        (, , valuation.activeId) = getPairInfos();
+        (valuation.balanceX, valuation.balanceY) = getBalances();
+        _readDepositedBins(valuation);
+        IViewHelper.RebalancePlan memory plan = viewHelper.computeIncrementalRebalance(
+            IViewHelper.BinsSnapshot(
+                valuation.activeId,
+                valuation.bins,
+                valuation.reservesX,
+                valuation.reservesY,
+                valuation.receiptBalances
+            ),
+            valuation.balanceX,
+            valuation.balanceY,
+            ids,
+            distributionX,
+            distributionY
+        );
+        if (plan.removedIds.length > 0) {
+            _removeLiquidity(plan.removedIds, plan.removedAmounts);
+        }
+        if (plan.addedDeltaIds.length > 0) {
+            (uint256 balanceX, uint256 balanceY) = getBalances();
+            addLiquidity(
+                plan.amountX < balanceX ? plan.amountX : balanceX,
+                plan.amountY < balanceY ? plan.amountY : balanceY,
+                plan.addedDeltaIds,
+                plan.addedDistributionX,
+                plan.addedDistributionY,
+                // The ratio is kept through the share of the active bin, so only when the active bin is topped up
+                respectRatio && _containsActiveBin(plan.addedDeltaIds)
+            );
+        }
+    }
+
+    function _containsActiveBin(int256[] memory deltaIds) private pure returns (bool) {
+        for (uint256 i; i < deltaIds.length; i++) {
+            if (deltaIds[i] == 0) {
+                return true;
+            }
+        }
+        return false;
+    }
+
     /**
      * @notice Withdraw liquidity from specific bins
      * @param ids bins to withdraw from
@@ -660,13 +1247,20 @@ contract LBPool is
         _removeLiquidity(ids, amounts);
     }
 
+    /**
+     * @notice Burns receipt tokens and drops the bins left without any from the deposited bins
+     * @param ids bins to withdraw from
+     * @param amounts amount of receipt token to burn
+     */
     function _removeLiquidity(uint256[] memory ids, uint256[] memory amounts) internal {
         receiptsManager.removeLiquidity(ids, amounts);
         emit LiquidityRemoved(ids, amounts);
         uint256 length = ids.length;
         for (uint256 i; i < length; i++) {
-            if (receiptToken.balanceOf(address(receiptsManager), ids[i]) == 0) {
-                depositedIds.remove(ids[i]);
+            uint256 receiptBalance = binReceiptBalance[ids[i]] - amounts[i];
+            binReceiptBalance[ids[i]] = receiptBalance;
+            if (receiptBalance == 0) {
+                _removeDepositedBin(ids[i]);
             }
         }
     }
@@ -677,95 +1271,34 @@ contract LBPool is
      * @param amountY amount of token Y to withdraw
      */
     function withdrawLiquidity(uint256 amountX, uint256 amountY) public onlyStrategy {
-        _withdrawLiquidity(amountX, amountY);
+        Valuation memory valuation;
+        (, , valuation.activeId) = getPairInfos();
+        _readDepositedBins(valuation);
+        _withdrawLiquidity(amountX, amountY, valuation);
     }
 
     /**
      * @notice Withdraw amount X and amount Y of each token
+     * @dev The burn plan is computed in one pass over the bins of the valuation, which must still be current
      * @param amountX amount of token X to withdraw
      * @param amountY amount of token Y to withdraw
+     * @param valuation snapshot of the vault with the deposited bins, see _readDepositedBins
      */
-    function _withdrawLiquidity(uint256 amountX, uint256 amountY) internal {
-        (, , uint256 activeId) = getPairInfos();
-        (uint256 reservesX, uint256 reservesY) = getReserveForBin(activeId);
-        uint256 sharesFromActive;
-        {
-            (
-                uint256 reservesXOutsideActive,
-                uint256 reservesYOutsideActive
-            ) = reservesOutsideActive();
-            uint256 neededX = _diffOrZero(amountX, reservesXOutsideActive);
-            uint256 neededY = _diffOrZero(amountY, reservesYOutsideActive);
-            require(
-                (amountX <= reservesXOutsideActive + reservesX) &&
-                    (amountY <= reservesYOutsideActive + reservesY),
-                "Not enough reserves"
+    function _withdrawLiquidity(
+        uint256 amountX,
+        uint256 amountY,
+        Valuation memory valuation
+    ) internal {
+        (uint256[] memory ids, uint256[] memory amounts) = viewHelper.computeWithdrawalPlan(
+                amountX,
+                amountY,
+                valuation.activeId,
+                valuation.bins,
+                valuation.reservesX,
+                valuation.reservesY,
+                valuation.receiptBalances
             );
-
-            if (neededX > 0 || neededY > 0) {
-                if (neededY * reservesX > reservesY * neededX) {
-                    uint256 amountXObtained;
-                    (sharesFromActive, amountXObtained) = viewHelper
-                        ._computeWithdrawAmountsFromActiveBin(
-                            0,
-                            neededY,
-                            activeId,
-                            address(receiptsManager)
-                        );
-                    amountX = _diffOrZero(amountX, amountXObtained);
-                    amountY = _diffOrZero(amountY, neededY);
-                } else {
-                    uint256 amountYObtained;
-                    (sharesFromActive, amountYObtained) = viewHelper
-                        ._computeWithdrawAmountsFromActiveBin(
-                            neededX,
-                            0,
-                            activeId,
-                            address(receiptsManager)
-                        );
-                    amountY = _diffOrZero(amountY, amountYObtained);
-                    amountX = _diffOrZero(amountX, neededX);
-                }
-            }
-        }
-        uint256 lengthX;
-        uint256 lengthY;
-        uint256[] memory finalAmountsY;
-        uint256[] memory idsY;
-        uint256[] memory finalAmountsX;
-        uint256[] memory idsX;
-        if (amountY > 0) {
-            (finalAmountsY, idsY) = viewHelper.computeAmountsForWithdrawY(amountY);
-            lengthY = finalAmountsY.length;
-        }
-        if (amountX > 0) {
-            (finalAmountsX, idsX) = viewHelper.computeAmountsForWithdrawX(amountX);
-            lengthX = finalAmountsX.length;
-        }
-        uint256 totalLength = lengthX + lengthY;
-        totalLength = sharesFromActive > 0 ? totalLength + 1 : totalLength;
-        uint256[] memory finalAmounts = new uint256[](totalLength);
-        uint256[] memory ids = new uint256[](totalLength);
-
-        for (uint256 i; i < lengthY; i++) {
-            ids[i] = idsY[i];
-            finalAmounts[i] = finalAmountsY[i];
-        }
-        if (sharesFromActive > 0) {
-            ids[lengthY] = activeId;
-            finalAmounts[lengthY] = sharesFromActive;
-            for (uint256 i = lengthY + 1; i < totalLength; i++) {
-                ids[i] = idsX[i - lengthY - 1];
-                finalAmounts[i] = finalAmountsX[i - lengthY - 1];
-            }
-        } else {
-            for (uint256 i = lengthY; i < totalLength; i++) {
-                ids[i] = idsX[i - lengthY];
-                finalAmounts[i] = finalAmountsX[i - lengthY];
-            }
-        }
-        _removeLiquidity(ids, finalAmounts);
-        emit LiquidityRemoved(ids, finalAmounts);
+        _removeLiquidity(ids, amounts);
     }
 
     function _approveTokenIfNeeded(address token, address to) private {
@@ -0,0 +1,178 @@
+// SPDX-License-Identifier: MIT
+pragma solidity ^0.8.0;
+
+import "@openzeppelin/contracts/access/Ownable.sol";
+import "@openzeppelin/contracts/proxy/beacon/BeaconProxy.sol";
+import "@openzeppelin/contracts/proxy/beacon/UpgradeableBeacon.sol";
+
+import "interfaces/ILBPair.sol";
+import "interfaces/ILBPool.sol";
+import "interfaces/IReceiptsHolder.sol";
+import "interfaces/IStrategy.sol";
+
+/// @title LBPoolFactory
+/// @author Vector Team
+/// @notice Deploys a vault, its receipts holder and its strategy in one transaction, as beacon proxies
+/// sharing one implementation each, one ViewHelper and one OracleHelper
+contract LBPoolFactory is Ownable {
+    /// @notice Settings of a new pool, see the setters of LBPool
+    struct PoolParameters {
+        address pair;
+        address owner;
+        address manager;
+        uint256 depositThreshold;
+        uint256 addLiquidityThreshold;
+        uint256 swapThreshold;
+        uint256 swapMaxValue;
+        uint256 swapMinimumThreshold;
+        uint256 deltaSwapSafeguard;
+        uint256 delayBetweenSwaps;
+        uint256 withdrawalFeeDelay;
+        uint256 withdrawalFee;
+    }
+
+    UpgradeableBeacon public immutable vaultBeacon;
+    UpgradeableBeacon public immutable receiptsHolderBeacon;
+    UpgradeableBeacon public immutable strategyBeacon;
+
+    address public router;
+    address public viewHelper;
+    address public oracle;
+
+    address[] public vaults;
+
+    event PoolCreated(
+        address indexed pair,
+        address vault,
+        address receiptsHolder,
+        address strategy
+    );
+    event SetOracle(address);
+    event SetViewHelper(address);
+
+    /// @param _vaultImplementation LBPool implementation
+    /// @param _receiptsHolderImplementation ReceiptsHolder implementation
+    /// @param _strategyImplementation Strategy implementation
+    /// @dev The beacons are owned by the deployer, who upgrades every pool of the factory at once
+    constructor(
+        address _vaultImplementation,
+        address _receiptsHolderImplementation,
+        address _strategyImplementation,
+        address _router,
+        address _viewHelper,
+        address _oracle
+    ) {
+        vaultBeacon = _newBeacon(_vaultImplementation);
+        receiptsHolderBeacon = _newBeacon(_receiptsHolderImplementation);
+        strategyBeacon = _newBeacon(_strategyImplementation);
+        router = _router;
+        viewHelper = _viewHelper;
+        oracle = _oracle;
+    }
+
+    function _newBeacon(address implementation) private returns (UpgradeableBeacon beacon) {
+        beacon = new UpgradeableBeacon(implementation);
+        beacon.transferOwnership(msg.sender);
+    }
+
+    function setViewHelper(address _viewHelper) external onlyOwner {
+        viewHelper = _viewHelper;
+        emit SetViewHelper(_viewHelper);
+    }
+
+    function setOracle(address _oracle) external onlyOwner {
+        oracle = _oracle;
+        emit SetOracle(_oracle);
+    }
+
+    function vaultsLength() external view returns (uint256) {
+        return vaults.length;
+    }
+
+    /**
+     * @notice Deploys and wires a vault, its receipts holder and its strategy, then hands them to the owner
+     * @param parameters settings of the pool, see PoolParameters
+     * @return vault the LBPool
+     * @return receiptsHolder the ReceiptsHolder of the vault
+     * @return strategy the Strategy of the vault
+     */
+    function createPool(PoolParameters calldata parameters)
+        external
+        onlyOwner
+        returns (
+            address vault,
+            address receiptsHolder,
+            address strategy
+        )
+    {
+        ILBPair pair = ILBPair(parameters.pair);
+        address tokenX = pair.tokenX();
+        address tokenY = pair.tokenY();
+        uint256 binStep = pair.feeParameters().binStep;
+
+        vault = address(
+            new BeaconProxy(
+                address(vaultBeacon),
+                abi.encodeWithSelector(
+                    ILBPool.__LBPool_init.selector,
+                    tokenX,
+                    tokenY,
+                    binStep,
+                    router,
+                    address(pair),
+                    viewHelper
+                )
+            )
+        );
+        receiptsHolder = address(
+            new BeaconProxy(
+                address(receiptsHolderBeacon),
+                abi.encodeWithSelector(
+                    IReceiptsHolder.__ReceiptsHolder_init.selector,
+                    vault,
+                    tokenX,
+                    tokenY,
+                    binStep,
+                    router,
+                    address(pair),
+                    viewHelper
+                )
+            )
+        );
+        strategy = address(
+            new BeaconProxy(
+                address(strategyBeacon),
+                abi.encodeWithSelector(IStrategy.__Strategy_init_.selector, vault)
+            )
+        );
+
+        _setupVault(ILBPool(vault), receiptsHolder, strategy, parameters);
+        IReceiptsHolder(receiptsHolder).setStrategy(strategy);
+        IReceiptsHolder(receiptsHolder).transferOwnership(parameters.owner);
+        IStrategy(strategy).setManager(parameters.manager);
+        IStrategy(strategy).transferOwnership(parameters.owner);
+
+        vaults.push(vault);
+        emit PoolCreated(address(pair), vault, receiptsHolder, strategy);
+    }
+
+    function _setupVault(
+        ILBPool vault,
+        address receiptsHolder,
+        address strategy,
+        PoolParameters calldata parameters
+    ) private {
+        vault.setReceiptsManager(receiptsHolder);
+        vault.setStrategy(strategy);
+        vault.setOracle(oracle);
+        vault.setDepositThreshold(parameters.depositThreshold);
+        vault.setAddLiquidityThreshold(parameters.addLiquidityThreshold);
+        vault.setSwapThreshold(parameters.swapThreshold);
+        vault.setSwapMaxValue(parameters.swapMaxValue);
+        vault.setSwapMinimumThreshold(parameters.swapMinimumThreshold);
+        vault.setDeltaSwapSafeguard(parameters.deltaSwapSafeguard);
+        vault.setDelayBetweenSwaps(parameters.delayBetweenSwaps);
+        vault.setWithdrawalFee(parameters.withdrawalFeeDelay, parameters.withdrawalFee);
+        vault.transferOwnership(parameters.owner);
+    }
+}
@@ -2,20 +2,72 @@
 pragma solidity ^0.8.0;
 
 import "interfaces/AggregatorV3Interface.sol";
+import "interfaces/ILBPair.sol";
+import "./BinHelper.sol";
 import "@openzeppelin/contracts/token/ERC20/extensions/IERC20Metadata.sol";
 import "@openzeppelin/contracts/access/Ownable.sol";
 
 contract OracleHelper is Ownable {
+    /// @notice Liquidity Book pair pricing a couple of tokens instead of their feeds
+    /// @param pair the pair, address(0) when the couple is priced by the feeds
+    /// @param twapPeriod length of the TWAP in seconds
+    /// @param binStep bin step of the pair
+    /// @param inverted whether the couple is (tokenY, tokenX) of the pair
+    struct PairSource {
+        ILBPair pair;
+        uint32 twapPeriod;
+        uint16 binStep;
+        bool inverted;
+    }
+
     uint8 public constant OUTPUT_DECIMALS = 18;
     mapping(address => AggregatorV3Interface) public tokenToFeed;
     mapping(address => bool) public isStable;
+    /// @notice 10**decimals of the token, cached when its feed or stable status is set
+    mapping(address => uint256) public tokenUnit;
+    /// @notice Factor scaling the answer of the feed of the token to OUTPUT_DECIMALS
+    mapping(address => uint256) public feedScale;
+    mapping(address => mapping(address => PairSource)) public pairSources;
 
     function setFeedForToken(address token, address feed) external onlyOwner {
         tokenToFeed[token] = AggregatorV3Interface(feed);
+        if (feed != address(0)) {
+            feedScale[token] = 10**(OUTPUT_DECIMALS - AggregatorV3Interface(feed).decimals());
+        }
+        _cacheTokenUnit(token);
     }
 
     function setIsStable(address token, bool state) external onlyOwner {
         isStable[token] = state;
+        _cacheTokenUnit(token);
+    }
+
+    /// @notice Prices tokenX in tokenY units, and the other way around, from a Liquidity Book pair
+    /// @dev The pair must keep enough oracle samples to cover twapPeriod, see ILBPair.increaseOracleLength.
+    /// The active bin is not allowed, the price checks of a vault on the same pair would always pass
+    /// @param pair the pair of tokenX and tokenY, address(0) to go back to the feeds
+    /// @param twapPeriod length of the TWAP in seconds
+    function setPairSource(
+        address tokenX,
+        address tokenY,
+        address pair,
+        uint32 twapPeriod
+    ) external onlyOwner {
+        uint16 binStep;
+        if (pair != address(0)) {
+            require(twapPeriod > 0, "Spot price");
+            require(
+                ILBPair(pair).tokenX() == tokenX && ILBPair(pair).tokenY() == tokenY,
+                "Wrong pair"
+            );
+            binStep = ILBPair(pair).feeParameters().binStep;
+        }
+        pairSources[tokenX][tokenY] = PairSource(ILBPair(pair), twapPeriod, binStep, false);
+        pairSources[tokenY][tokenX] = PairSource(ILBPair(pair), twapPeriod, binStep, true);
+    }
+
+    function _cacheTokenUnit(address token) private {
+        tokenUnit[token] = 10**IERC20Metadata(token).decimals();
     }
 
     function getPrice(address token) public view returns (uint256) {
@@ -25,17 +77,56 @@ contract OracleHelper is Ownable {
         }
         require(address(feed) != address(0), "invalid token");
         (, int256 price, , , ) = feed.latestRoundData();
-        return uint256(price) * 10**(OUTPUT_DECIMALS - feed.decimals());
+        return uint256(price) * feedScale[token];
     }
 
-    function getPriceOfXInYUnits(address tokenX, address tokenY) external view returns (uint256) {
+    function getPriceOfXInYUnits(address tokenX, address tokenY) public view returns (uint256) {
+        PairSource memory source = pairSources[tokenX][tokenY];
+        if (address(source.pair) != address(0)) {
+            uint256 price = getPairPrice(source.pair, source.twapPeriod, source.binStep);
+            return source.inverted ? 10**(2 * OUTPUT_DECIMALS) / price : price;
+        }
+
         uint256 priceXInUsd = getPrice(tokenX);
         uint256 priceYInUsd = getPrice(tokenY);
 
-        require(priceXInUsd >= 0 && priceYInUsd >= 0);
-
         return
-            (priceXInUsd * 10**(OUTPUT_DECIMALS + IERC20Metadata(tokenY).decimals())) /
-            (priceYInUsd * 10**IERC20Metadata(tokenX).decimals());
+            (priceXInUsd * 10**OUTPUT_DECIMALS * tokenUnit[tokenY]) /
+            (priceYInUsd * tokenUnit[tokenX]);
+    }
+
+    /// @notice Returns the price of tokenX of the pair in tokenY units, with OUTPUT_DECIMALS decimals
+    /// @dev The TWAP uses the id averaged over twapPeriod, rounded down
+    /// @param pair the pair
+    /// @param twapPeriod length of the TWAP in seconds, 0 to use the active bin
+    /// @param binStep bin step of the pair
+    function getPairPrice(
+        ILBPair pair,
+        uint256 twapPeriod,
+        uint256 binStep
+    ) public view returns (uint256) {
+        uint256 id;
+        if (twapPeriod == 0) {
+            (, , id) = pair.getReservesAndId();
+        } else {
+            (uint256 cumulativeId, , ) = pair.getOracleSampleFrom(0);
+            (uint256 pastCumulativeId, , ) = pair.getOracleSampleFrom(twapPeriod);
+            id = (cumulativeId - pastCumulativeId) / twapPeriod;
+        }
+        return (BinHelper.getPriceFromId(id, binStep) * 10**OUTPUT_DECIMALS) >> 128;
+    }
+
+    /// @notice Prices several pairs in one call, see getPriceOfXInYUnits
+    function getPricesOfXInYUnits(address[] calldata tokensX, address[] calldata tokensY)
+        external
+        view
+        returns (uint256[] memory prices)
+    {
+        uint256 length = tokensX.length;
+        require(length == tokensY.length, "Length mismatch");
+        prices = new uint256[](length);
+        for (uint256 i; i < length; i++) {
+            prices[i] = getPriceOfXInYUnits(tokensX[i], tokensY[i]);
+        }
     }
 }
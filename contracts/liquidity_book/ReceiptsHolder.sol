@@ -45,8 +45,12 @@ contract ReceiptsHolder is
     ILBToken public receiptToken;
     IViewHelper public viewHelper;
 
+    mapping(address => mapping(IERC20 => uint256)) public claimableFees;
+    mapping(IERC20 => uint256) public totalClaimableFees;
+
     event Harvest(address indexed user, uint256 amountX, uint256 amountY);
     event FeeDistributed(address indexed user, uint256 amount, IERC20 token);
+    event FeeAccrued(address indexed user, uint256 amount, IERC20 token);
 
     function __ReceiptsHolder_init(
         address _vault,
@@ -122,13 +126,18 @@ contract ReceiptsHolder is
     function addLiquidity(ILBRouter.LiquidityParameters memory parameters)
         public
         onlyVault
-        returns (uint256[] memory depositIds)
+        returns (uint256[] memory depositIds, uint256[] memory liquidityMinted)
     {
-        uint256 balanceX = tokenX.balanceOf(address(this));
-        uint256 balanceY = tokenY.balanceOf(address(this));
-        (depositIds, ) = router.addLiquidity(parameters);
-        tokenX.safeTransfer(vault, _diffOrZero(tokenX.balanceOf(address(this)), balanceX));
-        tokenY.safeTransfer(vault, _diffOrZero(tokenY.balanceOf(address(this)), balanceY));
+        (depositIds, liquidityMinted) = router.addLiquidity(parameters);
+        // Everything not owed as fees goes back to the vault
+        tokenX.safeTransfer(
+            vault,
+            _diffOrZero(tokenX.balanceOf(address(this)), totalClaimableFees[tokenX])
+        );
+        tokenY.safeTransfer(
+            vault,
+            _diffOrZero(tokenY.balanceOf(address(this)), totalClaimableFees[tokenY])
+        );
     }
 
     function getReserveForBin(uint256 bin)
@@ -165,43 +174,88 @@ contract ReceiptsHolder is
         tokenY.safeTransfer(vault, tokenY.balanceOf(address(this)) - balanceY);
     }
 
-    function harvest(uint256[] memory depositedBins, address caller) external onlyVault {
-        pair.collectFees(address(this), depositedBins);
+    /// @notice Share of the collected fees kept by the caller, the manager and the protocol, over PRECISION
+    function getHarvestFee() external view returns (uint256) {
+        return CALLER_FEE + MANAGER_FEE + PROTOCOL_FEE;
+    }
 
-        uint256 XCollected = tokenX.balanceOf(address(this));
-        uint256 YCollected = tokenY.balanceOf(address(this));
+    function harvest(uint256[] memory depositedBins, address caller) external onlyVault {
+        if (depositedBins.length == 0) {
+            return;
+        }
+        (uint256 XCollected, uint256 YCollected) = pair.collectFees(address(this), depositedBins);
 
         emit Harvest(msg.sender, XCollected, YCollected);
+        if (XCollected == 0 && YCollected == 0) {
+            return;
+        }
+        address manager = IStrategy(strategy).manager();
         if (XCollected > 0) {
-            _handleFee(tokenX, XCollected, caller);
+            _handleFee(tokenX, XCollected, caller, manager);
         }
         if (YCollected > 0) {
-            _handleFee(tokenY, YCollected, caller);
+            _handleFee(tokenY, YCollected, caller, manager);
         }
     }
 
+    /**
+     * @notice Records the fees of the caller, the manager and the protocol and sends the rest to the vault
+     * @dev Fees stay in this contract until claimed, see claimFees
+     */
     function _handleFee(
         IERC20 token,
         uint256 collectedAmount,
-        address caller
+        address caller,
+        address manager
     ) internal {
-        uint256 callerFee = (collectedAmount * CALLER_FEE) / PRECISION;
-        uint256 managerFee = (collectedAmount * MANAGER_FEE) / PRECISION;
-        uint256 protocolFee = (collectedAmount * PROTOCOL_FEE) / PRECISION;
-        if (callerFee > 0) {
-            token.safeTransfer(caller, callerFee);
-            emit FeeDistributed(caller, callerFee, token);
+        uint256 callerFee = _accrueFee(caller, token, (collectedAmount * CALLER_FEE) / PRECISION);
+        uint256 managerFee = _accrueFee(
+            manager,
+            token,
+            (collectedAmount * MANAGER_FEE) / PRECISION
+        );
+        uint256 protocolFee = _accrueFee(
+            protocolFeeRecipient,
+            token,
+            (collectedAmount * PROTOCOL_FEE) / PRECISION
+        );
+        uint256 remainingAmount = collectedAmount - callerFee - managerFee - protocolFee;
+        totalClaimableFees[token] += callerFee + managerFee + protocolFee;
+        token.safeTransfer(vault, remainingAmount);
+        emit FeeDistributed(vault, remainingAmount, token);
+    }
+
+    function _accrueFee(
+        address recipient,
+        IERC20 token,
+        uint256 amount
+    ) internal returns (uint256) {
+        if (amount > 0) {
+            claimableFees[recipient][token] += amount;
+            emit FeeAccrued(recipient, amount, token);
         }
-        if (managerFee > 0) {
-            token.safeTransfer(IStrategy(strategy).manager(), managerFee);
-            emit FeeDistributed(IStrategy(strategy).manager(), managerFee, token);
+        return amount;
+    }
+
+    /**
+     * @notice Sends the accrued fees of both tokens to each recipient
+     * @param recipients addresses to send the fees to
+     */
+    function claimFees(address[] calldata recipients) external nonReentrant {
+        uint256 length = recipients.length;
+        for (uint256 i; i < length; i++) {
+            _claimFee(recipients[i], tokenX);
+            _claimFee(recipients[i], tokenY);
         }
-        if (protocolFee > 0) {
-            token.safeTransfer(protocolFeeRecipient, protocolFee);
-            emit FeeDistributed(protocolFeeRecipient, protocolFee, token);
+    }
+
+    function _claimFee(address recipient, IERC20 token) internal {
+        uint256 amount = claimableFees[recipient][token];
+        if (amount > 0) {
+            claimableFees[recipient][token] = 0;
+            totalClaimableFees[token] -= amount;
+            token.safeTransfer(recipient, amount);
+            emit FeeDistributed(recipient, amount, token);
         }
-        uint256 remainingBalance = token.balanceOf(address(this));
-        token.safeTransfer(vault, remainingBalance);
-        emit FeeDistributed(vault, remainingBalance, token);
     }
 }
@@ -0,0 +1,84 @@
+// SPDX-License-Identifier: MIT
+pragma solidity ^0.8.0;
+
+import "./BinHelper.sol";
+
+library ShapeHelper {
+    enum Shape {
+        Uniform,
+        Curve,
+        BidAsk
+    }
+
+    /// @notice Generates the liquidity parameters of a shape around `_centre`
+    /// @dev tokenX is spread over the bins at or above the active bin and tokenY over the bins at or below it,
+    /// each distribution sums to at most Constants.PRECISION. The radius is not bounded here, callers check the
+    /// 2 * radius + 1 bins against the cap of the vault
+    /// @param _shape Uniform gives the same weight to every bin, Curve decreases linearly from the centre
+    /// and BidAsk increases linearly from the centre
+    /// @param _centre The delta id of the centre of the shape, relative to the active bin
+    /// @param _radius The number of bins on each side of the centre
+    /// @return deltaIds The delta ids, in ascending order
+    /// @return distributionX The distribution of tokenX
+    /// @return distributionY The distribution of tokenY
+    function getShape(
+        Shape _shape,
+        int256 _centre,
+        uint256 _radius
+    )
+        internal
+        pure
+        returns (
+            int256[] memory deltaIds,
+            uint256[] memory distributionX,
+            uint256[] memory distributionY
+        )
+    {
+        uint256 length = 2 * _radius + 1;
+        deltaIds = new int256[](length);
+        distributionX = new uint256[](length);
+        distributionY = new uint256[](length);
+
+        uint256 totalWeightX;
+        uint256 totalWeightY;
+        for (uint256 i; i < length; i++) {
+            int256 deltaId = _centre - int256(_radius) + int256(i);
+            uint256 weight = _getWeight(_shape, i > _radius ? i - _radius : _radius - i, _radius);
+            deltaIds[i] = deltaId;
+            if (deltaId >= 0) {
+                distributionX[i] = weight;
+                totalWeightX += weight;
+            }
+            if (deltaId <= 0) {
+                distributionY[i] = weight;
+                totalWeightY += weight;
+            }
+        }
+        for (uint256 i; i < length; i++) {
+            if (totalWeightX > 0) {
+                distributionX[i] = (distributionX[i] * Constants.PRECISION) / totalWeightX;
+            }
+            if (totalWeightY > 0) {
+                distributionY[i] = (distributionY[i] * Constants.PRECISION) / totalWeightY;
+            }
+        }
+    }
+
+    /// @notice Returns the weight of a bin of the shape
+    /// @param _shape The shape
+    /// @param _distance The distance between the bin and the centre of the shape
+    /// @param _radius The radius of the shape
+    /// @return The weight of the bin, at least 1
+    function _getWeight(
+        Shape _shape,
+        uint256 _distance,
+        uint256 _radius
+    ) private pure returns (uint256) {
+        if (_shape == Shape.Curve) {
+            return _radius + 1 - _distance;
+        } else if (_shape == Shape.BidAsk) {
+            return _distance + 1;
+        }
+        return 1;
+    }
+}
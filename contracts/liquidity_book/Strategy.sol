@@ -16,6 +16,7 @@ import "./../../interfaces/ILBToken.sol";
 import "./../../interfaces/IReceiptsHolder.sol";
 
 import "./BinHelper.sol";
+import "./ShapeHelper.sol";
 
 /// @title Locker
 /// @author Vector Team
@@ -31,9 +32,10 @@ contract Strategy is Initializable, OwnableUpgradeable, PausableUpgradeable {
     address public vault;
     uint256 public maxSlippage;
 
-    int256[] public deltaIds;
-    uint256[] public distributionX;
-    uint256[] public distributionY;
+    /// @dev Replaced by the packed params, only kept to preserve the storage layout. See migrateLayout
+    int256[] private legacyDeltaIds;
+    uint256[] private legacyDistributionX;
+    uint256[] private legacyDistributionY;
 
     struct LiquidityParameters {
         IERC20 tokenX;
@@ -52,7 +54,22 @@ contract Strategy is Initializable, OwnableUpgradeable, PausableUpgradeable {
         uint256 deadline;
     }
 
+    /// @dev Delta ids as int16, 16 per word, starting from the lowest bits
+    uint256[] private packedDeltaIds;
+    /// @dev Distributions as uint64, 2 bins per word, each bin being distributionX << 64 | distributionY
+    uint256[] private packedDistributions;
+    uint256 public paramsLength;
+
+    /// @notice Allowed to run the routine operations of the manager, see StrategyController
+    address public keeper;
+
+    /// @dev Bumped with every storage change that needs a migration, see migrateLayout
+    uint256 private constant LAYOUT_VERSION = 1;
+    /// @dev Last layout the storage was migrated to, see migrateLayout
+    uint256 private layoutVersion;
+
     event SetManager(address manager);
+    event SetKeeper(address keeper);
     event SetParams(int256[] _deltaIds, uint256[] _distributionX, uint256[] _distributionY);
 
     function __Strategy_init_(address _vault) external initializer {
@@ -62,6 +79,7 @@ contract Strategy is Initializable, OwnableUpgradeable, PausableUpgradeable {
         tokenX = ILBPool(vault).tokenX();
         tokenY = ILBPool(vault).tokenY();
         binStep = ILBPool(vault).binStep();
+        layoutVersion = LAYOUT_VERSION;
     }
 
     function setManager(address newManager) external onlyOwner {
@@ -74,6 +92,16 @@ contract Strategy is Initializable, OwnableUpgradeable, PausableUpgradeable {
         _;
     }
 
+    function setKeeper(address newKeeper) external onlyOwner {
+        keeper = newKeeper;
+        emit SetKeeper(newKeeper);
+    }
+
+    modifier onlyManagerOrKeeper() {
+        require(msg.sender == manager || msg.sender == keeper, "Not Manager or Keeper");
+        _;
+    }
+
     event SetManagerFee(uint256 fee);
     event SetCallerFee(uint256 fee);
     event SetMaxSlippage(uint256 slippage);
@@ -110,15 +138,148 @@ contract Strategy is Initializable, OwnableUpgradeable, PausableUpgradeable {
         bool respectRatio
     ) external onlyManager {
         _validateParams(_deltaIds, _distributionX, _distributionY);
-        distributionX = _distributionX;
-        distributionY = _distributionY;
-        deltaIds = _deltaIds;
+        _storeParams(_deltaIds, _distributionX, _distributionY);
         if (_executeRebalance) {
             executeRebalance(respectRatio);
         }
         emit SetParams(_deltaIds, _distributionX, _distributionY);
     }
 
+    /**
+     * @notice Set params of the strategy from a shape generated on-chain, only strategist
+     * @param shape see ShapeHelper.getShape
+     * @param centre delta id of the centre of the shape
+     * @param radius number of bins on each side of the centre
+     * @param _executeRebalance boolean for the Manager to execute rebalance right after changing the parameters
+     * @param respectRatio boolean for the execute rebalance to respect the active bin ratio.
+     */
+    function setShapeParams(
+        ShapeHelper.Shape shape,
+        int256 centre,
+        uint256 radius,
+        bool _executeRebalance,
+        bool respectRatio
+    ) external onlyManager {
+        (
+            int256[] memory _deltaIds,
+            uint256[] memory _distributionX,
+            uint256[] memory _distributionY
+        ) = _getShape(shape, centre, radius);
+        _storeParams(_deltaIds, _distributionX, _distributionY);
+        if (_executeRebalance) {
+            executeRebalance(respectRatio);
+        }
+        emit SetParams(_deltaIds, _distributionX, _distributionY);
+    }
+
+    /**
+     * @notice Packs the params in storage, the distributions must already be validated to fit in 64 bits
+     * @param _deltaIds see ILBRouter.LiquidityParameters
+     * @param _distributionX see ILBRouter.LiquidityParameters
+     * @param _distributionY see ILBRouter.LiquidityParameters
+     */
+    function _storeParams(
+        int256[] memory _deltaIds,
+        uint256[] memory _distributionX,
+        uint256[] memory _distributionY
+    ) internal {
+        uint256 length = _deltaIds.length;
+        uint256[] memory deltaWords = new uint256[]((length + 15) / 16);
+        uint256[] memory distributionWords = new uint256[]((length + 1) / 2);
+        for (uint256 i; i < length; i++) {
+            int256 delta = _deltaIds[i];
+            require(
+                delta >= type(int16).min && delta <= type(int16).max,
+                "Delta out of range"
+            );
+            deltaWords[i / 16] |= uint256(uint16(int16(delta))) << ((i % 16) * 16);
+            distributionWords[i / 2] |=
+                ((_distributionX[i] << 64) | _distributionY[i]) <<
+                ((i % 2) * 128);
+        }
+        packedDeltaIds = deltaWords;
+        packedDistributions = distributionWords;
+        paramsLength = length;
+    }
+
+    /**
+     * @notice Returns the params of the strategy
+     * @return _deltaIds see ILBRouter.LiquidityParameters
+     * @return _distributionX see ILBRouter.LiquidityParameters
+     * @return _distributionY see ILBRouter.LiquidityParameters
+     */
+    function getParams()
+        public
+        view
+        returns (
+            int256[] memory _deltaIds,
+            uint256[] memory _distributionX,
+            uint256[] memory _distributionY
+        )
+    {
+        uint256 length = paramsLength;
+        _deltaIds = new int256[](length);
+        _distributionX = new uint256[](length);
+        _distributionY = new uint256[](length);
+        uint256 deltaWord;
+        uint256 distributionWord;
+        for (uint256 i; i < length; i++) {
+            if (i % 16 == 0) {
+                deltaWord = packedDeltaIds[i / 16];
+            }
+            if (i % 2 == 0) {
+                distributionWord = packedDistributions[i / 2];
+            }
+            _deltaIds[i] = _decodeDelta(deltaWord, i);
+            (_distributionX[i], _distributionY[i]) = _decodeDistributions(distributionWord, i);
+        }
+    }
+
+    function deltaIds(uint256 index) external view returns (int256) {
+        require(index < paramsLength, "Out of range");
+        return _decodeDelta(packedDeltaIds[index / 16], index);
+    }
+
+    function distributionX(uint256 index) external view returns (uint256 value) {
+        require(index < paramsLength, "Out of range");
+        (value, ) = _decodeDistributions(packedDistributions[index / 2], index);
+    }
+
+    function distributionY(uint256 index) external view returns (uint256 value) {
+        require(index < paramsLength, "Out of range");
+        (, value) = _decodeDistributions(packedDistributions[index / 2], index);
+    }
+
+    function _decodeDelta(uint256 word, uint256 index) internal pure returns (int256) {
+        return int16(uint16(word >> ((index % 16) * 16)));
+    }
+
+    function _decodeDistributions(uint256 word, uint256 index)
+        internal
+        pure
+        returns (uint256 _distributionX, uint256 _distributionY)
+    {
+        uint256 bin = word >> ((index % 2) * 128);
+        _distributionX = uint64(bin >> 64);
+        _distributionY = uint64(bin);
+    }
+
+    /**
+     * @notice Moves the params of a strategy deployed before they were packed
+     * @dev To be called by the proxy admin through upgradeAndCall, so the strategy never runs the new implementation
+     * without params. It only moves state, so it is left open, and runs once per layout.
+     */
+    function migrateLayout() external {
+        require(layoutVersion < LAYOUT_VERSION, "Already migrated");
+        layoutVersion = LAYOUT_VERSION;
+        if (legacyDeltaIds.length > 0) {
+            _storeParams(legacyDeltaIds, legacyDistributionX, legacyDistributionY);
+            delete legacyDeltaIds;
+            delete legacyDistributionX;
+            delete legacyDistributionY;
+        }
+    }
+
     /**
      * @notice Validates the expected liquidity parameters before passing them onto the vault
      * @param _deltaIds see ILBRouter.LiquidityParameters
@@ -130,6 +291,20 @@ contract Strategy is Initializable, OwnableUpgradeable, PausableUpgradeable {
         uint256[] calldata _distributionX,
         uint256[] calldata _distributionY
     ) public view {
+        _checkParams(_deltaIds, _distributionX, _distributionY);
+    }
+
+    /**
+     * @notice Checks of _validateParams, on params held in memory
+     * @param _deltaIds see ILBRouter.LiquidityParameters
+     * @param _distributionX see ILBRouter.LiquidityParameters
+     * @param _distributionY see ILBRouter.LiquidityParameters
+     */
+    function _checkParams(
+        int256[] memory _deltaIds,
+        uint256[] memory _distributionX,
+        uint256[] memory _distributionY
+    ) internal view {
         int256 previousId = _deltaIds[0] - 1;
         uint256 length = _deltaIds.length;
         uint256 sumDistX;
@@ -145,11 +320,39 @@ contract Strategy is Initializable, OwnableUpgradeable, PausableUpgradeable {
             sumDistX += _distributionX[i];
             sumDistY += _distributionY[i];
         }
-        require(_deltaIds[length - 1] - _deltaIds[0] < 50, "Too much bins");
+        require(
+            _deltaIds[length - 1] - _deltaIds[0] < int256(ILBPool(vault).maxDepositedBins()),
+            "Too much bins"
+        );
         require(sumDistX <= 10**18, "Bad X distribution");
         require(sumDistY <= 10**18, "Bad Y distribution");
     }
 
+    /**
+     * @notice Generates the params of a shape and validates them as _validateParams does
+     * @dev The bins are counted before generating the shape, so a radius over the cap of the vault fails early
+     * @param shape see ShapeHelper.getShape
+     * @param centre delta id of the centre of the shape
+     * @param radius number of bins on each side of the centre
+     */
+    function _getShape(
+        ShapeHelper.Shape shape,
+        int256 centre,
+        uint256 radius
+    )
+        internal
+        view
+        returns (
+            int256[] memory _deltaIds,
+            uint256[] memory _distributionX,
+            uint256[] memory _distributionY
+        )
+    {
+        require(2 * radius + 1 <= ILBPool(vault).maxDepositedBins(), "Too much bins");
+        (_deltaIds, _distributionX, _distributionY) = ShapeHelper.getShape(shape, centre, radius);
+        _checkParams(_deltaIds, _distributionX, _distributionY);
+    }
+
     /**
      * @notice Swaps for the the _for token
      * @dev This needs to have safeguards, as this can be front-run and/or used to manipulate the market
@@ -186,8 +389,31 @@ contract Strategy is Initializable, OwnableUpgradeable, PausableUpgradeable {
      * @notice Executes rebalance based on the current params.
      * @param respectRatio see trader joe fee based on deposit.
      */
-    function executeRebalance(bool respectRatio) public onlyManager {
-        ILBPool(vault).executeRebalance(deltaIds, distributionX, distributionY, respectRatio);
+    function executeRebalance(bool respectRatio) public onlyManagerOrKeeper {
+        (
+            int256[] memory _deltaIds,
+            uint256[] memory _distributionX,
+            uint256[] memory _distributionY
+        ) = getParams();
+        ILBPool(vault).executeRebalance(_deltaIds, _distributionX, _distributionY, respectRatio);
+    }
+
+    /**
+     * @notice Executes rebalance based on the current params, only moving the liquidity that differs from them
+     * @param respectRatio see trader joe fee based on deposit.
+     */
+    function executeIncrementalRebalance(bool respectRatio) public onlyManagerOrKeeper {
+        (
+            int256[] memory _deltaIds,
+            uint256[] memory _distributionX,
+            uint256[] memory _distributionY
+        ) = getParams();
+        ILBPool(vault).executeIncrementalRebalance(
+            _deltaIds,
+            _distributionX,
+            _distributionY,
+            respectRatio
+        );
     }
 
     /**
@@ -202,7 +428,12 @@ contract Strategy is Initializable, OwnableUpgradeable, PausableUpgradeable {
         bool respectRatio
     ) external onlyManager {
         ILBPool(vault).withdrawLiquidityFromBins(binsToWithdraw, amountsToWithdraw);
-        ILBPool(vault).addAllLiquidity(deltaIds, distributionX, distributionY, respectRatio);
+        (
+            int256[] memory _deltaIds,
+            uint256[] memory _distributionX,
+            uint256[] memory _distributionY
+        ) = getParams();
+        ILBPool(vault).addAllLiquidity(_deltaIds, _distributionX, _distributionY, respectRatio);
     }
 
     /**
@@ -229,6 +460,70 @@ contract Strategy is Initializable, OwnableUpgradeable, PausableUpgradeable {
         bool respectRatio
     ) external onlyManager {
         _validateParams(_deltaIds, _distributionX, _distributionY);
+        _customRebalance(
+            binsToWithdraw,
+            amountsToWithdraw,
+            swapAmount,
+            amountOutMin,
+            swapToken,
+            _deltaIds,
+            _distributionX,
+            _distributionY,
+            respectRatio
+        );
+    }
+
+    /**
+     * @notice Rebalances by swapping and adding liquidity with a shape generated on-chain, only available to the strategist
+     * @param binsToWithdraw bins to withdraw from
+     * @param amountsToWithdraw amount of receipt token to burn
+     * @param swapAmount amount of the token to swap
+     * @param swapToken token to swap for
+     * @param shape see ShapeHelper.getShape
+     * @param centre delta id of the centre of the shape
+     * @param radius number of bins on each side of the centre
+     * @param respectRatio In order to avoid fees when depositing in the active bin, strategist can indicate to respect the ratio
+     */
+    function customRebalanceWithShape(
+        uint256[] memory binsToWithdraw,
+        uint256[] memory amountsToWithdraw,
+        uint256 swapAmount,
+        uint256 amountOutMin,
+        address swapToken,
+        ShapeHelper.Shape shape,
+        int256 centre,
+        uint256 radius,
+        bool respectRatio
+    ) external onlyManager {
+        (
+            int256[] memory _deltaIds,
+            uint256[] memory _distributionX,
+            uint256[] memory _distributionY
+        ) = _getShape(shape, centre, radius);
+        _customRebalance(
+            binsToWithdraw,
+            amountsToWithdraw,
+            swapAmount,
+            amountOutMin,
+            swapToken,
+            _deltaIds,
+            _distributionX,
+            _distributionY,
+            respectRatio
+        );
+    }
+
+    function _customRebalance(
+        uint256[] memory binsToWithdraw,
+        uint256[] memory amountsToWithdraw,
+        uint256 swapAmount,
+        uint256 amountOutMin,
+        address swapToken,
+        int256[] memory _deltaIds,
+        uint256[] memory _distributionX,
+        uint256[] memory _distributionY,
+        bool respectRatio
+    ) internal {
         ILBPool(vault).withdrawLiquidityFromBins(binsToWithdraw, amountsToWithdraw);
         uint256 minimumExpectedAmount = expectedAmount(swapToken, swapAmount);
         require(amountOutMin >= minimumExpectedAmount, "amountOutMin < minimumExpectedAmount");
@@ -250,6 +545,20 @@ contract Strategy is Initializable, OwnableUpgradeable, PausableUpgradeable {
         ILBPool(vault).withdrawAllLiquidity();
     }
 
+    /**
+     * @notice Withdraw all liquidity of a page of the deposited bins, only strategist
+     * @param cursor first bin of the page, 0 to start from the lowest deposited bin
+     * @param maxBins maximum number of bins in the page
+     * @return nextCursor first bin of the next page, 0 if this page is the last one
+     */
+    function withdrawAllLiquidityPage(uint256 cursor, uint256 maxBins)
+        public
+        onlyManager
+        returns (uint256 nextCursor)
+    {
+        nextCursor = ILBPool(vault).withdrawAllLiquidityPage(cursor, maxBins);
+    }
+
     /**
      * @notice Withdraw amount X and amount Y of each token
      * @param amountX amount of token X to withdraw
@@ -283,12 +592,17 @@ contract Strategy is Initializable, OwnableUpgradeable, PausableUpgradeable {
         uint256 amountY,
         bool respectRatio
     ) public onlyManager {
+        (
+            int256[] memory _deltaIds,
+            uint256[] memory _distributionX,
+            uint256[] memory _distributionY
+        ) = getParams();
         ILBPool(vault).addLiquidity(
             amountX,
             amountY,
-            deltaIds,
-            distributionX,
-            distributionY,
+            _deltaIds,
+            _distributionX,
+            _distributionY,
             respectRatio
         );
     }
@@ -297,8 +611,13 @@ contract Strategy is Initializable, OwnableUpgradeable, PausableUpgradeable {
      * @notice Add all liquidity based on the current strategy, only available to the strategist
      * @param respectRatio In order to avoid fees when depositing in the active bin, strategist can indicate to respect the ratio
      */
-    function addAllLiquidity(bool respectRatio) external onlyManager {
-        ILBPool(vault).addAllLiquidity(deltaIds, distributionX, distributionY, respectRatio);
+    function addAllLiquidity(bool respectRatio) external onlyManagerOrKeeper {
+        (
+            int256[] memory _deltaIds,
+            uint256[] memory _distributionX,
+            uint256[] memory _distributionY
+        ) = getParams();
+        ILBPool(vault).addAllLiquidity(_deltaIds, _distributionX, _distributionY, respectRatio);
     }
 
     /**
@@ -329,4 +648,36 @@ contract Strategy is Initializable, OwnableUpgradeable, PausableUpgradeable {
             respectRatio
         );
     }
+
+    /**
+     * @notice Add Liquidity with a shape generated on-chain, only available to the strategist
+     * @param amountX see ILBRouter.LiquidityParameters
+     * @param amountY see ILBRouter.LiquidityParameters
+     * @param shape see ShapeHelper.getShape
+     * @param centre delta id of the centre of the shape
+     * @param radius number of bins on each side of the centre
+     * @param respectRatio In order to avoid fees when depositing in the active bin, strategist can indicate to respect the ratio
+     */
+    function addLiquidityWithShape(
+        uint256 amountX,
+        uint256 amountY,
+        ShapeHelper.Shape shape,
+        int256 centre,
+        uint256 radius,
+        bool respectRatio
+    ) public onlyManager {
+        (
+            int256[] memory _deltaIds,
+            uint256[] memory _distributionX,
+            uint256[] memory _distributionY
+        ) = _getShape(shape, centre, radius);
+        ILBPool(vault).addLiquidity(
+            amountX,
+            amountY,
+            _deltaIds,
+            _distributionX,
+            _distributionY,
+            respectRatio
+        );
+    }
 }
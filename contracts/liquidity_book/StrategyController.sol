@@ -0,0 +1,142 @@
+// SPDX-License-Identifier: MIT
+pragma solidity ^0.8.0;
+
+import "@openzeppelin/contracts/access/Ownable.sol";
+import "@openzeppelin/contracts/token/ERC20/IERC20.sol";
+import "@openzeppelin/contracts/token/ERC20/utils/SafeERC20.sol";
+
+import "interfaces/ILBPool.sol";
+import "interfaces/IReceiptsHolder.sol";
+import "interfaces/IStrategy.sol";
+
+/// @title StrategyController
+/// @author Vector Team
+/// @notice Runs the routine operations of many strategies in one transaction, it must be the keeper of each of them
+contract StrategyController is Ownable {
+    using SafeERC20 for IERC20;
+
+    enum Action {
+        Harvest,
+        Rebalance,
+        IncrementalRebalance,
+        AddAllLiquidity
+    }
+
+    /// @notice An action to run on the vault of a strategy
+    /// @param respectRatio see Strategy.executeRebalance, ignored by Harvest
+    struct Operation {
+        IStrategy strategy;
+        Action action;
+        bool respectRatio;
+    }
+
+    mapping(address => bool) public isKeeper;
+
+    event SetKeeper(address keeper, bool state);
+    event OperationFailed(address indexed strategy, Action action, bytes reason);
+
+    modifier onlyKeeper() {
+        require(isKeeper[msg.sender], "Not Keeper");
+        _;
+    }
+
+    function setKeeper(address keeper, bool state) external onlyOwner {
+        isKeeper[keeper] = state;
+        emit SetKeeper(keeper, state);
+    }
+
+    /**
+     * @notice Runs the operations in order, an operation reverting is reported and does not revert the others
+     * @dev Harvests accrue the caller fee to this contract in the receipts holder of the vault, see claimFees
+     * @param operations the operations to run
+     * @return succeeded whether each operation succeeded, the failures also emit OperationFailed
+     */
+    function execute(Operation[] calldata operations)
+        external
+        onlyKeeper
+        returns (bool[] memory succeeded)
+    {
+        uint256 length = operations.length;
+        succeeded = new bool[](length);
+        for (uint256 i; i < length; i++) {
+            succeeded[i] = _execute(operations[i]);
+        }
+    }
+
+    function _execute(Operation calldata operation) internal returns (bool) {
+        address strategy = address(operation.strategy);
+        Action action = operation.action;
+        bool success;
+        bytes memory result;
+        if (action == Action.Harvest) {
+            (success, result) = _call(strategy, abi.encodeWithSelector(IStrategy.vault.selector));
+            if (success) {
+                (success, result) = _call(
+                    _toAddress(result),
+                    abi.encodeWithSelector(ILBPool.harvest.selector, address(this))
+                );
+            }
+        } else {
+            bytes4 selector = IStrategy.addAllLiquidity.selector;
+            if (action == Action.Rebalance) {
+                selector = IStrategy.executeRebalance.selector;
+            } else if (action == Action.IncrementalRebalance) {
+                selector = IStrategy.executeIncrementalRebalance.selector;
+            }
+            (success, result) = _call(
+                strategy,
+                abi.encodeWithSelector(selector, operation.respectRatio)
+            );
+        }
+        if (!success) {
+            emit OperationFailed(strategy, action, result);
+        }
+        return success;
+    }
+
+    /**
+     * @notice Calls target without reverting, a target without code fails instead of succeeding silently
+     * @return success whether the call succeeded
+     * @return result the return data of the call, its revert reason when it failed
+     */
+    function _call(address target, bytes memory data)
+        private
+        returns (bool success, bytes memory result)
+    {
+        if (target.code.length == 0) {
+            return (false, abi.encodeWithSignature("Error(string)", "No code"));
+        }
+        (success, result) = target.call(data);
+    }
+
+    /// @dev Decodes an address returned by a call, the zero address if the data is not one
+    function _toAddress(bytes memory result) private pure returns (address) {
+        if (result.length != 32) {
+            return address(0);
+        }
+        uint256 value = abi.decode(result, (uint256));
+        return value > type(uint160).max ? address(0) : address(uint160(value));
+    }
+
+    /**
+     * @notice Claims the caller fees accrued to the controller by the harvests, they can then be swept
+     * @param receiptsHolders receipts holders of the vaults harvested
+     */
+    function claimFees(IReceiptsHolder[] calldata receiptsHolders) external onlyOwner {
+        address[] memory recipients = new address[](1);
+        recipients[0] = address(this);
+        uint256 length = receiptsHolders.length;
+        for (uint256 i; i < length; i++) {
+            receiptsHolders[i].claimFees(recipients);
+        }
+    }
+
+    /**
+     * @notice Sends the tokens held by the controller, such as the caller fees claimed
+     * @param token token to send
+     * @param to recipient
+     */
+    function sweep(IERC20 token, address to) external onlyOwner {
+        token.safeTransfer(to, token.balanceOf(address(this)));
+    }
+}
@@ -17,6 +17,8 @@ import "./../../interfaces/ILBFactory.sol";
 import "./../../interfaces/ILBToken.sol";
 import "./../../interfaces/IStrategy.sol";
 import "./../../interfaces/ILBPool.sol";
+import "./../../interfaces/IReceiptsHolder.sol";
+import "./../../interfaces/IViewHelper.sol";
 import "./BinHelper.sol";
 
 /// @title Locker
@@ -24,6 +26,33 @@ import "./BinHelper.sol";
 contract ViewHelper is Initializable, OwnableUpgradeable {
     using EnumerableSet for EnumerableSet.UintSet;
 
+    /// @dev Receipt tokens to burn, arrays are allocated for every deposited bin and filled up to length
+    struct WithdrawalPlan {
+        uint256[] ids;
+        uint256[] amounts;
+        uint256 length;
+    }
+
+    /// @dev Rebalance plan being built, with the total funds of the vault the targets are computed from
+    struct RebalanceBuilder {
+        IViewHelper.RebalancePlan plan;
+        uint256 totalX;
+        uint256 totalY;
+        uint256 removedLength;
+        uint256 addedLength;
+    }
+
+    /// @dev Vault-wide state read once and shared by the per-user computations of the batched views
+    struct VaultState {
+        uint256 priceX;
+        uint256 totalX;
+        uint256 totalY;
+        uint256 totalDeposits;
+        uint256 totalSupply;
+        // Shares per deposit token while the vault is empty, see LBPool.getSharesForDepositTokens
+        uint256 initialShareScale;
+    }
+
     function __ViewHelper_init() external initializer {
         __Ownable_init();
     }
@@ -85,60 +114,174 @@ contract ViewHelper is Initializable, OwnableUpgradeable {
         view
         returns (uint256 finalAmountX, uint256 finalAmountY)
     {
-        uint256 shares = vault.balanceOf(user);
+        (finalAmountX, finalAmountY) = _getMaximumWithdrawalX(
+            vault.balanceOf(user),
+            _getVaultState(vault)
+        );
+    }
+
+    function getMaximumWithdrawalTokenYWithoutSwapping(ILBPool vault, address user)
+        external
+        view
+        returns (uint256 finalAmountX, uint256 finalAmountY)
+    {
+        (finalAmountX, finalAmountY) = _getMaximumWithdrawalY(
+            vault.balanceOf(user),
+            _getVaultState(vault)
+        );
+    }
+
+    /**
+     * @notice Batched getMaximumWithdrawalTokenXWithoutSwapping, the vault is valued once for all the users
+     * @param vault the vault
+     * @param users holders of shares
+     * @return amountsX amount of tokenX each user can withdraw
+     * @return amountsY amount of tokenY each user can withdraw
+     */
+    function getMaximumWithdrawalsTokenXWithoutSwapping(ILBPool vault, address[] calldata users)
+        external
+        view
+        returns (uint256[] memory amountsX, uint256[] memory amountsY)
+    {
+        VaultState memory state = _getVaultState(vault);
+        uint256 length = users.length;
+        amountsX = new uint256[](length);
+        amountsY = new uint256[](length);
+        for (uint256 i; i < length; i++) {
+            (amountsX[i], amountsY[i]) = _getMaximumWithdrawalX(vault.balanceOf(users[i]), state);
+        }
+    }
+
+    /**
+     * @notice Batched getMaximumWithdrawalTokenYWithoutSwapping, the vault is valued once for all the users
+     * @param vault the vault
+     * @param users holders of shares
+     * @return amountsX amount of tokenX each user can withdraw
+     * @return amountsY amount of tokenY each user can withdraw
+     */
+    function getMaximumWithdrawalsTokenYWithoutSwapping(ILBPool vault, address[] calldata users)
+        external
+        view
+        returns (uint256[] memory amountsX, uint256[] memory amountsY)
+    {
+        VaultState memory state = _getVaultState(vault);
+        uint256 length = users.length;
+        amountsX = new uint256[](length);
+        amountsY = new uint256[](length);
+        for (uint256 i; i < length; i++) {
+            (amountsX[i], amountsY[i]) = _getMaximumWithdrawalY(vault.balanceOf(users[i]), state);
+        }
+    }
+
+    /**
+     * @notice Values amounts of shares, the vault is valued once for all the amounts
+     * @param vault the vault
+     * @param shares amounts of shares
+     * @return valuesX value of each amount in tokenX, see getDepositTokensXForShares
+     * @return valuesY value of each amount in tokenY, see getDepositTokensYForShares
+     */
+    function getDepositTokensForSharesBatch(ILBPool vault, uint256[] calldata shares)
+        external
+        view
+        returns (uint256[] memory valuesX, uint256[] memory valuesY)
+    {
+        VaultState memory state = _getVaultState(vault);
+        uint256 length = shares.length;
+        valuesX = new uint256[](length);
+        valuesY = new uint256[](length);
+        for (uint256 i; i < length; i++) {
+            valuesX[i] = _getDepositTokensXForShares(shares[i], state);
+            valuesY[i] = _getDepositTokensYForShares(shares[i], state);
+        }
+    }
+
+    function _getVaultState(ILBPool vault) internal view returns (VaultState memory state) {
+        state.priceX = vault.getOraclePrice();
+        (state.totalX, state.totalY) = vault.getTotalFunds();
+        state.totalDeposits = state.totalY + ((state.totalX * state.priceX) / 10**18);
+        state.totalSupply = vault.totalSupply();
+        if (state.totalSupply == 0 || state.totalDeposits == 0) {
+            state.initialShareScale = 10**(18 - IERC20Metadata(vault.tokenX()).decimals() + 12);
+        }
+    }
+
+    function _getMaximumWithdrawalX(uint256 shares, VaultState memory state)
+        internal
+        pure
+        returns (uint256 finalAmountX, uint256 finalAmountY)
+    {
         if (shares < 2) {
             return (finalAmountX, finalAmountY);
         }
         shares -= 1;
-        uint256 priceX = vault.getOraclePrice();
-        (uint256 totalAmountXWithdrawable, uint256 reserveX) = getDepositTokensXForShares(
-            shares,
-            priceX,
-            vault
-        );
-        if (totalAmountXWithdrawable > reserveX) {
-            finalAmountX = reserveX;
-            uint256 neededShares = vault.getSharesForDepositTokens(
-                (reserveX * priceX) / 10**18 + 1,
-                priceX
+        uint256 totalAmountXWithdrawable = _getDepositTokensXForShares(shares, state);
+        if (totalAmountXWithdrawable > state.totalX) {
+            finalAmountX = state.totalX;
+            uint256 neededShares = _getSharesForDepositTokens(
+                (state.totalX * state.priceX) / 10**18 + 1,
+                state
             ) + 1;
-            (finalAmountY, ) = getDepositTokensYForShares(shares - neededShares, priceX, vault);
+            finalAmountY = _getDepositTokensYForShares(shares - neededShares, state);
         } else {
             finalAmountX = totalAmountXWithdrawable - 1;
         }
     }
 
-    function getMaximumWithdrawalTokenYWithoutSwapping(ILBPool vault, address user)
-        external
-        view
+    function _getMaximumWithdrawalY(uint256 shares, VaultState memory state)
+        internal
+        pure
         returns (uint256 finalAmountX, uint256 finalAmountY)
     {
-        uint256 shares = vault.balanceOf(user);
-        uint256 priceX = vault.getOraclePrice();
-        uint256 sharesForOneY = vault.getSharesForDepositTokens(1, priceX);
-
+        uint256 sharesForOneY = _getSharesForDepositTokens(1, state);
         if (shares < sharesForOneY + 1) {
             return (finalAmountX, finalAmountY);
         }
         shares -= sharesForOneY + 1;
-
-        (uint256 totalAmountYWithdrawable, uint256 reserveY) = getDepositTokensYForShares(
-            shares,
-            priceX,
-            vault
-        );
-
-        if (reserveY == 0) {
-            (finalAmountX, ) = getDepositTokensXForShares(shares, priceX, vault);
-        } else if (totalAmountYWithdrawable > reserveY) {
-            finalAmountY = reserveY;
-            uint256 neededShares = vault.getSharesForDepositTokens(finalAmountY, priceX);
-            (finalAmountX, ) = getDepositTokensXForShares(shares - neededShares, priceX, vault);
+        uint256 totalAmountYWithdrawable = _getDepositTokensYForShares(shares, state);
+        if (state.totalY == 0) {
+            finalAmountX = _getDepositTokensXForShares(shares, state);
+        } else if (totalAmountYWithdrawable > state.totalY) {
+            finalAmountY = state.totalY;
+            uint256 neededShares = _getSharesForDepositTokens(finalAmountY, state);
+            finalAmountX = _getDepositTokensXForShares(shares - neededShares, state);
         } else {
             finalAmountY = totalAmountYWithdrawable;
         }
     }
 
+    function _getDepositTokensXForShares(uint256 amount, VaultState memory state)
+        internal
+        pure
+        returns (uint256)
+    {
+        if (state.totalSupply == 0 || state.totalDeposits == 0) {
+            return 0;
+        }
+        return (((amount * state.totalDeposits) / state.totalSupply) * 10**18) / state.priceX;
+    }
+
+    function _getDepositTokensYForShares(uint256 amount, VaultState memory state)
+        internal
+        pure
+        returns (uint256)
+    {
+        if (state.totalSupply == 0 || state.totalDeposits == 0) {
+            return 0;
+        }
+        return (amount * state.totalDeposits) / state.totalSupply;
+    }
+
+    function _getSharesForDepositTokens(uint256 amount, VaultState memory state)
+        internal
+        pure
+        returns (uint256)
+    {
+        if (state.totalSupply == 0 || state.totalDeposits == 0) {
+            return amount * state.initialShareScale;
+        }
+        return (amount * state.totalSupply) / state.totalDeposits;
+    }
+
     // function getMaximumWithdrawalTokenYWithoutSwapping(ILBPool vault, address user)
     //     external
     //     view
@@ -205,12 +348,170 @@ contract ViewHelper is Initializable, OwnableUpgradeable {
             uint256 receiptBalance
         )
     {
-        ILBToken receiptToken = ILBToken(pair);
-        receiptBalance = receiptToken.balanceOf(vault, bin);
+        receiptBalance = ILBToken(pair).balanceOf(vault, bin);
+        (reserveX, reserveY) = _getReserveForReceipts(pair, bin, receiptBalance);
+    }
+
+    /**
+     * @notice Reads everything needed to monitor a vault in a single call
+     * @dev Receipt balances and reserves are read from the pair, not from the mirror of the vault
+     * @param vault the vault
+     * @return snapshot state of the vault, see IViewHelper.VaultSnapshot
+     */
+    function getVaultSnapshot(ILBPool vault)
+        public
+        view
+        returns (IViewHelper.VaultSnapshot memory snapshot)
+    {
+        snapshot.vault = address(vault);
+        snapshot.pair = vault.pair();
+        (, , snapshot.activeId) = vault.getPairInfos();
+        try vault.getOraclePrice() returns (uint256 oraclePrice) {
+            snapshot.oraclePrice = oraclePrice;
+        } catch {}
+        snapshot.activeBinPrice = getPriceFromBin(snapshot.activeId, vault.binStep());
+        (snapshot.balanceX, snapshot.balanceY) = vault.getBalances();
+        snapshot.totalSupply = vault.totalSupply();
+        IReceiptsHolder receiptsManager = IReceiptsHolder(vault.receiptsManager());
+        _readSnapshotBins(vault, address(receiptsManager), snapshot);
+        snapshot.managerFee = receiptsManager.MANAGER_FEE();
+        snapshot.callerFee = receiptsManager.CALLER_FEE();
+        snapshot.protocolFee = receiptsManager.PROTOCOL_FEE();
+        snapshot.protocolFeeRecipient = receiptsManager.protocolFeeRecipient();
+    }
+
+    /**
+     * @notice Batched getVaultSnapshot, to read a fleet of vaults in a single call
+     * @param vaults the vaults
+     * @return snapshots state of each vault, see IViewHelper.VaultSnapshot
+     */
+    function getVaultSnapshots(ILBPool[] calldata vaults)
+        external
+        view
+        returns (IViewHelper.VaultSnapshot[] memory snapshots)
+    {
+        uint256 length = vaults.length;
+        snapshots = new IViewHelper.VaultSnapshot[](length);
+        for (uint256 i; i < length; i++) {
+            snapshots[i] = getVaultSnapshot(vaults[i]);
+        }
+    }
+
+    function _readSnapshotBins(
+        ILBPool vault,
+        address receiptsManager,
+        IViewHelper.VaultSnapshot memory snapshot
+    ) internal view {
+        snapshot.bins = vault.getDepositedBins();
+        (snapshot.reservesX, snapshot.reservesY, snapshot.receiptBalances, , ) = getReservesForBins(
+            snapshot.pair,
+            snapshot.bins,
+            receiptsManager
+        );
+        uint256 length = snapshot.bins.length;
+        snapshot.pendingFeesX = new uint256[](length);
+        snapshot.pendingFeesY = new uint256[](length);
+        uint256[] memory bin = new uint256[](1);
+        for (uint256 i; i < length; i++) {
+            bin[0] = snapshot.bins[i];
+            (snapshot.pendingFeesX[i], snapshot.pendingFeesY[i]) = ILBPair(snapshot.pair).pendingFees(
+                receiptsManager,
+                bin
+            );
+        }
+    }
+
+    /**
+     * @notice Computes the reserves owned by a holder for a list of bins, in a single call
+     * @dev Receipt balances are fetched with one balanceOfBatch, the pair is only queried for bins with a balance
+     * @param pair address of the LB pair
+     * @param bins list of bins
+     * @param holder owner of the receipt tokens
+     * @return reservesX amount of tokenX owned in each bin
+     * @return reservesY amount of tokenY owned in each bin
+     * @return receiptBalances amount of receipt tokens owned in each bin
+     * @return totalReserveX total amount of tokenX owned in the bins
+     * @return totalReserveY total amount of tokenY owned in the bins
+     */
+    function getReservesForBins(
+        address pair,
+        uint256[] memory bins,
+        address holder
+    )
+        public
+        view
+        returns (
+            uint256[] memory reservesX,
+            uint256[] memory reservesY,
+            uint256[] memory receiptBalances,
+            uint256 totalReserveX,
+            uint256 totalReserveY
+        )
+    {
+        uint256 length = bins.length;
+        address[] memory accounts = new address[](length);
+        for (uint256 i; i < length; i++) {
+            accounts[i] = holder;
+        }
+        receiptBalances = ILBToken(pair).balanceOfBatch(accounts, bins);
+        (reservesX, reservesY, totalReserveX, totalReserveY) = getReservesForReceipts(
+            pair,
+            bins,
+            receiptBalances
+        );
+    }
+
+    /**
+     * @notice Returns the reserves corresponding to known amounts of receipt tokens of several bins
+     * @param pair address of the LB pair
+     * @param bins list of bins
+     * @param receiptBalances amount of receipt tokens in each bin
+     * @return reservesX amount of tokenX in each bin
+     * @return reservesY amount of tokenY in each bin
+     * @return totalReserveX total amount of tokenX in the bins
+     * @return totalReserveY total amount of tokenY in the bins
+     */
+    function getReservesForReceipts(
+        address pair,
+        uint256[] memory bins,
+        uint256[] memory receiptBalances
+    )
+        public
+        view
+        returns (
+            uint256[] memory reservesX,
+            uint256[] memory reservesY,
+            uint256 totalReserveX,
+            uint256 totalReserveY
+        )
+    {
+        uint256 length = bins.length;
+        reservesX = new uint256[](length);
+        reservesY = new uint256[](length);
+        for (uint256 i; i < length; i++) {
+            (reservesX[i], reservesY[i]) = _getReserveForReceipts(pair, bins[i], receiptBalances[i]);
+            totalReserveX += reservesX[i];
+            totalReserveY += reservesY[i];
+        }
+    }
+
+    /**
+     * @notice Computes the reserves corresponding to an amount of receipt tokens of a bin
+     * @param pair address of the LB pair
+     * @param bin bin of the receipt tokens
+     * @param receiptBalance amount of receipt tokens
+     * @return reserveX amount of tokenX
+     * @return reserveY amount of tokenY
+     */
+    function _getReserveForReceipts(
+        address pair,
+        uint256 bin,
+        uint256 receiptBalance
+    ) internal view returns (uint256 reserveX, uint256 reserveY) {
         if (receiptBalance == 0) {
-            return (0, 0, 0);
+            return (0, 0);
         }
-        uint256 binSupply = receiptToken.totalSupply(bin);
+        uint256 binSupply = ILBToken(pair).totalSupply(bin);
         (uint256 pairReserveX, uint256 pairReserveY) = ILBPair(pair).getBin(uint24(bin));
         if (binSupply > 0) {
             reserveX = (pairReserveX * receiptBalance) / binSupply;
@@ -339,46 +640,7 @@ contract ViewHelper is Initializable, OwnableUpgradeable {
         view
         returns (uint256[] memory finalAmounts, uint256[] memory finalIds)
     {
-        uint256 reserve;
-        ILBToken receiptToken;
-        uint256 lowestBin;
-        uint256 activeId;
-        {
-            receiptToken = ILBToken(address(vault.pair()));
-            (, lowestBin) = vault.getHighestAndLowestBin();
-            (, , activeId) = vault.getPairInfos();
-        }
-        uint256[] memory amounts = new uint256[](activeId - lowestBin);
-        uint256[] memory ids = new uint256[](activeId - lowestBin);
-        // in the case of a withdraw from the active bin, we get both tokens. this is not handled here
-        uint256 finalLength;
-        for (uint256 i = lowestBin; i < activeId; i++) {
-            (, uint256 binReserve, uint256 receiptTokenAmount) = getReserveForBin(
-                address(receiptToken),
-                i,
-                vault.receiptsManager()
-            );
-            if (receiptTokenAmount > 0 && binReserve > 0) {
-                if (reserve + binReserve >= amount) {
-                    uint256 neededFromBin = amount - reserve;
-                    uint256 neededShares = (neededFromBin * receiptTokenAmount) / binReserve;
-                    amounts[finalLength] = neededShares;
-                    ids[finalLength] = i;
-                    finalLength += 1;
-                    break;
-                }
-                reserve += binReserve;
-                amounts[finalLength] = receiptTokenAmount;
-                ids[finalLength] = i;
-                finalLength += 1;
-            }
-        }
-        finalAmounts = new uint256[](finalLength);
-        finalIds = new uint256[](finalLength);
-        for (uint256 k; k < finalLength; k++) {
-            finalAmounts[k] = amounts[k];
-            finalIds[k] = ids[k];
-        }
+        (finalAmounts, finalIds) = _planWithdrawal(amount, false, vault);
     }
 
     /**
@@ -406,48 +668,465 @@ contract ViewHelper is Initializable, OwnableUpgradeable {
         view
         returns (uint256[] memory finalAmounts, uint256[] memory finalIds)
     {
-        uint256 reserve;
-        ILBToken receiptToken;
-        uint256 highestBin;
-        uint256 activeId;
-        {
-            receiptToken = ILBToken(address(vault.pair()));
-            (highestBin, ) = vault.getHighestAndLowestBin();
-            (, , activeId) = vault.getPairInfos();
-        }
-        uint256[] memory amounts = new uint256[](highestBin - activeId);
-        uint256[] memory ids = new uint256[](highestBin - activeId);
-        // in the case of a withdraw from the active bin, we get both tokens. this is not handled here
-        uint256 finalLength;
-        for (uint256 i = highestBin; i > activeId; i--) {
-            (uint256 binReserve, , uint256 receiptTokenAmount) = getReserveForBin(
-                address(receiptToken),
-                i,
-                vault.receiptsManager()
-            );
-            if (receiptTokenAmount > 0 && binReserve > 0) {
-                if (reserve + binReserve >= amount) {
-                    uint256 neededFromBin = amount - reserve;
-                    uint256 neededShares = (neededFromBin * receiptTokenAmount) / binReserve;
-                    amounts[finalLength] = neededShares;
-                    ids[finalLength] = i;
-                    finalLength += 1;
+        (finalAmounts, finalIds) = _planWithdrawal(amount, true, vault);
+    }
+
+    /**
+     * @notice Computes the amounts of receipt token and the bins from where to burn them to withdraw amount of one token
+     * @dev Only the deposited bins of the vault are visited, tokenY is taken from the lowest bins up to the active bin
+     * and tokenX from the highest bins down to the active bin, the active bin itself is not handled here
+     * @param amount amount of token to withdraw
+     * @param isTokenX whether the token to withdraw is tokenX
+     * @param vault vault to withdraw from
+     * @return finalAmounts amounts of receipt token to burn
+     * @return finalIds bins to burn from
+     */
+    function _planWithdrawal(
+        uint256 amount,
+        bool isTokenX,
+        ILBPool vault
+    ) internal view returns (uint256[] memory finalAmounts, uint256[] memory finalIds) {
+        IViewHelper.BinsSnapshot memory snapshot = _getBinsSnapshot(vault);
+        WithdrawalPlan memory plan = _newWithdrawalPlan(snapshot.bins.length);
+        _planSide(amount, isTokenX, snapshot, plan);
+        (finalIds, finalAmounts) = _shrinkWithdrawalPlan(plan);
+    }
+
+    /**
+     * @notice Computes the bins and amounts of receipt token to burn to withdraw amountX and amountY
+     * @dev Works on a snapshot of the deposited bins (see getReservesForBins) without any external call.
+     * The bins are used in the same order as computeAmountsForWithdrawY, the active bin, then computeAmountsForWithdrawX
+     * @param amountX amount of token X to withdraw
+     * @param amountY amount of token Y to withdraw
+     * @param activeId id of the active bin
+     * @param bins deposited bins, sorted by ascending id
+     * @param reservesX amount of tokenX owned in each bin
+     * @param reservesY amount of tokenY owned in each bin
+     * @param receiptBalances amount of receipt tokens owned in each bin
+     * @return ids bins to burn from
+     * @return amounts amounts of receipt token to burn
+     */
+    function computeWithdrawalPlan(
+        uint256 amountX,
+        uint256 amountY,
+        uint256 activeId,
+        uint256[] memory bins,
+        uint256[] memory reservesX,
+        uint256[] memory reservesY,
+        uint256[] memory receiptBalances
+    )
+        public
+        pure
+        returns (uint256[] memory ids, uint256[] memory amounts)
+    {
+        IViewHelper.BinsSnapshot memory snapshot = IViewHelper.BinsSnapshot(
+            activeId,
+            bins,
+            reservesX,
+            reservesY,
+            receiptBalances
+        );
+        (ids, amounts) = _shrinkWithdrawalPlan(
+            _computeWithdrawalPlan(amountX, amountY, snapshot)
+        );
+    }
+
+    function _computeWithdrawalPlan(
+        uint256 amountX,
+        uint256 amountY,
+        IViewHelper.BinsSnapshot memory snapshot
+    ) internal pure returns (WithdrawalPlan memory plan) {
+        plan = _newWithdrawalPlan(snapshot.bins.length);
+        uint256 sharesFromActive;
+        (amountX, amountY, sharesFromActive) = _planActiveBin(
+            amountX,
+            amountY,
+            snapshot
+        );
+        _planSide(amountY, false, snapshot, plan);
+        if (sharesFromActive > 0) {
+            _addToWithdrawalPlan(plan, snapshot.activeId, sharesFromActive);
+        }
+        _planSide(amountX, true, snapshot, plan);
+    }
+
+    /**
+     * @notice Computes what has to be taken from the active bin once the other bins are emptied
+     * @return amountXLeft amount of token X to take from the bins above the active bin
+     * @return amountYLeft amount of token Y to take from the bins below the active bin
+     * @return sharesFromActive amount of receipt token to burn in the active bin
+     */
+    function _planActiveBin(
+        uint256 amountX,
+        uint256 amountY,
+        IViewHelper.BinsSnapshot memory snapshot
+    )
+        internal
+        pure
+        returns (
+            uint256 amountXLeft,
+            uint256 amountYLeft,
+            uint256 sharesFromActive
+        )
+    {
+        (amountXLeft, amountYLeft) = (amountX, amountY);
+        uint256 activeIndex;
+        uint256 neededX;
+        uint256 neededY;
+        (activeIndex, neededX, neededY) = _getNeededFromActive(amountX, amountY, snapshot);
+        uint256 reserveX;
+        uint256 reserveY;
+        if (activeIndex < snapshot.bins.length) {
+            reserveX = snapshot.reservesX[activeIndex];
+            reserveY = snapshot.reservesY[activeIndex];
+        }
+        require(neededX <= reserveX && neededY <= reserveY, "Not enough reserves");
+        if (neededX == 0 && neededY == 0) {
+            return (amountXLeft, amountYLeft, 0);
+        }
+        uint256 receiptBalance = snapshot.receiptBalances[activeIndex];
+        if (neededX == 0 || neededY * reserveX > reserveY * neededX) {
+            sharesFromActive = (neededY * receiptBalance) / reserveY;
+            amountXLeft = _diffOrZero(amountX, (reserveX * sharesFromActive) / receiptBalance);
+            amountYLeft = amountY - neededY;
+        } else {
+            sharesFromActive = (neededX * receiptBalance) / reserveX;
+            amountYLeft = _diffOrZero(amountY, (reserveY * sharesFromActive) / receiptBalance);
+            amountXLeft = amountX - neededX;
+        }
+    }
+
+    /**
+     * @notice Finds the active bin in the snapshot and what the other bins cannot cover
+     * @return activeIndex index of the active bin in the snapshot, bins.length if it is not deposited
+     * @return neededX amount of token X missing from the bins other than the active bin
+     * @return neededY amount of token Y missing from the bins other than the active bin
+     */
+    function _getNeededFromActive(
+        uint256 amountX,
+        uint256 amountY,
+        IViewHelper.BinsSnapshot memory snapshot
+    )
+        internal
+        pure
+        returns (
+            uint256 activeIndex,
+            uint256 neededX,
+            uint256 neededY
+        )
+    {
+        uint256 length = snapshot.bins.length;
+        uint256 outsideReserveX;
+        uint256 outsideReserveY;
+        activeIndex = length;
+        for (uint256 i; i < length; i++) {
+            if (snapshot.bins[i] == snapshot.activeId) {
+                activeIndex = i;
+            } else {
+                outsideReserveX += snapshot.reservesX[i];
+                outsideReserveY += snapshot.reservesY[i];
+            }
+        }
+        neededX = _diffOrZero(amountX, outsideReserveX);
+        neededY = _diffOrZero(amountY, outsideReserveY);
+    }
+
+    /**
+     * @notice Walks the snapshot in price order until amount of the token is covered
+     * @dev tokenY is taken from the lowest bins up to the active bin, tokenX from the highest bins down to it
+     * @param amount amount of token to withdraw
+     * @param isTokenX whether the token to withdraw is tokenX
+     * @param snapshot deposited bins of the vault
+     * @param plan plan the bins are added to
+     */
+    function _planSide(
+        uint256 amount,
+        bool isTokenX,
+        IViewHelper.BinsSnapshot memory snapshot,
+        WithdrawalPlan memory plan
+    ) internal pure {
+        uint256 length = snapshot.bins.length;
+        for (uint256 k; k < length && amount > 0; k++) {
+            uint256 index = isTokenX ? length - 1 - k : k;
+            uint256 bin = snapshot.bins[index];
+            if (isTokenX ? bin <= snapshot.activeId : bin >= snapshot.activeId) {
+                break;
+            }
+            uint256 binReserve = isTokenX ? snapshot.reservesX[index] : snapshot.reservesY[index];
+            uint256 receiptBalance = snapshot.receiptBalances[index];
+            if (receiptBalance > 0 && binReserve > 0) {
+                if (binReserve >= amount) {
+                    _addToWithdrawalPlan(plan, bin, (amount * receiptBalance) / binReserve);
                     break;
                 }
-                reserve += binReserve;
-                amounts[finalLength] = receiptTokenAmount;
-                ids[finalLength] = i;
-                finalLength += 1;
+                amount -= binReserve;
+                _addToWithdrawalPlan(plan, bin, receiptBalance);
+            }
+        }
+    }
+
+    function _newWithdrawalPlan(uint256 maxLength)
+        internal
+        pure
+        returns (WithdrawalPlan memory plan)
+    {
+        plan.ids = new uint256[](maxLength);
+        plan.amounts = new uint256[](maxLength);
+    }
+
+    function _addToWithdrawalPlan(
+        WithdrawalPlan memory plan,
+        uint256 id,
+        uint256 amount
+    ) internal pure {
+        if (amount == 0) {
+            return;
+        }
+        plan.ids[plan.length] = id;
+        plan.amounts[plan.length] = amount;
+        plan.length += 1;
+    }
+
+    /// @dev Shrinks the arrays of the plan in place to the bins actually used
+    function _shrinkWithdrawalPlan(WithdrawalPlan memory plan)
+        internal
+        pure
+        returns (uint256[] memory ids, uint256[] memory amounts)
+    {
+        (ids, amounts) = (plan.ids, plan.amounts);
+        uint256 length = plan.length;
+        assembly {
+            mstore(ids, length)
+            mstore(amounts, length)
+        }
+    }
+
+    /**
+     * @notice Computes the liquidity to move so that the deposited bins follow a new shape, leaving what already matches
+     * @dev The target of each bin is the share of the total funds (idle balances and reserves) given by the distributions
+     * around the active bin. Bins holding more than their target are burnt down to it, bins outside of the shape are
+     * emptied, and what is missing is returned as the distribution of the liquidity to add
+     * @param snapshot deposited bins of the vault
+     * @param balanceX amount of tokenX held by the vault outside of the bins
+     * @param balanceY amount of tokenY held by the vault outside of the bins
+     * @param _deltaIds see ILBRouter.LiquidityParameters
+     * @param _distributionX see ILBRouter.LiquidityParameters
+     * @param _distributionY see ILBRouter.LiquidityParameters
+     * @return plan receipt tokens to burn and liquidity to add
+     */
+    function computeIncrementalRebalance(
+        IViewHelper.BinsSnapshot memory snapshot,
+        uint256 balanceX,
+        uint256 balanceY,
+        int256[] memory _deltaIds,
+        uint256[] memory _distributionX,
+        uint256[] memory _distributionY
+    ) public pure returns (IViewHelper.RebalancePlan memory plan) {
+        RebalanceBuilder memory builder = _newRebalanceBuilder(
+            snapshot,
+            balanceX,
+            balanceY,
+            _deltaIds.length
+        );
+        _planRebalance(builder, snapshot, _deltaIds, _distributionX, _distributionY);
+        plan = _shrinkRebalancePlan(builder);
+    }
+
+    /// @dev Walks the deposited bins and the bins of the shape together, both sorted by ascending id
+    function _planRebalance(
+        RebalanceBuilder memory builder,
+        IViewHelper.BinsSnapshot memory snapshot,
+        int256[] memory _deltaIds,
+        uint256[] memory _distributionX,
+        uint256[] memory _distributionY
+    ) internal pure {
+        uint256 i;
+        uint256 j;
+        while (i < snapshot.bins.length || j < _deltaIds.length) {
+            int256 binDelta = i < snapshot.bins.length
+                ? int256(snapshot.bins[i]) - int256(snapshot.activeId)
+                : type(int256).max;
+            int256 targetDelta = j < _deltaIds.length ? _deltaIds[j] : type(int256).max;
+            if (binDelta < targetDelta) {
+                _rebalanceBin(builder, snapshot, i, binDelta, 0, 0);
+                i++;
+            } else {
+                _rebalanceBin(
+                    builder,
+                    snapshot,
+                    binDelta == targetDelta ? i : type(uint256).max,
+                    targetDelta,
+                    (builder.totalX * _distributionX[j]) / 10**18,
+                    (builder.totalY * _distributionY[j]) / 10**18
+                );
+                if (binDelta == targetDelta) {
+                    i++;
+                }
+                j++;
             }
         }
-        finalAmounts = new uint256[](finalLength);
-        finalIds = new uint256[](finalLength);
-        for (uint256 k; k < finalLength; k++) {
-            finalAmounts[k] = amounts[k];
-            finalIds[k] = ids[k];
+    }
+
+    /**
+     * @notice Burns the excess of a bin over its target and records what is missing to reach it
+     * @param builder plan being built
+     * @param snapshot deposited bins of the vault
+     * @param index index of the bin in the snapshot, type(uint256).max if it is not deposited
+     * @param delta id of the bin relative to the active bin
+     * @param targetX amount of tokenX the bin should hold
+     * @param targetY amount of tokenY the bin should hold
+     */
+    function _rebalanceBin(
+        RebalanceBuilder memory builder,
+        IViewHelper.BinsSnapshot memory snapshot,
+        uint256 index,
+        int256 delta,
+        uint256 targetX,
+        uint256 targetY
+    ) internal pure {
+        uint256 remainingX;
+        uint256 remainingY;
+        if (index < snapshot.bins.length) {
+            (remainingX, remainingY) = _burnExcess(builder, snapshot, index, targetX, targetY);
+        }
+        uint256 deficitX = _diffOrZero(targetX, remainingX);
+        uint256 deficitY = _diffOrZero(targetY, remainingY);
+        if (deficitX > 0 || deficitY > 0) {
+            IViewHelper.RebalancePlan memory plan = builder.plan;
+            plan.addedDeltaIds[builder.addedLength] = delta;
+            plan.addedDistributionX[builder.addedLength] = deficitX;
+            plan.addedDistributionY[builder.addedLength] = deficitY;
+            plan.amountX += deficitX;
+            plan.amountY += deficitY;
+            builder.addedLength += 1;
         }
     }
 
+    /**
+     * @notice Adds to the plan the receipt tokens to burn so that a bin holds no more than its target
+     * @return remainingX amount of tokenX left in the bin
+     * @return remainingY amount of tokenY left in the bin
+     */
+    function _burnExcess(
+        RebalanceBuilder memory builder,
+        IViewHelper.BinsSnapshot memory snapshot,
+        uint256 index,
+        uint256 targetX,
+        uint256 targetY
+    ) internal pure returns (uint256 remainingX, uint256 remainingY) {
+        uint256 receiptBalance = snapshot.receiptBalances[index];
+        if (receiptBalance == 0) {
+            return (0, 0);
+        }
+        remainingX = snapshot.reservesX[index];
+        remainingY = snapshot.reservesY[index];
+        uint256 amount;
+        {
+            uint256 excessX = _excessShare(remainingX, targetX);
+            uint256 excessY = _excessShare(remainingY, targetY);
+            amount = (receiptBalance * (excessX > excessY ? excessX : excessY)) / 10**18;
+        }
+        if (amount > 0) {
+            _addRemoval(builder, snapshot.bins[index], amount);
+        }
+        remainingX -= (remainingX * amount) / receiptBalance;
+        remainingY -= (remainingY * amount) / receiptBalance;
+    }
+
+    function _addRemoval(
+        RebalanceBuilder memory builder,
+        uint256 id,
+        uint256 amount
+    ) internal pure {
+        IViewHelper.RebalancePlan memory plan = builder.plan;
+        plan.removedIds[builder.removedLength] = id;
+        plan.removedAmounts[builder.removedLength] = amount;
+        builder.removedLength += 1;
+    }
+
+    /// @dev Share of reserve above target, 10**18 being the whole reserve
+    function _excessShare(uint256 reserve, uint256 target) internal pure returns (uint256) {
+        return reserve > target ? ((reserve - target) * 10**18) / reserve : 0;
+    }
+
+    function _newRebalanceBuilder(
+        IViewHelper.BinsSnapshot memory snapshot,
+        uint256 balanceX,
+        uint256 balanceY,
+        uint256 targetLength
+    ) internal pure returns (RebalanceBuilder memory builder) {
+        uint256 length = snapshot.bins.length;
+        builder.totalX = balanceX;
+        builder.totalY = balanceY;
+        for (uint256 i; i < length; i++) {
+            builder.totalX += snapshot.reservesX[i];
+            builder.totalY += snapshot.reservesY[i];
+        }
+        builder.plan.removedIds = new uint256[](length);
+        builder.plan.removedAmounts = new uint256[](length);
+        builder.plan.addedDeltaIds = new int256[](targetLength);
+        builder.plan.addedDistributionX = new uint256[](targetLength);
+        builder.plan.addedDistributionY = new uint256[](targetLength);
+    }
+
+    /// @dev Shrinks the arrays of the plan to the bins actually used and turns the missing amounts into distributions
+    function _shrinkRebalancePlan(RebalanceBuilder memory builder)
+        internal
+        pure
+        returns (IViewHelper.RebalancePlan memory plan)
+    {
+        plan = builder.plan;
+        uint256 addedLength = builder.addedLength;
+        for (uint256 k; k < addedLength; k++) {
+            if (plan.amountX > 0) {
+                plan.addedDistributionX[k] = (plan.addedDistributionX[k] * 10**18) / plan.amountX;
+            }
+            if (plan.amountY > 0) {
+                plan.addedDistributionY[k] = (plan.addedDistributionY[k] * 10**18) / plan.amountY;
+            }
+        }
+        (uint256[] memory removedIds, uint256[] memory removedAmounts) = (
+            plan.removedIds,
+            plan.removedAmounts
+        );
+        (
+            int256[] memory addedDeltaIds,
+            uint256[] memory addedDistributionX,
+            uint256[] memory addedDistributionY
+        ) = (plan.addedDeltaIds, plan.addedDistributionX, plan.addedDistributionY);
+        uint256 removedLength = builder.removedLength;
+        assembly {
+            mstore(removedIds, removedLength)
+            mstore(removedAmounts, removedLength)
+            mstore(addedDeltaIds, addedLength)
+            mstore(addedDistributionX, addedLength)
+            mstore(addedDistributionY, addedLength)
+        }
+    }
+
+    /**
+     * @notice Reads the deposited bins of a vault with the reserves it owns in each of them
+     * @param vault vault owning the liquidity
+     * @return snapshot deposited bins of the vault
+     */
+    function _getBinsSnapshot(ILBPool vault)
+        internal
+        view
+        returns (IViewHelper.BinsSnapshot memory snapshot)
+    {
+        (, , snapshot.activeId) = vault.getPairInfos();
+        snapshot.bins = vault.getDepositedBins();
+        (snapshot.reservesX, snapshot.reservesY, snapshot.receiptBalances, , ) = getReservesForBins(
+            address(vault.pair()),
+            snapshot.bins,
+            vault.receiptsManager()
+        );
+    }
+
+    function _diffOrZero(uint256 a, uint256 b) internal pure returns (uint256) {
+        return a > b ? a - b : 0;
+    }
+
     /**
      * @notice Computes the amount to be withdrawn from active Bin. One of the tokens is implicitely calculated and thus must be 0.
      * @dev The returned amount is for the token that is automatically handeld
@@ -0,0 +1,67 @@
+// SPDX-License-Identifier: MIT
+pragma solidity ^0.8.0;
+
+import "../liquidity_book/BinHelper.sol";
+
+/// @notice Exposes the BinHelper math, for the parity tests and gas benchmarks
+contract BinHelperMock {
+    function getPriceFromId(uint256 id, uint256 binStep) external pure returns (uint256) {
+        return BinHelper.getPriceFromId(id, binStep);
+    }
+
+    function getPricesFromIds(uint256[] calldata ids, uint256 binStep)
+        external
+        pure
+        returns (uint256[] memory prices)
+    {
+        uint256 length = ids.length;
+        prices = new uint256[](length);
+        for (uint256 i; i < length; i++) {
+            prices[i] = BinHelper.getPriceFromId(ids[i], binStep);
+        }
+    }
+
+    function getIdFromPrice(uint256 price, uint256 binStep) external pure returns (uint24) {
+        return BinHelper.getIdFromPrice(price, binStep);
+    }
+
+    function power(uint256 x, int256 y) external pure returns (uint256) {
+        return Math128x128.power(x, y);
+    }
+
+    function log2(uint256 x) external pure returns (int256) {
+        return Math128x128.log2(x);
+    }
+
+    function mulShiftRoundDown(
+        uint256 x,
+        uint256 y,
+        uint256 offset
+    ) external pure returns (uint256) {
+        return Math512Bits.mulShiftRoundDown(x, y, offset);
+    }
+
+    function mulShiftRoundUp(
+        uint256 x,
+        uint256 y,
+        uint256 offset
+    ) external pure returns (uint256) {
+        return Math512Bits.mulShiftRoundUp(x, y, offset);
+    }
+
+    function shiftDivRoundDown(
+        uint256 x,
+        uint256 offset,
+        uint256 denominator
+    ) external pure returns (uint256) {
+        return Math512Bits.shiftDivRoundDown(x, offset, denominator);
+    }
+
+    function shiftDivRoundUp(
+        uint256 x,
+        uint256 offset,
+        uint256 denominator
+    ) external pure returns (uint256) {
+        return Math512Bits.shiftDivRoundUp(x, offset, denominator);
+    }
+}
@@ -0,0 +1,62 @@
+// SPDX-License-Identifier: MIT
+pragma solidity ^0.8.0;
+
+import "interfaces/AggregatorV3Interface.sol";
+
+/// @notice Chainlink feed returning a price set by the tests, each new price is a new round
+contract MockAggregator is AggregatorV3Interface {
+    uint8 public immutable override decimals;
+    uint80 private roundId;
+    int256 private answer;
+    uint256 private updatedAt;
+
+    constructor(uint8 _decimals, int256 _answer) {
+        decimals = _decimals;
+        setAnswer(_answer);
+    }
+
+    function setAnswer(int256 _answer) public {
+        roundId += 1;
+        answer = _answer;
+        updatedAt = block.timestamp;
+    }
+
+    function description() external pure override returns (string memory) {
+        return "Mock feed";
+    }
+
+    function version() external pure override returns (uint256) {
+        return 1;
+    }
+
+    function getRoundData(uint80 _roundId)
+        external
+        view
+        override
+        returns (
+            uint80,
+            int256,
+            uint256,
+            uint256,
+            uint80
+        )
+    {
+        require(_roundId == roundId, "No data present");
+        return (roundId, answer, updatedAt, updatedAt, roundId);
+    }
+
+    function latestRoundData()
+        external
+        view
+        override
+        returns (
+            uint80,
+            int256,
+            uint256,
+            uint256,
+            uint80
+        )
+    {
+        return (roundId, answer, updatedAt, updatedAt, roundId);
+    }
+}
@@ -0,0 +1,55 @@
+// SPDX-License-Identifier: MIT
+pragma solidity ^0.8.0;
+
+import "interfaces/ILBFactory.sol";
+import "./MockLBPair.sol";
+
+/// @notice Deploys and indexes MockLBPair, for the local tests
+contract MockLBFactory {
+    /// @dev Sorted tokens => bin step => pair
+    mapping(address => mapping(address => mapping(uint256 => address))) private pairs;
+
+    event LBPairCreated(
+        address indexed tokenX,
+        address indexed tokenY,
+        uint256 indexed binStep,
+        address LBPair
+    );
+
+    /**
+     * @notice Creates the pair of tokenX and tokenY, the fee parameters are taken as is
+     * @param activeId id of the starting price of the pair
+     * @param feeParameters fee parameters of the pair, the variable part is ignored
+     */
+    function createLBPair(
+        address tokenX,
+        address tokenY,
+        uint24 activeId,
+        ILBPair.FeeParameters memory feeParameters
+    ) external returns (address pair) {
+        (address tokenA, address tokenB) = _sortTokens(tokenX, tokenY);
+        require(pairs[tokenA][tokenB][feeParameters.binStep] == address(0), "Pair exists");
+        feeParameters.volatilityAccumulated = 0;
+        feeParameters.volatilityReference = 0;
+        feeParameters.indexRef = activeId;
+        pair = address(new MockLBPair(tokenX, tokenY, activeId, feeParameters));
+        pairs[tokenA][tokenB][feeParameters.binStep] = pair;
+        emit LBPairCreated(tokenX, tokenY, feeParameters.binStep, pair);
+    }
+
+    function getLBPairInformation(
+        address tokenA,
+        address tokenB,
+        uint256 binStep
+    ) external view returns (ILBFactory.LBPairInformation memory information) {
+        (tokenA, tokenB) = _sortTokens(tokenA, tokenB);
+        address pair = pairs[tokenA][tokenB][binStep];
+        if (pair != address(0)) {
+            information = ILBFactory.LBPairInformation(uint24(binStep), ILBPair(pair), true, false);
+        }
+    }
+
+    function _sortTokens(address tokenA, address tokenB) private pure returns (address, address) {
+        return tokenA < tokenB ? (tokenA, tokenB) : (tokenB, tokenA);
+    }
+}
@@ -0,0 +1,597 @@
+// SPDX-License-Identifier: MIT
+pragma solidity ^0.8.0;
+
+import "@openzeppelin/contracts/token/ERC20/IERC20.sol";
+import "@openzeppelin/contracts/token/ERC20/utils/SafeERC20.sol";
+
+import "interfaces/ILBPair.sol";
+import "../liquidity_book/BinHelper.sol";
+
+/// @notice Liquidity Book v1 pair and receipt token for the local tests, with the bin, swap and fee math of LBPair
+/// @dev Only what the vault uses: no flash loans, and the oracle only records the cumulative id
+contract MockLBPair {
+    using SafeERC20 for IERC20;
+    using Math512Bits for uint256;
+    using TreeMath for mapping(uint256 => uint256)[3];
+
+    struct Bin {
+        uint256 reserveX;
+        uint256 reserveY;
+        uint256 accTokenXPerShare;
+        uint256 accTokenYPerShare;
+    }
+
+    address public immutable factory;
+    address public immutable tokenX;
+    address public immutable tokenY;
+
+    ILBPair.FeeParameters private fp;
+    uint256 private activeId;
+    uint256 private reserveX;
+    uint256 private reserveY;
+    /// @dev Fees held by the pair until collected, protocol fees included
+    uint256 private feesX;
+    uint256 private feesY;
+    uint256 private protocolFeesX;
+    uint256 private protocolFeesY;
+
+    mapping(uint256 => Bin) private bins;
+    /// @dev Bins holding reserves, see TreeMath
+    mapping(uint256 => uint256)[3] private tree;
+
+    mapping(uint256 => uint256) public totalSupply;
+    mapping(address => mapping(uint256 => uint256)) public balanceOf;
+    mapping(address => mapping(address => bool)) public isApprovedForAll;
+    mapping(address => mapping(uint256 => ILBPair.Debts)) private debts;
+    mapping(address => ILBPair.Debts) private unclaimedFees;
+
+    /// @dev Timestamps of the oracle samples and the cumulative id at each of them
+    uint256[] private sampleTimestamps;
+    uint256[] private sampleCumulativeIds;
+
+    event TransferBatch(
+        address indexed sender,
+        address indexed from,
+        address indexed to,
+        uint256[] ids,
+        uint256[] amounts
+    );
+    event ApprovalForAll(address indexed account, address indexed sender, bool approved);
+
+    constructor(
+        address _tokenX,
+        address _tokenY,
+        uint256 _activeId,
+        ILBPair.FeeParameters memory _feeParameters
+    ) {
+        factory = msg.sender;
+        tokenX = _tokenX;
+        tokenY = _tokenY;
+        activeId = _activeId;
+        _feeParameters.time = uint40(block.timestamp);
+        fp = _feeParameters;
+        sampleTimestamps.push(block.timestamp);
+        sampleCumulativeIds.push(0);
+    }
+
+    function feeParameters() external view returns (ILBPair.FeeParameters memory) {
+        return fp;
+    }
+
+    function getReservesAndId()
+        external
+        view
+        returns (
+            uint256,
+            uint256,
+            uint256
+        )
+    {
+        return (reserveX, reserveY, activeId);
+    }
+
+    function getGlobalFees()
+        external
+        view
+        returns (
+            uint256,
+            uint256,
+            uint256,
+            uint256
+        )
+    {
+        return (feesX, feesY, protocolFeesX, protocolFeesY);
+    }
+
+    function getBin(uint24 id) external view returns (uint256, uint256) {
+        return (bins[id].reserveX, bins[id].reserveY);
+    }
+
+    function findFirstNonEmptyBinId(uint24 id, bool sentTokenY) external view returns (uint24) {
+        return uint24(tree.findFirstBin(id, sentTokenY));
+    }
+
+    function balanceOfBatch(address[] memory accounts, uint256[] memory ids)
+        external
+        view
+        returns (uint256[] memory balances)
+    {
+        require(accounts.length == ids.length, "Wrong lengths");
+        balances = new uint256[](accounts.length);
+        for (uint256 i; i < accounts.length; i++) {
+            balances[i] = balanceOf[accounts[i]][ids[i]];
+        }
+    }
+
+    /**
+     * @notice Cumulative id timeDelta seconds ago, the sum of the active id over each second since the deployment
+     * @dev The other values of the sample are not tracked and returned as 0
+     */
+    function getOracleSampleFrom(uint256 timeDelta)
+        external
+        view
+        returns (
+            uint256 cumulativeId,
+            uint256,
+            uint256
+        )
+    {
+        uint256 timestamp = block.timestamp - timeDelta;
+        uint256 length = sampleTimestamps.length;
+        uint256 lastTimestamp = sampleTimestamps[length - 1];
+        if (timestamp >= lastTimestamp) {
+            return (sampleCumulativeIds[length - 1] + activeId * (timestamp - lastTimestamp), 0, 0);
+        }
+        require(timestamp >= sampleTimestamps[0], "Sample too old");
+        // Last sample at or before timestamp, the active id did not change until the next one
+        uint256 low;
+        uint256 high = length - 1;
+        while (high - low > 1) {
+            uint256 middle = (low + high) / 2;
+            if (sampleTimestamps[middle] <= timestamp) {
+                low = middle;
+            } else {
+                high = middle;
+            }
+        }
+        cumulativeId =
+            sampleCumulativeIds[low] +
+            ((sampleCumulativeIds[high] - sampleCumulativeIds[low]) * (timestamp - sampleTimestamps[low])) /
+            (sampleTimestamps[high] - sampleTimestamps[low]);
+        return (cumulativeId, 0, 0);
+    }
+
+    function increaseOracleLength(uint16) external {}
+
+    function pendingFees(address account, uint256[] memory ids)
+        external
+        view
+        returns (uint256 amountX, uint256 amountY)
+    {
+        (amountX, amountY) = (unclaimedFees[account].debtX, unclaimedFees[account].debtY);
+        for (uint256 i; i < ids.length; i++) {
+            (uint256 pendingX, uint256 pendingY) = _getPendingFees(account, ids[i]);
+            amountX += pendingX;
+            amountY += pendingY;
+        }
+    }
+
+    function collectFees(address account, uint256[] memory ids)
+        external
+        returns (uint256 amountX, uint256 amountY)
+    {
+        for (uint256 i; i < ids.length; i++) {
+            _cacheFees(account, ids[i]);
+        }
+        (amountX, amountY) = (unclaimedFees[account].debtX, unclaimedFees[account].debtY);
+        delete unclaimedFees[account];
+        feesX -= amountX;
+        feesY -= amountY;
+        if (amountX > 0) {
+            IERC20(tokenX).safeTransfer(account, amountX);
+        }
+        if (amountY > 0) {
+            IERC20(tokenY).safeTransfer(account, amountY);
+        }
+    }
+
+    /**
+     * @notice Swaps the tokens sent to the pair, crossing bins until the amount is used
+     * @param sentTokenY whether tokenY was sent, and tokenX is bought
+     * @param to recipient of the bought token
+     */
+    function swap(bool sentTokenY, address to)
+        external
+        returns (uint256 amountXOut, uint256 amountYOut)
+    {
+        _updateOracle();
+        bool swapForY = !sentTokenY;
+        uint256 amountIn = swapForY
+            ? IERC20(tokenX).balanceOf(address(this)) - reserveX - feesX
+            : IERC20(tokenY).balanceOf(address(this)) - reserveY - feesY;
+        require(amountIn > 0, "Insufficient amount in");
+        ILBPair.FeeParameters memory _fp = fp;
+        uint256 id = activeId;
+        _updateVariableFeeParameters(_fp, id);
+        uint256 amountOut;
+        while (true) {
+            if ((swapForY ? bins[id].reserveY : bins[id].reserveX) != 0) {
+                (uint256 amountInUsed, uint256 amountOutOfBin) = _swapInBin(
+                    _fp,
+                    id,
+                    swapForY,
+                    amountIn
+                );
+                amountIn -= amountInUsed;
+                amountOut += amountOutOfBin;
+            }
+            if (amountIn == 0) {
+                break;
+            }
+            id = tree.findFirstBin(id, swapForY);
+            require(id != type(uint256).max, "Not enough liquidity");
+        }
+        activeId = id;
+        _fp.time = uint40(block.timestamp);
+        fp = _fp;
+        if (swapForY) {
+            amountYOut = amountOut;
+            IERC20(tokenY).safeTransfer(to, amountOut);
+        } else {
+            amountXOut = amountOut;
+            IERC20(tokenX).safeTransfer(to, amountOut);
+        }
+    }
+
+    /**
+     * @notice Mints receipts for the tokens sent to the pair, split between ids by the distributions
+     * @dev What is not used by the distributions is sent back to `to`, the amounts added exclude the
+     * composition fees
+     */
+    function mint(
+        uint256[] memory ids,
+        uint256[] memory distributionX,
+        uint256[] memory distributionY,
+        address to
+    )
+        external
+        returns (
+            uint256 amountXAddedToPair,
+            uint256 amountYAddedToPair,
+            uint256[] memory liquidityMinted
+        )
+    {
+        require(
+            ids.length == distributionX.length && ids.length == distributionY.length,
+            "Wrong lengths"
+        );
+        _updateOracle();
+        uint256 amountXIn = IERC20(tokenX).balanceOf(address(this)) - reserveX - feesX;
+        uint256 amountYIn = IERC20(tokenY).balanceOf(address(this)) - reserveY - feesY;
+        liquidityMinted = new uint256[](ids.length);
+        for (uint256 i; i < ids.length; i++) {
+            (uint256 liquidity, uint256 amountX, uint256 amountY) = _mintBin(
+                ids[i],
+                (amountXIn * distributionX[i]) / Constants.PRECISION,
+                (amountYIn * distributionY[i]) / Constants.PRECISION,
+                to
+            );
+            liquidityMinted[i] = liquidity;
+            amountXAddedToPair += amountX;
+            amountYAddedToPair += amountY;
+        }
+        // Underflows if the distributions add up to more than 100%
+        uint256 excessX = IERC20(tokenX).balanceOf(address(this)) - reserveX - feesX;
+        uint256 excessY = IERC20(tokenY).balanceOf(address(this)) - reserveY - feesY;
+        if (excessX > 0) {
+            IERC20(tokenX).safeTransfer(to, excessX);
+        }
+        if (excessY > 0) {
+            IERC20(tokenY).safeTransfer(to, excessY);
+        }
+    }
+
+    /**
+     * @notice Burns the receipts sent to the pair and sends the reserves they are worth to `to`
+     */
+    function burn(
+        uint256[] memory ids,
+        uint256[] memory amounts,
+        address to
+    ) external returns (uint256 amountX, uint256 amountY) {
+        require(ids.length == amounts.length, "Wrong lengths");
+        _updateOracle();
+        for (uint256 i; i < ids.length; i++) {
+            (uint256 binAmountX, uint256 binAmountY) = _burnBin(ids[i], amounts[i]);
+            amountX += binAmountX;
+            amountY += binAmountY;
+        }
+        if (amountX > 0) {
+            IERC20(tokenX).safeTransfer(to, amountX);
+        }
+        if (amountY > 0) {
+            IERC20(tokenY).safeTransfer(to, amountY);
+        }
+    }
+
+    function setApprovalForAll(address sender, bool approved) external {
+        isApprovedForAll[msg.sender][sender] = approved;
+        emit ApprovalForAll(msg.sender, sender, approved);
+    }
+
+    function safeTransferFrom(
+        address from,
+        address to,
+        uint256 id,
+        uint256 amount
+    ) external {
+        uint256[] memory ids = new uint256[](1);
+        uint256[] memory amounts = new uint256[](1);
+        (ids[0], amounts[0]) = (id, amount);
+        _transferBatch(from, to, ids, amounts);
+    }
+
+    function safeBatchTransferFrom(
+        address from,
+        address to,
+        uint256[] memory ids,
+        uint256[] memory amounts
+    ) external {
+        _transferBatch(from, to, ids, amounts);
+    }
+
+    function _transferBatch(
+        address from,
+        address to,
+        uint256[] memory ids,
+        uint256[] memory amounts
+    ) internal {
+        require(from == msg.sender || isApprovedForAll[from][msg.sender], "Not approved");
+        require(ids.length == amounts.length, "Wrong lengths");
+        for (uint256 i; i < ids.length; i++) {
+            _cacheFees(from, ids[i]);
+            _cacheFees(to, ids[i]);
+            balanceOf[from][ids[i]] -= amounts[i];
+            balanceOf[to][ids[i]] += amounts[i];
+        }
+        emit TransferBatch(msg.sender, from, to, ids, amounts);
+    }
+
+    function _swapInBin(
+        ILBPair.FeeParameters memory _fp,
+        uint256 id,
+        bool swapForY,
+        uint256 amountIn
+    ) internal returns (uint256 amountInUsed, uint256 amountOutOfBin) {
+        Bin storage bin = bins[id];
+        uint256 price = BinHelper.getPriceFromId(id, _fp.binStep);
+        uint256 reserve = swapForY ? bin.reserveY : bin.reserveX;
+        uint256 maxAmountInToBin = swapForY
+            ? reserve.shiftDivRoundUp(Constants.SCALE_OFFSET, price)
+            : price.mulShiftRoundUp(reserve, Constants.SCALE_OFFSET);
+        _updateVolatilityAccumulated(_fp, id);
+        uint256 fees = _getFeeAmount(_fp, maxAmountInToBin);
+        uint256 amountInToBin;
+        if (maxAmountInToBin + fees <= amountIn) {
+            amountInToBin = maxAmountInToBin;
+            amountOutOfBin = reserve;
+        } else {
+            fees = (amountIn * _getTotalFee(_fp) + Constants.PRECISION - 1) / Constants.PRECISION;
+            amountInToBin = amountIn - fees;
+            amountOutOfBin = swapForY
+                ? price.mulShiftRoundDown(amountInToBin, Constants.SCALE_OFFSET)
+                : amountInToBin.shiftDivRoundDown(Constants.SCALE_OFFSET, price);
+            if (amountOutOfBin > reserve) {
+                amountOutOfBin = reserve;
+            }
+        }
+        if (amountInToBin == 0) {
+            return (0, 0);
+        }
+        _addFees(id, _fp, fees, swapForY);
+        if (swapForY) {
+            (bin.reserveX, bin.reserveY) = (bin.reserveX + amountInToBin, bin.reserveY - amountOutOfBin);
+            (reserveX, reserveY) = (reserveX + amountInToBin, reserveY - amountOutOfBin);
+        } else {
+            (bin.reserveX, bin.reserveY) = (bin.reserveX - amountOutOfBin, bin.reserveY + amountInToBin);
+            (reserveX, reserveY) = (reserveX - amountOutOfBin, reserveY + amountInToBin);
+        }
+        amountInUsed = amountInToBin + fees;
+    }
+
+    function _mintBin(
+        uint256 id,
+        uint256 amountX,
+        uint256 amountY,
+        address to
+    )
+        internal
+        returns (
+            uint256 liquidity,
+            uint256,
+            uint256
+        )
+    {
+        uint256 price = BinHelper.getPriceFromId(id, fp.binStep);
+        if (id >= activeId) {
+            if (id == activeId) {
+                (amountX, amountY) = _chargeCompositionFee(id, price, amountX, amountY);
+            } else {
+                require(amountY == 0, "Composition factor flawed");
+            }
+        } else {
+            require(amountX == 0, "Composition factor flawed");
+        }
+        liquidity = price.mulShiftRoundDown(amountX, Constants.SCALE_OFFSET) + amountY;
+        require(liquidity > 0, "Insufficient liquidity minted");
+        Bin storage bin = bins[id];
+        if (bin.reserveX == 0 && bin.reserveY == 0) {
+            tree.addToTree(id);
+        }
+        (bin.reserveX, bin.reserveY) = (bin.reserveX + amountX, bin.reserveY + amountY);
+        (reserveX, reserveY) = (reserveX + amountX, reserveY + amountY);
+        _cacheFees(to, id);
+        balanceOf[to][id] += liquidity;
+        totalSupply[id] += liquidity;
+        return (liquidity, amountX, amountY);
+    }
+
+    /// @dev Deposits in the active bin pay a fee on the part that changes its composition
+    function _chargeCompositionFee(
+        uint256 id,
+        uint256 price,
+        uint256 amountX,
+        uint256 amountY
+    ) internal returns (uint256, uint256) {
+        ILBPair.FeeParameters memory _fp = fp;
+        _updateVariableFeeParameters(_fp, id);
+        (uint256 receivedX, uint256 receivedY) = _getReceivedAmounts(id, price, amountX, amountY);
+        if (amountX > receivedX) {
+            uint256 fees = _getFeeAmountForC(_fp, amountX - receivedX);
+            amountX -= fees;
+            _addFees(id, _fp, fees, true);
+        } else if (amountY > receivedY) {
+            uint256 fees = _getFeeAmountForC(_fp, amountY - receivedY);
+            amountY -= fees;
+            _addFees(id, _fp, fees, false);
+        }
+        return (amountX, amountY);
+    }
+
+    /// @dev What the deposit would be worth once added to the bin
+    function _getReceivedAmounts(
+        uint256 id,
+        uint256 price,
+        uint256 amountX,
+        uint256 amountY
+    ) internal view returns (uint256 receivedX, uint256 receivedY) {
+        uint256 userL = price.mulShiftRoundDown(amountX, Constants.SCALE_OFFSET) + amountY;
+        uint256 supply = totalSupply[id] + userL;
+        receivedX = (userL * (bins[id].reserveX + amountX)) / supply;
+        receivedY = (userL * (bins[id].reserveY + amountY)) / supply;
+    }
+
+    function _burnBin(uint256 id, uint256 amount) internal returns (uint256 amountX, uint256 amountY) {
+        Bin storage bin = bins[id];
+        uint256 supply = totalSupply[id];
+        amountX = amount.mulDivRoundDown(bin.reserveX, supply);
+        amountY = amount.mulDivRoundDown(bin.reserveY, supply);
+        _cacheFees(address(this), id);
+        balanceOf[address(this)][id] -= amount;
+        totalSupply[id] = supply - amount;
+        (bin.reserveX, bin.reserveY) = (bin.reserveX - amountX, bin.reserveY - amountY);
+        (reserveX, reserveY) = (reserveX - amountX, reserveY - amountY);
+        if (bin.reserveX == 0 && bin.reserveY == 0) {
+            tree.removeFromTree(id);
+        }
+    }
+
+    /// @dev Splits the fees between the protocol and the receipts of the bin
+    function _addFees(
+        uint256 id,
+        ILBPair.FeeParameters memory _fp,
+        uint256 fees,
+        bool isTokenX
+    ) internal {
+        uint256 protocolFees = (fees * _fp.protocolShare) / Constants.BASIS_POINT_MAX;
+        uint256 supply = totalSupply[id];
+        uint256 perShare = supply == 0 ? 0 : ((fees - protocolFees) << Constants.SCALE_OFFSET) / supply;
+        if (isTokenX) {
+            feesX += fees;
+            protocolFeesX += protocolFees;
+            bins[id].accTokenXPerShare += perShare;
+        } else {
+            feesY += fees;
+            protocolFeesY += protocolFees;
+            bins[id].accTokenYPerShare += perShare;
+        }
+    }
+
+    /// @dev Moves the fees earned by the current balance of the account to its unclaimed fees
+    function _cacheFees(address account, uint256 id) internal {
+        (uint256 pendingX, uint256 pendingY) = _getPendingFees(account, id);
+        ILBPair.Debts storage unclaimed = unclaimedFees[account];
+        (unclaimed.debtX, unclaimed.debtY) = (unclaimed.debtX + pendingX, unclaimed.debtY + pendingY);
+        debts[account][id] = ILBPair.Debts(bins[id].accTokenXPerShare, bins[id].accTokenYPerShare);
+    }
+
+    function _getPendingFees(address account, uint256 id)
+        internal
+        view
+        returns (uint256 amountX, uint256 amountY)
+    {
+        uint256 balance = balanceOf[account][id];
+        ILBPair.Debts memory debt = debts[account][id];
+        amountX = balance.mulShiftRoundDown(
+            bins[id].accTokenXPerShare - debt.debtX,
+            Constants.SCALE_OFFSET
+        );
+        amountY = balance.mulShiftRoundDown(
+            bins[id].accTokenYPerShare - debt.debtY,
+            Constants.SCALE_OFFSET
+        );
+    }
+
+    function _updateOracle() internal {
+        uint256 length = sampleTimestamps.length;
+        uint256 lastTimestamp = sampleTimestamps[length - 1];
+        if (block.timestamp > lastTimestamp) {
+            sampleCumulativeIds.push(
+                sampleCumulativeIds[length - 1] + activeId * (block.timestamp - lastTimestamp)
+            );
+            sampleTimestamps.push(block.timestamp);
+        }
+    }
+
+    function _getTotalFee(ILBPair.FeeParameters memory _fp) internal pure returns (uint256) {
+        uint256 baseFee = uint256(_fp.baseFactor) * _fp.binStep * 1e10;
+        uint256 prod = uint256(_fp.volatilityAccumulated) * _fp.binStep;
+        return baseFee + (prod * prod * _fp.variableFeeControl + 99) / 100;
+    }
+
+    /// @dev Fee to add on top of amount
+    function _getFeeAmount(ILBPair.FeeParameters memory _fp, uint256 amount)
+        internal
+        pure
+        returns (uint256)
+    {
+        uint256 fee = _getTotalFee(_fp);
+        uint256 denominator = Constants.PRECISION - fee;
+        return (amount * fee + denominator - 1) / denominator;
+    }
+
+    function _getFeeAmountForC(ILBPair.FeeParameters memory _fp, uint256 amount)
+        internal
+        pure
+        returns (uint256)
+    {
+        uint256 fee = _getTotalFee(_fp);
+        return (amount * fee * (fee + Constants.PRECISION)) / (Constants.PRECISION * Constants.PRECISION);
+    }
+
+    function _updateVariableFeeParameters(ILBPair.FeeParameters memory _fp, uint256 id)
+        internal
+        view
+    {
+        uint256 deltaT = block.timestamp - _fp.time;
+        if (deltaT >= _fp.filterPeriod) {
+            _fp.indexRef = uint24(id);
+            _fp.volatilityReference = deltaT < _fp.decayPeriod
+                ? uint24((uint256(_fp.volatilityAccumulated) * _fp.reductionFactor) / Constants.BASIS_POINT_MAX)
+                : 0;
+        }
+    }
+
+    function _updateVolatilityAccumulated(ILBPair.FeeParameters memory _fp, uint256 id)
+        internal
+        pure
+    {
+        uint256 deltaId = id > _fp.indexRef ? id - _fp.indexRef : _fp.indexRef - id;
+        uint256 volatilityAccumulated = _fp.volatilityReference + deltaId * Constants.BASIS_POINT_MAX;
+        _fp.volatilityAccumulated = uint24(
+            volatilityAccumulated > _fp.maxVolatilityAccumulated
+                ? _fp.maxVolatilityAccumulated
+                : volatilityAccumulated
+        );
+    }
+}
@@ -0,0 +1,131 @@
+// SPDX-License-Identifier: MIT
+pragma solidity ^0.8.0;
+
+import "@openzeppelin/contracts/token/ERC20/IERC20.sol";
+import "@openzeppelin/contracts/token/ERC20/utils/SafeERC20.sol";
+
+import "interfaces/ILBRouter.sol";
+import "./MockLBFactory.sol";
+
+/// @notice Router of MockLBPair, with the liquidity and swap functions used by the vault
+contract MockLBRouter {
+    using SafeERC20 for IERC20;
+
+    address public immutable factory;
+
+    constructor(address _factory) {
+        factory = _factory;
+    }
+
+    modifier ensure(uint256 deadline) {
+        require(block.timestamp <= deadline, "Deadline exceeded");
+        _;
+    }
+
+    function addLiquidity(ILBRouter.LiquidityParameters memory parameters)
+        external
+        ensure(parameters.deadline)
+        returns (uint256[] memory depositIds, uint256[] memory liquidityMinted)
+    {
+        MockLBPair pair = _getPair(parameters.tokenX, parameters.tokenY, parameters.binStep);
+        require(parameters.tokenX == pair.tokenX(), "Wrong token order");
+        require(
+            parameters.deltaIds.length == parameters.distributionX.length &&
+                parameters.deltaIds.length == parameters.distributionY.length,
+            "Wrong lengths"
+        );
+        (, , uint256 activeId) = pair.getReservesAndId();
+        require(
+            parameters.activeIdDesired + parameters.idSlippage >= activeId &&
+                activeId + parameters.idSlippage >= parameters.activeIdDesired,
+            "Id slippage caught"
+        );
+        depositIds = new uint256[](parameters.deltaIds.length);
+        for (uint256 i; i < depositIds.length; i++) {
+            depositIds[i] = uint256(int256(activeId) + parameters.deltaIds[i]);
+        }
+        IERC20(parameters.tokenX).safeTransferFrom(msg.sender, address(pair), parameters.amountX);
+        IERC20(parameters.tokenY).safeTransferFrom(msg.sender, address(pair), parameters.amountY);
+        uint256 amountXAdded;
+        uint256 amountYAdded;
+        (amountXAdded, amountYAdded, liquidityMinted) = pair.mint(
+            depositIds,
+            parameters.distributionX,
+            parameters.distributionY,
+            parameters.to
+        );
+        require(
+            amountXAdded >= parameters.amountXMin && amountYAdded >= parameters.amountYMin,
+            "Amount slippage caught"
+        );
+    }
+
+    function removeLiquidity(
+        address tokenX,
+        address tokenY,
+        uint16 binStep,
+        uint256 amountXMin,
+        uint256 amountYMin,
+        uint256[] memory ids,
+        uint256[] memory amounts,
+        address to,
+        uint256 deadline
+    ) external ensure(deadline) returns (uint256 amountX, uint256 amountY) {
+        MockLBPair pair = _getPair(tokenX, tokenY, binStep);
+        pair.safeBatchTransferFrom(msg.sender, address(pair), ids, amounts);
+        (amountX, amountY) = pair.burn(ids, amounts, to);
+        if (tokenX != pair.tokenX()) {
+            (amountX, amountY) = (amountY, amountX);
+        }
+        require(amountX >= amountXMin && amountY >= amountYMin, "Amount slippage caught");
+    }
+
+    function swapExactTokensForTokens(
+        uint256 amountIn,
+        uint256 amountOutMin,
+        uint256[] memory pairBinSteps,
+        address[] memory tokenPath,
+        address to,
+        uint256 deadline
+    ) external ensure(deadline) returns (uint256 amountOut) {
+        require(
+            pairBinSteps.length > 0 && pairBinSteps.length + 1 == tokenPath.length,
+            "Wrong lengths"
+        );
+        MockLBPair pair = _getPair(tokenPath[0], tokenPath[1], pairBinSteps[0]);
+        IERC20(tokenPath[0]).safeTransferFrom(msg.sender, address(pair), amountIn);
+        for (uint256 i; i < pairBinSteps.length; i++) {
+            // Each hop sends its output straight to the next pair
+            address recipient = to;
+            MockLBPair nextPair;
+            if (i + 1 < pairBinSteps.length) {
+                nextPair = _getPair(tokenPath[i + 1], tokenPath[i + 2], pairBinSteps[i + 1]);
+                recipient = address(nextPair);
+            }
+            amountOut = _swap(pair, tokenPath[i], recipient);
+            pair = nextPair;
+        }
+        require(amountOut >= amountOutMin, "Amount out too low");
+    }
+
+    function _swap(
+        MockLBPair pair,
+        address tokenIn,
+        address to
+    ) private returns (uint256) {
+        bool sentTokenY = tokenIn == pair.tokenY();
+        (uint256 amountXOut, uint256 amountYOut) = pair.swap(sentTokenY, to);
+        return sentTokenY ? amountXOut : amountYOut;
+    }
+
+    function _getPair(
+        address tokenA,
+        address tokenB,
+        uint256 binStep
+    ) private view returns (MockLBPair pair) {
+        pair = MockLBPair(
+            address(MockLBFactory(factory).getLBPairInformation(tokenA, tokenB, binStep).LBPair)
+        );
+        require(address(pair) != address(0), "Pair not found");
+    }
+}
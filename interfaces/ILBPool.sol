@@ -30,8 +30,12 @@ interface ILBPool {
 
     function CALLER_FEE() external view returns (uint256);
 
+    function DEFAULT_MAX_DEPOSITED_BINS() external view returns (uint256);
+
     function MANAGER_FEE() external view returns (uint256);
 
+    function MAX_DEPOSITED_BINS_CEILING() external view returns (uint256);
+
     function PRECISION() external view returns (uint256);
 
     function PROTOCOL_FEE() external view returns (uint256);
@@ -41,7 +45,8 @@ interface ILBPool {
         address _tokenY,
         uint256 _binStep,
         address _router,
-        address _receipt
+        address _pair,
+        address _viewHelper
     ) external;
 
     function addAllLiquidity(
@@ -60,12 +65,16 @@ interface ILBPool {
         bool respectRatio
     ) external;
 
+    function addLiquidityThreshold() external view returns (uint256);
+
     function allowance(address owner, address spender) external view returns (uint256);
 
     function approve(address spender, uint256 amount) external returns (bool);
 
     function balanceOf(address account) external view returns (uint256);
 
+    function binReceiptBalance(uint256 bin) external view returns (uint256);
+
     function binStep() external view returns (uint256);
 
     function receiptsManager() external view returns (address);
@@ -95,8 +104,14 @@ interface ILBPool {
 
     function decreaseAllowance(address spender, uint256 subtractedValue) external returns (bool);
 
+    function delayBetweenSwaps() external view returns (uint256);
+
     function deltaIds(uint256) external view returns (int256);
 
+    function deltaSwapSafeguard() external view returns (uint256);
+
+    function depositedBinsCount() external view returns (uint256);
+
     function deposit(uint256 amountX, uint256 amountY) external;
 
     function depositFor(
@@ -107,6 +122,13 @@ interface ILBPool {
 
     function depositThreshold() external view returns (uint256);
 
+    function executeIncrementalRebalance(
+        int256[] calldata ids,
+        uint256[] calldata distributionX,
+        uint256[] calldata distributionY,
+        bool respectRatio
+    ) external;
+
     function executeRebalance(
         int256[] calldata ids,
         uint256[] calldata distributionX,
@@ -118,6 +140,15 @@ interface ILBPool {
 
     function getAllReserves() external view returns (uint256 totalReserveX, uint256 totalReserveY);
 
+    function getAllReservesPage(uint256 cursor, uint256 maxBins)
+        external
+        view
+        returns (
+            uint256 totalReserveX,
+            uint256 totalReserveY,
+            uint256 nextCursor
+        );
+
     function getBalances() external view returns (uint256 tokenXbalance, uint256 tokenYBalance);
 
     function getDepositTokensForShares(uint256 amount, uint256 priceX)
@@ -137,6 +168,11 @@ interface ILBPool {
 
     function getDepositedBins() external view returns (uint256[] memory _depositedIds);
 
+    function getDepositedBinsPage(uint256 cursor, uint256 maxBins)
+        external
+        view
+        returns (uint256[] memory bins, uint256 nextCursor);
+
     function getHighestAndLowestBin() external view returns (uint256 highestBin, uint256 lowestBin);
 
     function getMaximumWithdrawalTokenXWithoutSwapping()
@@ -149,6 +185,8 @@ interface ILBPool {
         view
         returns (uint256 finalAmountX, uint256 finalAmountY);
 
+    function getNextDepositedBin(uint256 bin, bool lower) external view returns (uint256 nextBin);
+
     function getOraclePrice() external view returns (uint256 oraclePrice);
 
     function getPairInfos()
@@ -181,10 +219,26 @@ interface ILBPool {
 
     function harvest(address callerFeeRecipient) external;
 
+    function harvestInterval() external view returns (uint256);
+
+    function harvestPage(uint256 cursor, uint256 maxBins) external returns (uint256 nextCursor);
+
     function increaseAllowance(address spender, uint256 addedValue) external returns (bool);
 
+    function isDepositedBin(uint256 bin) external view returns (bool);
+
     function lastDepositedTime(address) external view returns (uint256);
 
+    function lastHarvest() external view returns (uint256);
+
+    function lastSwap() external view returns (uint256);
+
+    function maxDepositedBins() external view returns (uint256);
+
+    function migrateLayout() external;
+
+    function minHarvestValue() external view returns (uint256);
+
     function name() external view returns (string memory);
 
     function oracle() external view returns (address);
@@ -217,18 +271,32 @@ interface ILBPool {
 
     function setCallerFee(uint256 _value) external;
 
+    function setDelayBetweenSwaps(uint256 _value) external;
+
+    function setDeltaSwapSafeguard(uint256 _value) external;
+
     function setDepositThreshold(uint256 _value) external;
 
+    function setHarvestPolicy(uint256 interval, uint256 minValue) external;
+
     function setManagerFee(uint256 _value) external;
 
+    function setMaxDepositedBins(uint256 _value) external;
+
     function setOracle(address _oracle) external;
 
     function setProtocolFee(uint256 _value) external;
 
     function setProtocolFeeRecipient(address _value) external;
 
+    function setReceiptsManager(address _receiptsManager) external;
+
     function setStrategy(address _strategy) external;
 
+    function setSwapMaxValue(uint256 _value) external;
+
+    function setSwapMinimumThreshold(uint256 _value) external;
+
     function setSwapThreshold(uint256 _value) external;
 
     function setWithdrawalFee(uint256 delay, uint256 value) external;
@@ -241,10 +309,16 @@ interface ILBPool {
         uint256 amountOutMin
     ) external returns (uint256 amountOut);
 
+    function swapMaxValue() external view returns (uint256);
+
+    function swapMinimumThreshold() external view returns (uint256);
+
     function swapThreshold() external view returns (uint256);
 
     function symbol() external view returns (string memory);
 
+    function syncReceiptBalances(uint256[] calldata bins) external;
+
     function tokenX() external view returns (address);
 
     function tokenY() external view returns (address);
@@ -261,6 +335,8 @@ interface ILBPool {
 
     function transferOwnership(address newOwner) external;
 
+    function viewHelper() external view returns (address);
+
     function withdraw(
         uint256 amountX,
         uint256 amountY,
@@ -269,6 +345,10 @@ interface ILBPool {
 
     function withdrawAllLiquidity() external;
 
+    function withdrawAllLiquidityPage(uint256 cursor, uint256 maxBins)
+        external
+        returns (uint256 nextCursor);
+
     function withdrawLiquidity(uint256 amountX, uint256 amountY) external;
 
     function withdrawLiquidityFromBins(uint256[] calldata ids, uint256[] calldata amounts) external;
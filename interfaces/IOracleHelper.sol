@@ -6,17 +6,53 @@ interface IOracleHelper {
 
     function OUTPUT_DECIMALS() external view returns (uint8);
 
+    function feedScale(address token) external view returns (uint256);
+
+    function getPairPrice(
+        address pair,
+        uint256 twapPeriod,
+        uint256 binStep
+    ) external view returns (uint256);
+
     function getPrice(address token) external view returns (uint256);
 
     function getPriceOfXInYUnits(address tokenX, address tokenY) external view returns (uint256);
 
+    function getPricesOfXInYUnits(address[] calldata tokensX, address[] calldata tokensY)
+        external
+        view
+        returns (uint256[] memory prices);
+
+    function isStable(address token) external view returns (bool);
+
     function owner() external view returns (address);
 
+    function pairSources(address tokenX, address tokenY)
+        external
+        view
+        returns (
+            address pair,
+            uint32 twapPeriod,
+            uint16 binStep,
+            bool inverted
+        );
+
     function renounceOwnership() external;
 
     function setFeedForToken(address token, address feed) external;
 
+    function setIsStable(address token, bool state) external;
+
+    function setPairSource(
+        address tokenX,
+        address tokenY,
+        address pair,
+        uint32 twapPeriod
+    ) external;
+
     function tokenToFeed(address) external view returns (address);
 
+    function tokenUnit(address token) external view returns (uint256);
+
     function transferOwnership(address newOwner) external;
 }
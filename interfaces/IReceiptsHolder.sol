@@ -4,6 +4,7 @@ pragma solidity 0.8.7;
 import "interfaces/ILBRouter.sol";
 
 interface IReceiptsHolder {
+    event FeeAccrued(address indexed user, uint256 amount, address token);
     event FeeDistributed(address indexed user, uint256 amount, address token);
     event Harvest(address indexed user, uint256 amountX, uint256 amountY);
     event OwnershipTransferred(address indexed previousOwner, address indexed newOwner);
@@ -19,6 +20,7 @@ interface IReceiptsHolder {
     function PROTOCOL_FEE() external view returns (uint256);
 
     function __ReceiptsHolder_init(
+        address _vault,
         address _tokenX,
         address _tokenY,
         uint256 _binStep,
@@ -29,10 +31,16 @@ interface IReceiptsHolder {
 
     function addLiquidity(ILBRouter.LiquidityParameters calldata parameters)
         external
-        returns (uint256[] memory depositIds);
+        returns (uint256[] memory depositIds, uint256[] memory liquidityMinted);
 
     function binStep() external view returns (uint256);
 
+    function claimFees(address[] calldata recipients) external;
+
+    function claimableFees(address recipient, address token) external view returns (uint256);
+
+    function getHarvestFee() external view returns (uint256);
+
     function getReserveForBin(uint256 bin)
         external
         view
@@ -76,6 +84,8 @@ interface IReceiptsHolder {
 
     function tokenY() external view returns (address);
 
+    function totalClaimableFees(address token) external view returns (uint256);
+
     function transferOwnership(address newOwner) external;
 
     function vault() external view returns (address);
@@ -6,12 +6,7 @@ interface IStrategy {
     event Paused(address account);
     event Unpaused(address account);
 
-    function __Strategy_init_(
-        address _tokenX,
-        address _tokenY,
-        uint256 _binStep,
-        address _vault
-    ) external;
+    function __Strategy_init_(address _vault) external;
 
     function _validateParams(
         int256[] calldata _deltaIds,
@@ -36,6 +31,15 @@ interface IStrategy {
         bool respectRatio
     ) external;
 
+    function addLiquidityWithShape(
+        uint256 amountX,
+        uint256 amountY,
+        uint8 shape,
+        int256 centre,
+        uint256 radius,
+        bool respectRatio
+    ) external;
+
     function binStep() external view returns (uint256);
 
     function customRebalance(
@@ -49,18 +53,47 @@ interface IStrategy {
         bool respectRatio
     ) external;
 
+    function customRebalanceWithShape(
+        uint256[] calldata binsToWithdraw,
+        uint256[] calldata amountsToWithdraw,
+        uint256 swapAmount,
+        uint256 amountOutMin,
+        address swapToken,
+        uint8 shape,
+        int256 centre,
+        uint256 radius,
+        bool respectRatio
+    ) external;
+
     function deltaIds(uint256) external view returns (int256);
 
     function distributionX(uint256) external view returns (uint256);
 
     function distributionY(uint256) external view returns (uint256);
 
+    function executeIncrementalRebalance(bool respectRatio) external;
+
     function executeRebalance(bool respectRatio) external;
 
+    function getParams()
+        external
+        view
+        returns (
+            int256[] memory _deltaIds,
+            uint256[] memory _distributionX,
+            uint256[] memory _distributionY
+        );
+
+    function keeper() external view returns (address);
+
     function manager() external view returns (address);
 
+    function migrateLayout() external;
+
     function owner() external view returns (address);
 
+    function paramsLength() external view returns (uint256);
+
     function paused() external view returns (bool);
 
     function rebalanceWithCustomWithdrawal(
@@ -73,6 +106,8 @@ interface IStrategy {
 
     function setCallerFee(uint256 value) external;
 
+    function setKeeper(address newKeeper) external;
+
     function setManager(address newManager) external;
 
     function setManagerFee(uint256 value) external;
@@ -85,6 +120,14 @@ interface IStrategy {
         bool respectRatio
     ) external;
 
+    function setShapeParams(
+        uint8 shape,
+        int256 centre,
+        uint256 radius,
+        bool _executeRebalance,
+        bool respectRatio
+    ) external;
+
     function swap(
         address _for,
         uint256 amountIn,
@@ -101,6 +144,10 @@ interface IStrategy {
 
     function withdrawAllLiquidity() external;
 
+    function withdrawAllLiquidityPage(uint256 cursor, uint256 maxBins)
+        external
+        returns (uint256 nextCursor);
+
     function withdrawLiquidity(uint256 amountX, uint256 amountY) external;
 
     function withdrawLiquidityFromBins(uint256[] calldata ids, uint256[] calldata amounts) external;
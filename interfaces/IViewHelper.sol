@@ -2,6 +2,49 @@
 pragma solidity 0.8.7;
 
 interface IViewHelper {
+    /// @dev Deposited bins of a vault, sorted by ascending id, with the reserves and receipt tokens it owns in each
+    struct BinsSnapshot {
+        uint256 activeId;
+        uint256[] bins;
+        uint256[] reservesX;
+        uint256[] reservesY;
+        uint256[] receiptBalances;
+    }
+
+    /// @dev Receipt tokens to burn and liquidity to add to move the deposited bins to a new shape
+    struct RebalancePlan {
+        uint256[] removedIds;
+        uint256[] removedAmounts;
+        int256[] addedDeltaIds;
+        uint256[] addedDistributionX;
+        uint256[] addedDistributionY;
+        uint256 amountX;
+        uint256 amountY;
+    }
+
+    /// @dev State of a vault for monitoring, the per-bin arrays follow its deposited bins in ascending order
+    struct VaultSnapshot {
+        address vault;
+        address pair;
+        uint256 activeId;
+        // 0 when the oracle reverts
+        uint256 oraclePrice;
+        uint256 activeBinPrice;
+        uint256 balanceX;
+        uint256 balanceY;
+        uint256 totalSupply;
+        uint256[] bins;
+        uint256[] receiptBalances;
+        uint256[] reservesX;
+        uint256[] reservesY;
+        uint256[] pendingFeesX;
+        uint256[] pendingFeesY;
+        uint256 managerFee;
+        uint256 callerFee;
+        uint256 protocolFee;
+        address protocolFeeRecipient;
+    }
+
     event OwnershipTransferred(address indexed previousOwner, address indexed newOwner);
 
     function __ViewHelper_init() external;
@@ -62,12 +105,39 @@ interface IViewHelper {
             uint256[] memory finalDistributionY
         );
 
+    function computeIncrementalRebalance(
+        BinsSnapshot calldata snapshot,
+        uint256 balanceX,
+        uint256 balanceY,
+        int256[] calldata _deltaIds,
+        uint256[] calldata _distributionX,
+        uint256[] calldata _distributionY
+    ) external pure returns (RebalancePlan memory plan);
+
     function computeWithdrawAmountsFromActiveBin(
         uint256 amountX,
         uint256 amountY,
         uint256 activeId
     ) external view returns (uint256 finalAmount, uint256 amountOtherToken);
 
+    function computeWithdrawalPlan(
+        uint256 amountX,
+        uint256 amountY,
+        uint256 activeId,
+        uint256[] calldata bins,
+        uint256[] calldata reservesX,
+        uint256[] calldata reservesY,
+        uint256[] calldata receiptBalances
+    )
+        external
+        pure
+        returns (uint256[] memory ids, uint256[] memory amounts);
+
+    function getDepositTokensForSharesBatch(address vault, uint256[] calldata shares)
+        external
+        view
+        returns (uint256[] memory valuesX, uint256[] memory valuesY);
+
     function getDepositTokensXForShares(
         uint256 amount,
         uint256 priceX,
@@ -90,6 +160,16 @@ interface IViewHelper {
         view
         returns (uint256 finalAmountX, uint256 finalAmountY);
 
+    function getMaximumWithdrawalsTokenXWithoutSwapping(address vault, address[] calldata users)
+        external
+        view
+        returns (uint256[] memory amountsX, uint256[] memory amountsY);
+
+    function getMaximumWithdrawalsTokenYWithoutSwapping(address vault, address[] calldata users)
+        external
+        view
+        returns (uint256[] memory amountsX, uint256[] memory amountsY);
+
     function getPriceFromBin(uint256 activeId, uint256 binStep)
         external
         view
@@ -108,6 +188,42 @@ interface IViewHelper {
             uint256 receiptBalance
         );
 
+    function getReservesForBins(
+        address pair,
+        uint256[] calldata bins,
+        address holder
+    )
+        external
+        view
+        returns (
+            uint256[] memory reservesX,
+            uint256[] memory reservesY,
+            uint256[] memory receiptBalances,
+            uint256 totalReserveX,
+            uint256 totalReserveY
+        );
+
+    function getReservesForReceipts(
+        address pair,
+        uint256[] calldata bins,
+        uint256[] calldata receiptBalances
+    )
+        external
+        view
+        returns (
+            uint256[] memory reservesX,
+            uint256[] memory reservesY,
+            uint256 totalReserveX,
+            uint256 totalReserveY
+        );
+
+    function getVaultSnapshot(address vault) external view returns (VaultSnapshot memory snapshot);
+
+    function getVaultSnapshots(address[] calldata vaults)
+        external
+        view
+        returns (VaultSnapshot[] memory snapshots);
+
     function owner() external view returns (address);
 
     function renounceOwnership() external;
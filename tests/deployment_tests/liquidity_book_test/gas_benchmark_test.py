@@ -0,0 +1,507 @@
+import math
+import random
+import time
+
+import pytest
+from brownie import ZERO_ADDRESS, BinHelperMock, accounts, chain, interface
+from main_test import move_active_bin
+from no_external_test import (
+    ADD_ALL_LIQUIDITY, HARVEST, REBALANCE, SNAPSHOT_FIELDS, deploy_pool_factory, deploy_strategy_controller
+)
+from py_vector.common import HOUR
+from py_vector.common.misc import of
+from py_vector.vector.mainnet import DeploymentMap
+from tests.helpers import bin_math
+
+
+TOTAL_WEIGHT = 10**18
+BIN_COUNTS = [1, 10, 25, 49]
+
+
+@pytest.fixture(scope="module")
+def view_helper(pool_contracts):
+    return interface.IViewHelper(pool_contracts.vault.viewHelper())
+
+
+def deposit_user(amountA, amountB, tokenX, tokenY, user_params, vault):
+    tokenX.approve(vault, amountA, user_params)
+    tokenY.approve(vault, amountB, user_params)
+    return vault.deposit(amountA, amountB, user_params)
+
+
+def spread_shape(bins):
+    # Uniform shape over `bins` bins around the active bin, X above and Y below, both in the active bin
+    delta_ids = list(range(-(bins // 2), bins - bins // 2))
+    bins_X = len([delta for delta in delta_ids if delta >= 0])
+    bins_Y = len([delta for delta in delta_ids if delta <= 0])
+    distribution_X = [TOTAL_WEIGHT // bins_X if delta >= 0 else 0 for delta in delta_ids]
+    distribution_Y = [TOTAL_WEIGHT // bins_Y if delta <= 0 else 0 for delta in delta_ids]
+    return delta_ids, distribution_X, distribution_Y
+
+
+def setup_spread_liquidity(deployment, pool_contracts, user, strategist, bins):
+    strategy = pool_contracts.strategy
+    vault = pool_contracts.vault
+    tokenX, tokenY = deployment.get_tokens_for_joe_lb(pool_contracts)
+    deposit_user(10 * of * tokenX, 10 * of * tokenY, tokenX, tokenY, {"from": user}, vault)
+    strategy.setParams(*spread_shape(bins), False, False, {"from": strategist})
+    strategy.addAllLiquidity(False, {"from": strategist})
+    assert vault.depositedBinsCount() == bins
+
+
+@pytest.mark.parametrize("bins", BIN_COUNTS)
+def test_gas_withdraw_across_bins(
+    deployment: DeploymentMap, user1, strategist, pool_contracts, view_helper, bins
+):
+    vault = pool_contracts.vault
+    setup_spread_liquidity(deployment, pool_contracts, user1, strategist, bins)
+    amountX, amountY = view_helper.getMaximumWithdrawalTokenYWithoutSwapping(vault, user1)
+    tx = vault.withdraw(amountX // 2, amountY // 2, False, {"from": user1})
+    print(f"withdraw over {bins} deposited bins: {tx.gas_used} gas")
+    assert tx.status == 1
+
+
+@pytest.mark.parametrize("bins", BIN_COUNTS)
+def test_gas_withdraw_by_shares_across_bins(
+    deployment: DeploymentMap, user1, strategist, pool_contracts, bins
+):
+    vault = pool_contracts.vault
+    setup_spread_liquidity(deployment, pool_contracts, user1, strategist, bins)
+    tx = vault.withdrawByShares(vault.balanceOf(user1) // 2, False, {"from": user1})
+    print(f"withdrawByShares over {bins} deposited bins: {tx.gas_used} gas")
+    assert tx.status == 1
+
+
+@pytest.mark.parametrize("bins", BIN_COUNTS)
+def test_gas_highest_and_lowest_bin(
+    deployment: DeploymentMap, user1, strategist, pool_contracts, bins
+):
+    vault = pool_contracts.vault
+    setup_spread_liquidity(deployment, pool_contracts, user1, strategist, bins)
+    gas = vault.getHighestAndLowestBin.estimate_gas()
+    print(f"getHighestAndLowestBin with {bins} deposited bins: {gas} gas")
+    deposited_bins = vault.getDepositedBins()
+    assert vault.getHighestAndLowestBin() == (max(deposited_bins), min(deposited_bins))
+
+
+@pytest.mark.parametrize("bins", BIN_COUNTS)
+def test_gas_batched_reserves(
+    deployment: DeploymentMap, user1, strategist, pool_contracts, view_helper, bins
+):
+    vault = pool_contracts.vault
+    setup_spread_liquidity(deployment, pool_contracts, user1, strategist, bins)
+    receipts_holder = interface.IReceiptsHolder(vault.receiptsManager())
+    deposited_bins = vault.getDepositedBins()
+    # Base transaction cost is only paid once by the batched read, remove it from each per-bin estimate
+    per_bin_gas = 21_000 + sum(
+        receipts_holder.getReserveForBin.estimate_gas(bin) - 21_000 for bin in deposited_bins
+    )
+    batched_gas = view_helper.getReservesForBins.estimate_gas(
+        vault.pair(), deposited_bins, receipts_holder
+    )
+    print(f"reserves of {bins} bins: {per_bin_gas} gas per bin, {batched_gas} gas batched")
+    (reserves_X, reserves_Y, _, total_X, total_Y) = view_helper.getReservesForBins(
+        vault.pair(), deposited_bins, receipts_holder
+    )
+    for bin, reserve_X, reserve_Y in zip(deposited_bins, reserves_X, reserves_Y):
+        assert vault.getReserveForBin(bin) == (reserve_X, reserve_Y)
+    assert vault.getAllReserves() == (total_X, total_Y)
+    if bins > 1:
+        assert batched_gas < per_bin_gas
+
+
+def test_gas_user_actions(deployment: DeploymentMap, user1, strategist, pool_contracts, view_helper):
+    vault = pool_contracts.vault
+    strategy = pool_contracts.strategy
+    tokenX, tokenY = deployment.get_tokens_for_joe_lb(pool_contracts)
+    deploy_parameters = deployment.ACCOUNTS.deployer.parameters()
+    vault.setDepositThreshold(10**16, deploy_parameters)
+    vault.setWithdrawalFee(HOUR, 10, deploy_parameters)
+    setup_spread_liquidity(deployment, pool_contracts, user1, strategist, 10)
+    tx = deposit_user(of * tokenX, of * tokenY, tokenX, tokenY, {"from": user1}, vault)
+    print(f"deposit with the price check: {tx.gas_used} gas")
+    assert tx.events["Deposit"]["user"] == user1
+    assert vault.lastDepositedTime(user1) == tx.timestamp
+
+    amountX, amountY = view_helper.getMaximumWithdrawalTokenYWithoutSwapping(vault, user1)
+    amountX, amountY = amountX // 10, amountY // 10
+    balances = tokenX.balanceOf(user1), tokenY.balanceOf(user1)
+    tx = vault.withdraw(amountX, amountY, False, {"from": user1})
+    print(f"withdraw with the withdrawal fee: {tx.gas_used} gas")
+    # Still inside the delay after the deposit, the 10 bps fee is kept by the vault
+    received = tokenX.balanceOf(user1) - balances[0], tokenY.balanceOf(user1) - balances[1]
+    for amount, amount_received in zip((amountX, amountY), received):
+        assert amount_received < amount
+        assert amount_received == pytest.approx(amount - amount * 10 // vault.PRECISION(), rel=1e-6)
+
+    vault.setSwapMinimumThreshold(10**20, deploy_parameters)
+    strategy.setMaxSlippage(200, deploy_parameters)
+    swap_amount = tokenY.balanceOf(vault) // 10
+    tx = strategy.swap(tokenX, swap_amount, strategy.expectedAmount(tokenX, swap_amount), {"from": strategist})
+    print(f"swap: {tx.gas_used} gas")
+    assert vault.lastSwap() == tx.timestamp
+    assert tx.events["SwapToken"]["inToken"] == tokenY
+    assert tx.events["SwapToken"]["inTokenAmount"] == swap_amount
+
+
+@pytest.mark.parametrize("users", [1, 10, 100])
+def test_gas_batched_user_views(
+    deployment: DeploymentMap, user1, strategist, pool_contracts, view_helper, users
+):
+    vault = pool_contracts.vault
+    setup_spread_liquidity(deployment, pool_contracts, user1, strategist, 10)
+    holders = [user1] * users
+    single_gas = view_helper.getMaximumWithdrawalTokenYWithoutSwapping.estimate_gas(vault, user1)
+    batched_gas = view_helper.getMaximumWithdrawalsTokenYWithoutSwapping.estimate_gas(vault, holders)
+    print(f"maximum withdrawals of {users} users: {single_gas * users} gas one by one, {batched_gas} gas batched")
+    if users > 1:
+        assert batched_gas < single_gas * users
+
+
+@pytest.mark.parametrize("bins", [1, 10, 49])
+def test_gas_vault_snapshot(deployment: DeploymentMap, user1, strategist, pool_contracts, view_helper, bins):
+    vault = pool_contracts.vault
+    setup_spread_liquidity(deployment, pool_contracts, user1, strategist, bins)
+    single_gas = view_helper.getVaultSnapshot.estimate_gas(vault)
+    print(f"getVaultSnapshot with {bins} deposited bins: {single_gas} gas")
+    batched_gas = view_helper.getVaultSnapshots.estimate_gas([vault] * 10)
+    print(f"getVaultSnapshots of 10 vaults with {bins} deposited bins: {batched_gas} gas")
+    snapshot = dict(zip(SNAPSHOT_FIELDS, view_helper.getVaultSnapshot(vault)))
+    assert list(snapshot["bins"]) == vault.getDepositedBins()
+    # The base cost of a call is only paid once for the whole fleet
+    assert batched_gas < single_gas * 10
+
+
+def test_gas_pool_factory(deployment: DeploymentMap, strategist, pool_contracts):
+    deploy_parameters = deployment.ACCOUNTS.deployer.parameters()
+    factory = deploy_pool_factory(deployment, pool_contracts.vault)
+    parameters = (
+        pool_contracts.vault.pair(), deploy_parameters["from"], strategist,
+        10**16, 10**16, 10**16, 10**17, 10**17, 10, 0, 0, 0,
+    )
+    tx = factory.createPool(parameters, deploy_parameters)
+    print(f"createPool: {tx.gas_used} gas in 1 transaction")
+    assert tx.status == 1
+
+
+def test_gas_strategy_controller(deployment: DeploymentMap, user1, strategist, pool_contracts):
+    strategist_params = {"from": strategist}
+    strategy = pool_contracts.strategy
+    vault = pool_contracts.vault
+    tokenX, tokenY = deployment.get_tokens_for_joe_lb(pool_contracts)
+    delta_ids, distribution_X, distribution_Y = spread_shape(10)
+    deposit_user(100 * of * tokenX, 100 * of * tokenY, tokenX, tokenY, {"from": user1}, vault)
+    strategy.setParams(delta_ids, distribution_X, distribution_Y, False, False, strategist_params)
+    strategy.addAllLiquidity(False, strategist_params)
+
+    separate = vault.harvest(strategist, strategist_params).gas_used
+    separate += strategy.executeRebalance(False, strategist_params).gas_used
+    separate += strategy.addAllLiquidity(False, strategist_params).gas_used
+
+    controller = deploy_strategy_controller(deployment, strategist)
+    strategy.setKeeper(controller, deployment.ACCOUNTS.deployer.parameters())
+    tx = controller.execute(
+        [(strategy, HARVEST, False), (strategy, REBALANCE, False), (strategy, ADD_ALL_LIQUIDITY, False)],
+        strategist_params,
+    )
+    assert tx.return_value == (True, True, True)
+    print(f"harvest + rebalance + addAllLiquidity: {separate} gas in 3 transactions, {tx.gas_used} gas batched")
+
+
+def legacy_price_from_id(id, bin_step):
+    # BinHelper.getPriceFromId before the early exit, squaring through the 20 bits of the exponent
+    scale = 1 << 128
+    mask = 2**256 - 1
+    real_id = id - 2**23
+    if real_id == 0:
+        return scale
+    # The base is above 1 so it is inverted, and so is the result
+    invert = real_id > 0
+    abs_y = abs(real_id)
+    base = mask // (scale + (bin_step << 128) // 10_000)
+    result = scale
+    for bit in range(20):
+        if abs_y & (1 << bit):
+            result = ((result * base) & mask) >> 128
+        base = ((base * base) & mask) >> 128
+    return mask // result if invert else result
+
+
+@pytest.fixture(scope="module")
+def bin_helper_mock():
+    return BinHelperMock.deploy({"from": accounts[0]})
+
+
+@pytest.mark.parametrize("bin_step", [1, 5, 10, 15, 20, 25, 50, 100])
+def test_gas_price_from_id_parity(bin_helper_mock, bin_step):
+    rng = random.Random(bin_step)
+    # Keeps the prices within the 128.128 range
+    max_real_id = min(2**20 - 1, int(88 / math.log(1 + bin_step / 10_000)))
+    ids = [2**23 + rng.choice([-1, 1]) * (rng.randint(0, max_real_id) >> rng.randint(0, 16)) for _ in range(100)]
+    ids += [2**23, 2**23 + 1, 2**23 - 1, 2**23 + max_real_id, 2**23 - max_real_id]
+    assert bin_helper_mock.getPricesFromIds(ids, bin_step) == tuple(legacy_price_from_id(id, bin_step) for id in ids)
+    for real_id in [1, 2**7, 2**11, 2**15, max_real_id]:
+        gas = bin_helper_mock.getPriceFromId.estimate_gas(2**23 - real_id, bin_step)
+        print(f"getPriceFromId {real_id} bins away with a {bin_step} bin step: {gas} gas")
+
+
+@pytest.mark.parametrize("bin_step", [1, 25, 100])
+def test_bin_math_parity(bin_helper_mock, bin_step):
+    rng = random.Random(bin_step)
+    max_real_id = min(2**20 - 1, int(88 / math.log(1 + bin_step / 10_000)))
+    ids = [2**23 + rng.randint(-max_real_id, max_real_id) for _ in range(50)]
+    prices = bin_math.get_prices_from_ids(ids, bin_step)
+    assert bin_helper_mock.getPricesFromIds(ids, bin_step) == tuple(prices)
+    assert prices == [bin_math.get_price_from_id(id, bin_step) for id in ids]
+    for price in prices[:10]:
+        assert bin_helper_mock.getIdFromPrice(price, bin_step) == bin_math.get_id_from_price(price, bin_step)
+        assert bin_helper_mock.log2(price) == bin_math.log2(price)
+    base = bin_math.get_bp_value(bin_step)
+    for y in [1, -1, 255, -4096, 2**19 - 1]:
+        if max_real_id >= abs(y):
+            assert bin_helper_mock.power(base, y) == bin_math.power(base, y)
+    for _ in range(10):
+        x, y, offset = rng.getrandbits(rng.randint(1, 128)), rng.getrandbits(128), rng.randint(0, 128)
+        denominator = rng.getrandbits(rng.randint(1, 200)) + 1
+        assert bin_helper_mock.mulShiftRoundDown(x, y, offset) == bin_math.mul_shift_round_down(x, y, offset)
+        assert bin_helper_mock.mulShiftRoundUp(x, y, offset) == bin_math.mul_shift_round_up(x, y, offset)
+        if (x << offset) // denominator < 2**256:
+            assert bin_helper_mock.shiftDivRoundDown(x, offset, denominator) == \
+                bin_math.shift_div_round_down(x, offset, denominator)
+            assert bin_helper_mock.shiftDivRoundUp(x, offset, denominator) == \
+                bin_math.shift_div_round_up(x, offset, denominator)
+
+
+@pytest.mark.parametrize("bin_step", [1, 25, 100])
+def test_bench_price_ladder(bin_step):
+    ids = range(2**23 - 5_000, 2**23 + 5_000)
+    start = time.perf_counter()
+    float_prices = [(1 + bin_step / 1e4) ** (id - 2**23) for id in ids]
+    float_time = time.perf_counter() - start
+    start = time.perf_counter()
+    single_prices = [bin_math.get_price_from_id(id, bin_step) for id in ids]
+    single_time = time.perf_counter() - start
+    start = time.perf_counter()
+    prices = bin_math.get_price_ladder(ids[0], len(ids), bin_step)
+    ladder_time = time.perf_counter() - start
+    assert prices == single_prices
+    drift = max(abs(float_price * bin_math.SCALE - price) / price for float_price, price in zip(float_prices, prices))
+    print(
+        f"{len(ids)} prices with a {bin_step} bin step: float {float_time * 1e3:.1f} ms, "
+        f"exact {single_time * 1e3:.1f} ms, exact ladder {ladder_time * 1e3:.1f} ms, float drift {drift:.2e}"
+    )
+
+
+def test_gas_oracle_price(deployment: DeploymentMap, pool_contracts):
+    oracle = interface.IOracleHelper(pool_contracts.vault.oracle())
+    tokenX, tokenY = deployment.get_tokens_for_joe_lb(pool_contracts)
+    single_gas = oracle.getPriceOfXInYUnits.estimate_gas(tokenX, tokenY)
+    print(f"getPriceOfXInYUnits: {single_gas} gas")
+    batched_gas = oracle.getPricesOfXInYUnits.estimate_gas([tokenX, tokenY], [tokenY, tokenX])
+    print(f"getPricesOfXInYUnits for 2 pairs: {batched_gas} gas")
+    assert oracle.getPricesOfXInYUnits([tokenX, tokenY], [tokenY, tokenX]) == [
+        oracle.getPriceOfXInYUnits(tokenX, tokenY), oracle.getPriceOfXInYUnits(tokenY, tokenX)
+    ]
+    assert batched_gas < 2 * single_gas
+
+    deploy_parameters = deployment.ACCOUNTS.deployer.parameters()
+    pair = pool_contracts.vault.pair()
+    interface.ILBPair(pair).increaseOracleLength(10, deploy_parameters)
+    chain.sleep(2 * HOUR)
+    chain.mine()
+    oracle.setPairSource(tokenX, tokenY, pair, HOUR, deploy_parameters)
+    gas = oracle.getPriceOfXInYUnits.estimate_gas(tokenX, tokenY)
+    print(f"getPriceOfXInYUnits from the pair over {HOUR} seconds: {gas} gas")
+    # Nothing traded over the period, the TWAP is the price of the active bin
+    assert oracle.getPriceOfXInYUnits(tokenX, tokenY) == pool_contracts.vault.getPriceFromActiveBin()
+    oracle.setPairSource(tokenX, tokenY, ZERO_ADDRESS, 0, deploy_parameters)
+
+
+@pytest.mark.parametrize("bin_delta", [10, 100, -100])
+def test_gas_withdraw_after_price_move(
+    deployment: DeploymentMap, user1, strategist, pool_contracts, view_helper, bin_delta
+):
+    vault = pool_contracts.vault
+    setup_spread_liquidity(deployment, pool_contracts, user1, strategist, 10)
+    move_active_bin(deployment, pool_contracts, bin_delta)
+    amountX, amountY = view_helper.getMaximumWithdrawalTokenYWithoutSwapping(vault, user1)
+    tx = vault.withdraw(amountX, amountY, False, {"from": user1})
+    print(f"withdraw of 10 deposited bins after a {bin_delta} bins move: {tx.gas_used} gas")
+    assert tx.status == 1
+
+
+@pytest.mark.parametrize("bins", BIN_COUNTS)
+def test_gas_deposit_across_bins(
+    deployment: DeploymentMap, user1, user2, strategist, pool_contracts, bins
+):
+    vault = pool_contracts.vault
+    tokenX, tokenY = deployment.get_tokens_for_joe_lb(pool_contracts)
+    setup_spread_liquidity(deployment, pool_contracts, user1, strategist, bins)
+    tx = deposit_user(of * tokenX, of * tokenY, tokenX, tokenY, {"from": user2}, vault)
+    print(f"deposit over {bins} deposited bins: {tx.gas_used} gas")
+    assert tx.status == 1
+    assert vault.balanceOf(user2) > 0
+
+
+@pytest.mark.parametrize("bins", [1, 10, 40])
+def test_gas_withdraw_touching_bins(
+    deployment: DeploymentMap, user1, strategist, pool_contracts, view_helper, bins
+):
+    # Withdrawing nearly everything makes the burn plan go through every deposited bin
+    vault = pool_contracts.vault
+    setup_spread_liquidity(deployment, pool_contracts, user1, strategist, bins)
+    amountX, amountY = view_helper.getMaximumWithdrawalTokenYWithoutSwapping(vault, user1)
+    tx = vault.withdraw(amountX * 99 // 100, amountY * 99 // 100, False, {"from": user1})
+    removed_ids = tx.events["LiquidityRemoved"]["ids"]
+    print(f"withdraw burning {len(removed_ids)} of {bins} deposited bins: {tx.gas_used} gas")
+    assert len(tx.events["LiquidityRemoved"]) == 1
+    assert len(removed_ids) == bins
+    for bin in vault.getDepositedBins():
+        assert vault.getReserveForBin(bin) != (0, 0)
+
+
+@pytest.mark.parametrize("incremental", [False, True])
+@pytest.mark.parametrize("bins", [10, 40])
+def test_gas_rebalance_after_shape_change(
+    deployment: DeploymentMap, user1, strategist, pool_contracts, bins, incremental
+):
+    # The lowest bin is dropped from the shape, the others keep their weights
+    strategy = pool_contracts.strategy
+    setup_spread_liquidity(deployment, pool_contracts, user1, strategist, bins)
+    delta_ids, distribution_X, distribution_Y = spread_shape(bins)
+    strategy.setParams(
+        delta_ids[1:], distribution_X[1:], distribution_Y[1:], False, False, {"from": strategist}
+    )
+    rebalance = strategy.executeIncrementalRebalance if incremental else strategy.executeRebalance
+    tx = rebalance(False, {"from": strategist})
+    mode = "incremental" if incremental else "full"
+    print(f"{mode} rebalance of {bins} bins after dropping one bin: {tx.gas_used} gas")
+    assert tx.status == 1
+
+
+@pytest.mark.parametrize("bins", [1, 10, 25])
+def test_gas_deposit_with_harvest(
+    deployment: DeploymentMap, user1, user2, strategist, pool_contracts, bins
+):
+    strategy = pool_contracts.strategy
+    vault = pool_contracts.vault
+    tokenX, tokenY = deployment.get_tokens_for_joe_lb(pool_contracts)
+    receipts_holder = interface.IReceiptsHolder(vault.receiptsManager())
+    setup_spread_liquidity(deployment, pool_contracts, user1, strategist, bins)
+    strategy.setCallerFee(400, {"from": strategist})
+    strategy.setManagerFee(400, {"from": strategist})
+    receipts_holder.setProtocolFee(400, deployment.ACCOUNTS.deployer.parameters())
+    receipts_holder.setProtocolFeeRecipient(strategist, deployment.ACCOUNTS.deployer.parameters())
+    # Swapping through the bins and back generates fees to harvest
+    (_, _, active_bin) = vault.getPairInfos()
+    _, reached_bin = move_active_bin(deployment, pool_contracts, bins)
+    move_active_bin(deployment, pool_contracts, active_bin - reached_bin)
+    tx = deposit_user(of * tokenX, of * tokenY, tokenX, tokenY, {"from": user2}, vault)
+    print(f"deposit with harvest over {bins} deposited bins: {tx.gas_used} gas")
+    assert tx.events["Harvest"][0]["amountX"] + tx.events["Harvest"][0]["amountY"] > 0
+    assert receipts_holder.claimableFees(user2, tokenX) + receipts_holder.claimableFees(user2, tokenY) > 0
+
+
+@pytest.mark.parametrize("bins", [1, 10, 25])
+def test_gas_deposit_with_harvest_policy(
+    deployment: DeploymentMap, user1, user2, strategist, pool_contracts, bins
+):
+    vault = pool_contracts.vault
+    tokenX, tokenY = deployment.get_tokens_for_joe_lb(pool_contracts)
+    setup_spread_liquidity(deployment, pool_contracts, user1, strategist, bins)
+    vault.setHarvestPolicy(3600, 0, deployment.ACCOUNTS.deployer.parameters())
+    deposit_user(of * tokenX, of * tokenY, tokenX, tokenY, {"from": user2}, vault)
+    last_harvest = vault.lastHarvest()
+    tx = deposit_user(of * tokenX, of * tokenY, tokenX, tokenY, {"from": user2}, vault)
+    print(f"deposit skipping the harvest over {bins} deposited bins: {tx.gas_used} gas")
+    assert vault.lastHarvest() == last_harvest
+
+
+@pytest.mark.parametrize("bins", BIN_COUNTS)
+def test_gas_set_params(strategist, pool_contracts, bins):
+    strategy = pool_contracts.strategy
+    tx = strategy.setParams(*spread_shape(bins), False, False, {"from": strategist})
+    print(f"setParams with {bins} bins: {tx.gas_used} gas")
+    gas = strategy.getParams.estimate_gas()
+    print(f"getParams with {bins} bins: {gas} gas")
+    assert strategy.getParams() == spread_shape(bins)
+
+
+@pytest.mark.parametrize("radius", [0, 5, 24])
+def test_gas_set_shape_params(strategist, pool_contracts, radius):
+    strategy = pool_contracts.strategy
+    strategy.setShapeParams(0, 0, radius, False, False, {"from": strategist})
+    params = strategy.getParams()
+    assert len(params[0]) == 2 * radius + 1
+    # Both rewrite the stored params as they are, only the calldata and the generation or validation differ
+    params_gas = strategy.setParams(*params, False, False, {"from": strategist}).gas_used
+    shape_gas = strategy.setShapeParams(0, 0, radius, False, False, {"from": strategist}).gas_used
+    print(f"{2 * radius + 1} bins: setShapeParams {shape_gas} gas, setParams {params_gas} gas")
+    assert strategy.getParams() == params
+    if radius == 24:
+        assert shape_gas < params_gas
+
+
+def setup_wide_liquidity(deployment, pool_contracts, user, strategist, bins, chunk=40):
+    # Adds tokenX over `bins` bins above the active bin, by chunks small enough for a single transaction
+    strategy = pool_contracts.strategy
+    vault = pool_contracts.vault
+    tokenX, tokenY = deployment.get_tokens_for_joe_lb(pool_contracts)
+    vault.setMaxDepositedBins(bins, deployment.ACCOUNTS.deployer.parameters())
+    deposit_user(10 * of * tokenX, 10 * of * tokenY, tokenX, tokenY, {"from": user}, vault)
+    amount_per_bin = tokenX.balanceOf(vault) // bins
+    for start in range(1, bins + 1, chunk):
+        delta_ids = list(range(start, min(start + chunk, bins + 1)))
+        strategy.addLiquidityWithCustomParams(
+            amount_per_bin * len(delta_ids),
+            0,
+            delta_ids,
+            [TOTAL_WEIGHT // len(delta_ids)] * len(delta_ids),
+            [0] * len(delta_ids),
+            False,
+            {"from": strategist},
+        )
+    assert vault.depositedBinsCount() == bins
+
+
+@pytest.mark.parametrize("bins", [25, 50, 100])
+def test_gas_paginated_operations(
+    deployment: DeploymentMap, user1, strategist, pool_contracts, bins
+):
+    page_size = 25
+    vault = pool_contracts.vault
+    strategy = pool_contracts.strategy
+    setup_wide_liquidity(deployment, pool_contracts, user1, strategist, bins)
+    reserves_gas = vault.getAllReservesPage.estimate_gas(0, page_size)
+    harvest_gas = vault.harvestPage(0, page_size, {"from": user1}).gas_used
+    withdraw_gas = []
+    while vault.depositedBinsCount() > 0:
+        withdraw_gas.append(strategy.withdrawAllLiquidityPage(0, page_size, {"from": strategist}).gas_used)
+    print(
+        f"pages of {page_size} out of {bins} bins: reserves {reserves_gas} gas, harvest {harvest_gas} gas, "
+        f"withdraw {max(withdraw_gas)} gas at most over {len(withdraw_gas)} pages"
+    )
+    assert len(withdraw_gas) == bins // page_size
+
+
+# Transaction gas the paths going through every deposited bin must stay under, well below the block gas limit
+ALL_BINS_GAS_BUDGET = 8_000_000
+
+
+def test_gas_all_bins_at_ceiling(deployment: DeploymentMap, user1, strategist, pool_contracts, view_helper):
+    vault = pool_contracts.vault
+    strategy = pool_contracts.strategy
+    tokenX, tokenY = deployment.get_tokens_for_joe_lb(pool_contracts)
+    bins = vault.MAX_DEPOSITED_BINS_CEILING()
+    setup_wide_liquidity(deployment, pool_contracts, user1, strategist, bins)
+    # The deposit harvests every bin and values them all
+    deposit_gas = deposit_user(of * tokenX, of * tokenY, tokenX, tokenY, {"from": user1}, vault).gas_used
+    amountX, amountY = view_helper.getMaximumWithdrawalTokenXWithoutSwapping(vault, user1)
+    withdraw_gas = vault.withdraw(amountX // 2, amountY // 2, False, {"from": user1}).gas_used
+    withdraw_all_gas = strategy.withdrawAllLiquidity({"from": strategist}).gas_used
+    print(
+        f"{bins} bins: deposit {deposit_gas} gas, withdraw {withdraw_gas} gas, "
+        f"withdrawAllLiquidity {withdraw_all_gas} gas"
+    )
+    assert vault.depositedBinsCount() == 0
+    assert max(deposit_gas, withdraw_gas, withdraw_all_gas) < ALL_BINS_GAS_BUDGET
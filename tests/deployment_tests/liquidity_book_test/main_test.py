@@ -1,7 +1,7 @@
 from sys import intern
 
 import pytest
-from brownie import ZERO_ADDRESS, ReceiptsHolder, Wei, accounts, chain, interface, multicall, reverts
+from brownie import ZERO_ADDRESS, ReceiptsHolder, Wei, accounts, chain, interface, reverts
 from brownie.project import new
 from py_vector.common import DAY, HOUR, YEAR
 from py_vector.common.misc import in_units, of
@@ -11,6 +11,9 @@ from py_vector.vector.mainnet import DeploymentMap, get_deployment
 from py_vector.vector.mainnet.deployment_map import JoeLBPool
 from pydantic.utils import ValueItems
 from pytest import approx
+from tests.helpers.bin_math import SCALE_OFFSET, get_price_from_id, mul_shift_round_down, shift_div_round_down
+from tests.helpers.lb_simulator import LBPairSimulator, LBPoolSimulator
+from tests.helpers.pair_reader import pair_reader
 
 
 BIN_ONE_FOR_ONE = 8_388_608  # 2**23
@@ -42,33 +45,27 @@ def set_dummy_strategy(strategy, strategist_params):
 
 
 def compute_value_based_on_active_bin_tokenX(user, deployment, pool_contracts):
-    pool = pool_contracts.pool_v2
     tokenX, tokenY = deployment.get_tokens_for_joe_lb(pool_contracts)
-    infos = pool.getReservesAndId()
-    active_bin = infos[2]
+    active_bin = pair_reader.get_active_id(pool_contracts.pool_v2)
     price = get_price_from_active_bin(active_bin, pool_contracts.bin_step)
     return (
         tokenX.balanceOf(user)
-        + int(tokenY.balanceOf(user) * price)
+        + mul_shift_round_down(price, tokenY.balanceOf(user), SCALE_OFFSET)
     )
 
 
 def compute_value_based_on_active_bin_tokenY(user, deployment, pool_contracts):
-    pool = pool_contracts.pool_v2
     tokenX, tokenY = deployment.get_tokens_for_joe_lb(pool_contracts)
-    infos = pool.getReservesAndId()
-    active_bin = infos[2]
+    active_bin = pair_reader.get_active_id(pool_contracts.pool_v2)
     price = get_price_from_active_bin(active_bin, pool_contracts.bin_step)
     return (
-        tokenX.balanceOf(user) // price
+        shift_div_round_down(tokenX.balanceOf(user), SCALE_OFFSET, price)
         + tokenY.balanceOf(user)
     )
 
 
 def get_active_bin(pool_contracts):
-    pool = pool_contracts.pool_v2
-    infos = pool.getReservesAndId()
-    return infos[2]
+    return pair_reader.get_active_id(pool_contracts.pool_v2)
 
 
 def move_active_bin(
@@ -81,28 +78,13 @@ def move_active_bin(
     if performing_account is None:
         performing_account = accounts[7]
     pool = pool_contracts.pool_v2
-    swap_size = 0
     is_toward_Y = bin_delta < 0
-    infos = pool.getReservesAndId()
-    reserve_to_buy = infos[int(is_toward_Y)]
-    active_bin = infos[2]
+    active_bin = pair_reader.get_active_id(pool)
     final_bin = active_bin + bin_delta
-    bins_to_query = list(range(active_bin, final_bin, -1 if is_toward_Y else 1))
-    reserves = get_reserves_for_bins(pool, bins_to_query + [final_bin])
-    for bin in bins_to_query:
-        reserve_to_buy = reserves[bin][int(is_toward_Y)]
-        price = get_price_from_active_bin(bin, pool_contracts.bin_step)
-        if not is_toward_Y:
-            swap_size += int(reserve_to_buy * price)
-        else:
-            swap_size += int(reserve_to_buy // price)
-
-    reserve_to_buy = reserves[final_bin][int(is_toward_Y)]
-    price = get_price_from_active_bin(final_bin, pool_contracts.bin_step)
-    if not is_toward_Y:
-        swap_size += int(reserve_to_buy * price * active_ratio)
-    else:
-        swap_size += int(reserve_to_buy * active_ratio // price)
+    # Sized on one snapshot of the crossed bins with the pair's own math, so a single swap lands on final_bin
+    pair = LBPairSimulator.from_pair(pool, range(min(active_bin, final_bin), max(active_bin, final_bin) + 1))
+    pair.timestamp = chain.time()
+    swap_size = pair.get_amount_in_to_reach(final_bin, active_ratio)
     tokenX, tokenY = deployment.get_tokens_for_joe_lb(pool_contracts)
     token = tokenX if not is_toward_Y else tokenY
     other_token = tokenX if is_toward_Y else tokenY
@@ -120,21 +102,18 @@ def move_active_bin(
         chain.time() + HOUR,
         {"from": performing_account},
     )
-    infos = pool.getReservesAndId()
-    reached_bin = infos[2]
+    reached_bin = pair_reader.get_active_id(pool)
 
     return swap_size, reached_bin
 
 
 def get_reserves_for_bins(pair, bins):
-    # with multicall(block_identifier=chain[-1]["number"]):
-    reserves = [pair.getBin(bin) for bin in bins]
-    return {bin_id: reserve for bin_id, reserve in zip(bins, reserves)}
+    return pair_reader.get_reserves_for_bins(pair, bins)
 
 
 def get_price_from_active_bin(bin_id, bin_step):
-    relative_id = bin_id - BIN_ONE_FOR_ONE
-    return (1 + (bin_step / 1e4)) ** relative_id
+    # Price of the bin as a 128.128 number, exactly as BinHelper.getPriceFromId
+    return get_price_from_id(bin_id, bin_step)
 
 
 def normalized_value(token_X_qty, token_Y_qty, price_of_X_in_Y):
@@ -151,7 +130,7 @@ def test_move_active(deployment, pool_contracts):
     new_reserves = pool.getBin(reached_bin)
     vault = pool_contracts.vault
     price = vault.getPriceFromActiveBin()
-    assert pool.getReservesAndId()[2] == reached_bin
+    assert pool.getReservesAndId()[2] == reached_bin == final_bin
     assert approx(new_reserves[1] / normalized_value(*new_reserves[:2], price), abs=0.02) == 0.5
     assert get_reserves_for_bins(pool, [active_bin])[active_bin][int(is_down)] == 0
     _, reached_bin = move_active_bin(deployment, pool_contracts, active_bin - reached_bin)
@@ -159,6 +138,35 @@ def test_move_active(deployment, pool_contracts):
     assert pool.getReservesAndId()[2] == active_bin
 
 
+def test_pair_reader(deployment, pool_contracts):
+    pool = pool_contracts.pool_v2
+    active_bin = get_active_bin(pool_contracts)
+    bins = list(range(active_bin - 5, active_bin + 6))
+    reserves_and_id, reserves = pair_reader.read(pool, bins)
+    assert reserves_and_id == pool.getReservesAndId()
+    assert reserves == {bin: pool.getBin(bin) for bin in bins}
+    # Served from the cache while the chain stays on the same block
+    assert pair_reader.read(pool, bins[3:]) == (reserves_and_id, {bin: reserves[bin] for bin in bins[3:]})
+    _, reached_bin = move_active_bin(deployment, pool_contracts, 2)
+    assert reached_bin == pool.getReservesAndId()[2] != active_bin
+    assert pair_reader.get_reserves_for_bins(pool, bins) == {bin: pool.getBin(bin) for bin in bins}
+
+
+@pytest.mark.parametrize("bin_delta", [-40, -1, 2, 25])
+@pytest.mark.parametrize("active_ratio", [0.1, 0.9])
+def test_move_active_exact(deployment, pool_contracts, bin_delta, active_ratio):
+    pool = pool_contracts.pool_v2
+    active_bin = get_active_bin(pool_contracts)
+    final_bin = active_bin + bin_delta
+    reserve_before = pool.getBin(final_bin)[int(bin_delta < 0)]
+    _, reached_bin = move_active_bin(deployment, pool_contracts, bin_delta, active_ratio=active_ratio)
+    assert reached_bin == final_bin
+    bought = reserve_before - pool.getBin(final_bin)[int(bin_delta < 0)]
+    assert approx(bought / reserve_before, rel=1e-6) == active_ratio
+    _, reached_bin = move_active_bin(deployment, pool_contracts, active_bin - reached_bin)
+    assert reached_bin == active_bin
+
+
 def test_init(deployment: DeploymentMap, user1, pool_contracts):
     vault = pool_contracts.vault
     tokenX, tokenY = deployment.get_tokens_for_joe_lb(pool_contracts)
@@ -296,6 +304,16 @@ def test_claim_fees(
 
     reserves = vault.getTotalFunds()
     vault.harvest(user2, user2_params)
+    receipts_holder = interface.IReceiptsHolder(vault.receiptsManager())
+    # Fees are only recorded on harvest, recipients pull them afterwards
+    assert tokenX.balanceOf(user2) == initial_balanceA_user2
+    assert receipts_holder.claimableFees(user2, tokenX) > 0
+    assert receipts_holder.totalClaimableFees(tokenX) == tokenX.balanceOf(receipts_holder)
+    assert receipts_holder.totalClaimableFees(tokenY) == tokenY.balanceOf(receipts_holder)
+    receipts_holder.claimFees([user2, strategist, accounts[6]], user2_params)
+    assert receipts_holder.claimableFees(user2, tokenX) == 0
+    assert receipts_holder.totalClaimableFees(tokenX) == 0
+    assert receipts_holder.totalClaimableFees(tokenY) == 0
     assert tokenX.balanceOf(user2) > initial_balanceA_user2
     assert tokenY.balanceOf(user2) > initial_balanceB_user2
     assert tokenX.balanceOf(strategist) > initial_balanceA_strategist
@@ -621,3 +639,184 @@ def test_safeguards(
     vault.setSwapMaxValue(10**15, deploy_parameters)
     with reverts("Only a swapMaxValue swap"):
         strategy.swap(tokenX, swap_amount, minimum_amount_expected, strategist_params)
+
+
+def start_simulated_vault(deployment: DeploymentMap, user1, strategist, pool_contracts):
+    """Deposits for user1 and adds all the liquidity with the dummy strategy, on the vault and on its simulation.
+
+    Returns the simulated vault and a check of its parity with the chain, the fees and the policies of the vault
+    are read when the simulation starts.
+    """
+    strategist_params = {"from": strategist}
+    strategy = pool_contracts.strategy
+    vault = pool_contracts.vault
+    pool = pool_contracts.pool_v2
+    tokenX, tokenY = deployment.get_tokens_for_joe_lb(pool_contracts)
+    active_bin = get_active_bin(pool_contracts)
+    receipts_holder = interface.IReceiptsHolder(vault.receiptsManager())
+    loaded_bins = range(active_bin - 30, active_bin + 31)
+    simulated_vault = LBPoolSimulator(
+        LBPairSimulator.from_pair(pool, loaded_bins, [receipts_holder]),
+        tokenX.decimals(),
+        vault.getOraclePrice(),
+        receipts_holder=str(receipts_holder),
+        manager=str(strategy.manager()),
+        protocol_fee_recipient=str(receipts_holder.protocolFeeRecipient()),
+        withdrawal_fee=vault.withdrawalFee(),
+        withdrawal_fee_delay=vault.withdrawalFeeDelay(),
+        harvest_interval=vault.harvestInterval(),
+        min_harvest_value=vault.minHarvestValue(),
+        caller_fee=receipts_holder.CALLER_FEE(),
+        manager_fee=receipts_holder.MANAGER_FEE(),
+        protocol_fee=receipts_holder.PROTOCOL_FEE(),
+        last_harvest=vault.lastHarvest(),
+    )
+    simulated_pair = simulated_vault.pair
+
+    def assert_parity():
+        assert simulated_pair.active_id == get_active_bin(pool_contracts)
+        assert simulated_vault.get_deposited_bins() == list(vault.getDepositedBins())
+        for bin in loaded_bins:
+            simulated_bin = simulated_pair.get_bin(bin)
+            assert (simulated_bin.reserve_x, simulated_bin.reserve_y) == pool.getBin(bin)
+        for bin in simulated_vault.get_deposited_bins():
+            assert simulated_vault.bin_receipt_balance[bin] == vault.binReceiptBalance(bin)
+        assert simulated_vault.get_total_funds() == vault.getTotalFunds()
+        assert simulated_vault.total_supply == vault.totalSupply()
+        assert simulated_vault.last_harvest == vault.lastHarvest()
+        for recipient, fees in simulated_vault.claimable_fees.items():
+            assert fees == tuple(receipts_holder.claimableFees(recipient, token) for token in (tokenX, tokenY))
+
+    amountX, amountY = 10 * of * tokenX, 10 * of * tokenY
+    deposit_user(amountX, amountY, tokenX, tokenY, {"from": user1}, vault)
+    simulated_vault.deposit(str(user1), amountX, amountY, chain[-1]["timestamp"])
+    assert simulated_vault.shares[str(user1)] == vault.balanceOf(user1)
+
+    set_dummy_strategy(strategy, strategist_params)
+    strategy.addAllLiquidity(False, strategist_params)
+    simulated_vault.add_all_liquidity(delta_ids, distribution_X, distribution_Y)
+    assert_parity()
+    return simulated_vault, assert_parity
+
+
+def move_simulated_active_bin(deployment: DeploymentMap, pool_contracts, simulated_vault, bin_delta):
+    swap_size, _ = move_active_bin(deployment, pool_contracts, bin_delta)
+    simulated_vault.pair.swap(swap_size, bin_delta < 0, chain[-1]["timestamp"])
+
+
+def withdraw_with_parity(user, amounts, vault, tokens, simulated_vault):
+    """Withdraws amounts on the vault and on its simulation, returns what the user received."""
+    tokenX, tokenY = tokens
+    before = (tokenX.balanceOf(user), tokenY.balanceOf(user))
+    vault.withdraw(*amounts, False, {"from": user})
+    received = (tokenX.balanceOf(user) - before[0], tokenY.balanceOf(user) - before[1])
+    assert simulated_vault.withdraw(str(user), *amounts, chain[-1]["timestamp"]) == received
+    assert simulated_vault.shares[str(user)] == vault.balanceOf(user)
+    return received
+
+
+@pytest.mark.parametrize("bin_delta", [-1, 1, 3])
+def test_simulator_parity(deployment: DeploymentMap, user1, strategist, pool_contracts, view_helper, bin_delta):
+    vault = pool_contracts.vault
+    pool = pool_contracts.pool_v2
+    tokens = deployment.get_tokens_for_joe_lb(pool_contracts)
+    simulated_vault, assert_parity = start_simulated_vault(deployment, user1, strategist, pool_contracts)
+
+    move_simulated_active_bin(deployment, pool_contracts, simulated_vault, bin_delta)
+    assert_parity()
+    bins = vault.getDepositedBins()
+    receipts_holder = vault.receiptsManager()
+    assert simulated_vault.pair.pending_fees(receipts_holder, bins) == pool.pendingFees(receipts_holder, bins)
+
+    amounts = view_helper.getMaximumWithdrawalTokenYWithoutSwapping(vault, user1)
+    withdraw_with_parity(user1, (amounts[0] // 2, amounts[1] // 2), vault, tokens, simulated_vault)
+    assert_parity()
+
+
+def test_simulator_parity_withdrawal_fee(deployment: DeploymentMap, user1, strategist, pool_contracts, view_helper):
+    vault = pool_contracts.vault
+    tokens = deployment.get_tokens_for_joe_lb(pool_contracts)
+    vault.setWithdrawalFee(HOUR, 10, deployment.ACCOUNTS.deployer.parameters())
+    simulated_vault, assert_parity = start_simulated_vault(deployment, user1, strategist, pool_contracts)
+    move_simulated_active_bin(deployment, pool_contracts, simulated_vault, 1)
+
+    # Inside the delay after the deposit the vault keeps the fee, past it the user gets the full amounts
+    amounts = view_helper.getMaximumWithdrawalTokenYWithoutSwapping(vault, user1)
+    amounts = (amounts[0] // 4, amounts[1] // 4)
+    received = withdraw_with_parity(user1, amounts, vault, tokens, simulated_vault)
+    assert received[0] < amounts[0] and received[1] < amounts[1]
+    assert_parity()
+
+    chain.sleep(HOUR)
+    chain.mine()
+    received_after_delay = withdraw_with_parity(user1, amounts, vault, tokens, simulated_vault)
+    assert received_after_delay[0] > received[0] and received_after_delay[1] > received[1]
+    assert_parity()
+
+
+@pytest.mark.parametrize("bin_delta", [-3, 1])
+def test_simulator_parity_withdraw_by_shares(deployment: DeploymentMap, user1, strategist, pool_contracts, bin_delta):
+    vault = pool_contracts.vault
+    tokenX, tokenY = deployment.get_tokens_for_joe_lb(pool_contracts)
+    simulated_vault, assert_parity = start_simulated_vault(deployment, user1, strategist, pool_contracts)
+    move_simulated_active_bin(deployment, pool_contracts, simulated_vault, bin_delta)
+
+    for shares in [vault.balanceOf(user1) // 3, vault.balanceOf(user1)]:
+        before = (tokenX.balanceOf(user1), tokenY.balanceOf(user1))
+        vault.withdrawByShares(shares, False, {"from": user1})
+        received = (tokenX.balanceOf(user1) - before[0], tokenY.balanceOf(user1) - before[1])
+        assert simulated_vault.withdraw_by_shares(str(user1), shares, chain[-1]["timestamp"]) == received
+        assert simulated_vault.shares[str(user1)] == vault.balanceOf(user1)
+        assert_parity()
+
+
+def test_simulator_parity_harvest(deployment: DeploymentMap, user1, user2, strategist, pool_contracts):
+    strategist_params = {"from": strategist}
+    deploy_parameters = deployment.ACCOUNTS.deployer.parameters()
+    vault = pool_contracts.vault
+    tokenX, tokenY = deployment.get_tokens_for_joe_lb(pool_contracts)
+    receipts_holder = interface.IReceiptsHolder(vault.receiptsManager())
+    # Uneven fees, each of them is rounded down on its own before the vault gets the rest
+    pool_contracts.strategy.setCallerFee(100, strategist_params)
+    pool_contracts.strategy.setManagerFee(400, strategist_params)
+    receipts_holder.setProtocolFee(333, deploy_parameters)
+    receipts_holder.setProtocolFeeRecipient(accounts[6], deploy_parameters)
+    simulated_vault, assert_parity = start_simulated_vault(deployment, user1, strategist, pool_contracts)
+
+    move_simulated_active_bin(deployment, pool_contracts, simulated_vault, 3)
+    move_simulated_active_bin(deployment, pool_contracts, simulated_vault, -3)
+    chain.sleep(HOUR)
+    tx = vault.harvest(user2, {"from": user2})
+    simulated_vault.harvest(str(user2), tx.timestamp)
+    assert_parity()
+    for recipient in [user2, strategist, accounts[6]]:
+        assert receipts_holder.claimableFees(recipient, tokenX) > 0
+        assert receipts_holder.claimableFees(recipient, tokenY) > 0
+
+    # The next deposit harvests again, the depositor takes the caller fee
+    move_simulated_active_bin(deployment, pool_contracts, simulated_vault, 2)
+    move_simulated_active_bin(deployment, pool_contracts, simulated_vault, -2)
+    amountX, amountY = of * tokenX, of * tokenY
+    deposit_user(amountX, amountY, tokenX, tokenY, {"from": user2}, vault)
+    simulated_vault.deposit(str(user2), amountX, amountY, chain[-1]["timestamp"])
+    assert simulated_vault.shares[str(user2)] == vault.balanceOf(user2)
+    assert_parity()
+
+
+@pytest.mark.parametrize("bin_delta", [-2, 3])
+def test_simulator_parity_rebalance(
+    deployment: DeploymentMap, user1, strategist, pool_contracts, view_helper, bin_delta
+):
+    vault = pool_contracts.vault
+    tokens = deployment.get_tokens_for_joe_lb(pool_contracts)
+    simulated_vault, assert_parity = start_simulated_vault(deployment, user1, strategist, pool_contracts)
+    move_simulated_active_bin(deployment, pool_contracts, simulated_vault, bin_delta)
+
+    pool_contracts.strategy.executeRebalance(False, {"from": strategist})
+    simulated_vault.execute_rebalance(delta_ids, distribution_X, distribution_Y)
+    assert_parity()
+
+    # The withdrawal plan runs on the bins of the new shape
+    amounts = view_helper.getMaximumWithdrawalTokenYWithoutSwapping(vault, user1)
+    withdraw_with_parity(user1, (amounts[0] // 2, amounts[1] // 2), vault, tokens, simulated_vault)
+    assert_parity()
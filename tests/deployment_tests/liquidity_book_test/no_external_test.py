@@ -2,7 +2,10 @@ import warnings
 from threading import ExceptHookArgs
 
 import pytest
-from brownie import ZERO_ADDRESS, Contract, ViewHelper, Wei, accounts, chain, interface, reverts
+from brownie import (
+    ZERO_ADDRESS, Contract, LBPool, LBPoolFactory, ReceiptsHolder, Strategy, StrategyController, ViewHelper, Wei,
+    accounts, chain, interface, reverts
+)
 from ens.utils import normalize_name
 from py_vector.common import DAY, HOUR, YEAR
 from py_vector.common.misc import in_units, of
@@ -43,6 +46,14 @@ def deposit_user(amountA, amountB, tokenX, tokenY, user_params, vault):
     assert tokenY.balanceOf(vault) - inital_tokenY == amountB
 
 
+def assert_receipt_mirror(vault):
+    joe_receipt = interface.ILBToken(vault.receiptToken())
+    receipts_manager = vault.receiptsManager()
+    for bin in vault.getDepositedBins():
+        assert vault.binReceiptBalance(bin) == joe_receipt.balanceOf(receipts_manager, bin)
+        assert vault.binReceiptBalance(bin) > 0
+
+
 def set_dummy_strategy(strategy, strategist_params):
     strategy.setParams(delta_ids, distribution_X, distribution_Y, False, False, strategist_params)
     return (0 in delta_ids)
@@ -133,6 +144,50 @@ def test_set_fees(deployment: DeploymentMap, user1, strategist, pool_contracts):
         strategy.setCallerFee(0, user1_params)
 
 
+def test_packed_config(deployment: DeploymentMap, user1, pool_contracts):
+    user1_params = {"from": user1}
+    vault = pool_contracts.vault
+    deploy_parameters = deployment.ACCOUNTS.deployer.parameters()
+    vault.setWithdrawalFee(3600, 100, deploy_parameters)
+    vault.setDepositThreshold(10**16, deploy_parameters)
+    vault.setAddLiquidityThreshold(2 * 10**16, deploy_parameters)
+    vault.setSwapThreshold(3 * 10**16, deploy_parameters)
+    vault.setSwapMaxValue(10**20, deploy_parameters)
+    vault.setSwapMinimumThreshold(2 * 10**20, deploy_parameters)
+    vault.setDeltaSwapSafeguard(12, deploy_parameters)
+    vault.setDelayBetweenSwaps(HOUR, deploy_parameters)
+    vault.setHarvestPolicy(DAY, 10**18, deploy_parameters)
+    vault.setMaxDepositedBins(80, deploy_parameters)
+    # Setters of one slot leave the fields sharing it untouched
+    assert (vault.withdrawalFeeDelay(), vault.withdrawalFee()) == (3600, 100)
+    assert (vault.depositThreshold(), vault.addLiquidityThreshold(), vault.swapThreshold()) == (
+        10**16,
+        2 * 10**16,
+        3 * 10**16,
+    )
+    assert (vault.swapMaxValue(), vault.swapMinimumThreshold()) == (10**20, 2 * 10**20)
+    assert (vault.deltaSwapSafeguard(), vault.delayBetweenSwaps()) == (12, HOUR)
+    assert (vault.harvestInterval(), vault.minHarvestValue()) == (DAY, 10**18)
+    assert vault.maxDepositedBins() == 80
+
+    with reverts("Too high"):
+        vault.setWithdrawalFee(3600, vault.PRECISION() + 1, deploy_parameters)
+    with reverts("Too high"):
+        vault.setMaxDepositedBins(vault.MAX_DEPOSITED_BINS_CEILING() + 1, deploy_parameters)
+    with reverts():
+        vault.setDelayBetweenSwaps(2**32, deploy_parameters)
+    with reverts():
+        vault.setDepositThreshold(2**64, deploy_parameters)
+    # Initialized on the current layout, there is nothing to migrate and the packed values are kept
+    for contract in [vault, pool_contracts.strategy]:
+        for params in [user1_params, deploy_parameters]:
+            with reverts("Already migrated"):
+                contract.migrateLayout(params)
+    assert (vault.withdrawalFeeDelay(), vault.withdrawalFee()) == (3600, 100)
+    assert vault.maxDepositedBins() == 80
+    vault.setMaxDepositedBins(0, deploy_parameters)
+
+
 def test_set_params(deployment: DeploymentMap, user1, strategist, pool_contracts):
     user1_params = {"from": user1}
     strategist_params = {"from": strategist}
@@ -149,6 +204,75 @@ def test_set_params(deployment: DeploymentMap, user1, strategist, pool_contracts
         strategy.setParams([-51, 1], [0, 10**18], [10**18, 0], False, False, strategist_params)
 
 
+def test_packed_params(deployment: DeploymentMap, user1, strategist, pool_contracts):
+    strategist_params = {"from": strategist}
+    strategy = pool_contracts.strategy
+    # 33 bins spans three words of deltas and a half filled word of distributions
+    delta_ids = list(range(-20, 13))
+    distribution_X = [0] * 20 + [10**18 // 13] * 13
+    distribution_Y = [10**18 // 21] * 21 + [0] * 12
+    strategy.setParams(delta_ids, distribution_X, distribution_Y, False, False, strategist_params)
+    assert strategy.paramsLength() == 33
+    assert strategy.getParams() == (delta_ids, distribution_X, distribution_Y)
+    assert [strategy.deltaIds(i) for i in (0, 15, 16, 32)] == [-20, -5, -4, 12]
+    assert strategy.distributionX(32) == 10**18 // 13
+    assert strategy.distributionY(20) == 10**18 // 21
+    with reverts("Out of range"):
+        strategy.deltaIds(33)
+    # Far away bins and a shorter shape overwrite the previous one
+    strategy.setParams([-30000, -29999], [0, 0], [10**18, 0], False, False, strategist_params)
+    assert strategy.getParams() == ([-30000, -29999], [0, 0], [10**18, 0])
+    with reverts("Delta out of range"):
+        strategy.setParams([-40000, -39999], [0, 0], [10**18, 0], False, False, strategist_params)
+
+
+SHAPE_UNIFORM, SHAPE_CURVE, SHAPE_BID_ASK = 0, 1, 2
+
+
+def expected_shape(shape, centre, radius):
+    delta_ids = list(range(centre - radius, centre + radius + 1))
+    weights = [
+        [1, radius + 1 - abs(delta - centre), abs(delta - centre) + 1][shape] for delta in delta_ids
+    ]
+    weights_X = [weight if delta >= 0 else 0 for delta, weight in zip(delta_ids, weights)]
+    weights_Y = [weight if delta <= 0 else 0 for delta, weight in zip(delta_ids, weights)]
+    distribution_X = [weight * 10**18 // max(sum(weights_X), 1) for weight in weights_X]
+    distribution_Y = [weight * 10**18 // max(sum(weights_Y), 1) for weight in weights_Y]
+    return delta_ids, distribution_X, distribution_Y
+
+
+def test_shape_params(deployment: DeploymentMap, user1, strategist, pool_contracts):
+    strategist_params = {"from": strategist}
+    strategy = pool_contracts.strategy
+    vault = pool_contracts.vault
+    tokenX, tokenY = deployment.get_tokens_for_joe_lb(pool_contracts)
+    for shape, centre, radius in [(SHAPE_UNIFORM, 0, 0), (SHAPE_CURVE, 0, 5), (SHAPE_BID_ASK, -3, 24), (SHAPE_CURVE, 10, 2)]:
+        strategy.setShapeParams(shape, centre, radius, False, False, strategist_params)
+        assert strategy.getParams() == expected_shape(shape, centre, radius)
+    with reverts("Too much bins"):
+        strategy.setShapeParams(SHAPE_UNIFORM, 0, 25, False, False, strategist_params)
+    # The shapes follow the cap of the vault both ways
+    deploy_parameters = deployment.ACCOUNTS.deployer.parameters()
+    vault.setMaxDepositedBins(11, deploy_parameters)
+    strategy.setShapeParams(SHAPE_CURVE, 0, 5, False, False, strategist_params)
+    with reverts("Too much bins"):
+        strategy.setShapeParams(SHAPE_CURVE, 0, 6, False, False, strategist_params)
+    with reverts("Too much bins"):
+        strategy.addLiquidityWithShape(0, 0, SHAPE_CURVE, 0, 6, False, strategist_params)
+    with reverts("Too much bins"):
+        strategy.customRebalanceWithShape([], [], 0, 0, tokenX, SHAPE_CURVE, 0, 6, False, strategist_params)
+    vault.setMaxDepositedBins(vault.MAX_DEPOSITED_BINS_CEILING(), deploy_parameters)
+    strategy.setShapeParams(SHAPE_UNIFORM, 0, 40, False, False, strategist_params)
+    assert strategy.getParams() == expected_shape(SHAPE_UNIFORM, 0, 40)
+    vault.setMaxDepositedBins(0, deploy_parameters)
+    with reverts("Not Manager"):
+        strategy.setShapeParams(SHAPE_UNIFORM, 0, 2, False, False, {"from": user1})
+
+    deposit_user(10 * of * tokenX, 10 * of * tokenY, tokenX, tokenY, {"from": user1}, vault)
+    strategy.setShapeParams(SHAPE_CURVE, 0, 3, True, False, strategist_params)
+    assert vault.depositedBinsCount() == 7
+
+
 def test_add_all_liquidity(deployment: DeploymentMap, user1, strategist, pool_contracts):
     user1_params = {"from": user1}
     strategist_params = {"from": strategist}
@@ -767,7 +891,244 @@ def test_views(deployment: DeploymentMap, user1, strategist, pool_contracts):
     assert vault.pendingRewards([active_bin]) == (0, 0)
 
 
+def test_deposited_bins_tree(deployment: DeploymentMap, user1, strategist, pool_contracts):
+    user1_params = {"from": user1}
+    strategist_params = {"from": strategist}
+    strategy = pool_contracts.strategy
+    vault = pool_contracts.vault
+    tokenX, tokenY = deployment.get_tokens_for_joe_lb(pool_contracts)
+    (_, _, active_bin) = vault.getPairInfos()
+    deposit_user(100 * of * tokenX, 100 * of * tokenY, tokenX, tokenY, user1_params, vault)
+    strategy.setParams([-7, -3, 0, 2, 11], [0, 0, 4 * 10**17, 3 * 10**17, 3 * 10**17],
+                       [3 * 10**17, 3 * 10**17, 4 * 10**17, 0, 0], False, False, strategist_params)
+    strategy.addAllLiquidity(False, strategist_params)
+    expected_bins = [active_bin + delta for delta in [-7, -3, 0, 2, 11]]
+    assert list(vault.getDepositedBins()) == expected_bins
+    assert vault.depositedBinsCount() == len(expected_bins)
+    assert vault.getHighestAndLowestBin() == (active_bin + 11, active_bin - 7)
+    assert vault.getNextDepositedBin(active_bin, False) == active_bin + 2
+    assert vault.getNextDepositedBin(active_bin, True) == active_bin - 3
+    assert vault.getNextDepositedBin(active_bin + 11, False) == 2**256 - 1
+    assert vault.getNextDepositedBin(active_bin - 7, True) == 2**256 - 1
+    assert vault.isDepositedBin(active_bin + 2)
+    assert not vault.isDepositedBin(active_bin + 1)
+    strategy.withdrawAllLiquidity(strategist_params)
+    assert len(vault.getDepositedBins()) == 0
+    assert vault.getHighestAndLowestBin() == (0, 0)
+
+
 @pytest.mark.xfail(ExpectedException)
+def test_paginated_bins(deployment: DeploymentMap, user1, strategist, pool_contracts):
+    user1_params = {"from": user1}
+    strategist_params = {"from": strategist}
+    strategy = pool_contracts.strategy
+    vault = pool_contracts.vault
+    tokenX, tokenY = deployment.get_tokens_for_joe_lb(pool_contracts)
+    deposit_user(10 * of * tokenX, 10 * of * tokenY, tokenX, tokenY, user1_params, vault)
+    delta_ids = list(range(-5, 6))
+    strategy.setParams(
+        delta_ids,
+        [0] * 5 + [10**18 // 6] * 6,
+        [10**18 // 6] * 6 + [0] * 5,
+        False,
+        False,
+        strategist_params,
+    )
+    strategy.addAllLiquidity(False, strategist_params)
+    deposited_bins = vault.getDepositedBins()
+    assert len(deposited_bins) == 11
+
+    pages = []
+    cursor = 0
+    total_reserves = [0, 0]
+    while True:
+        page, next_cursor = vault.getDepositedBinsPage(cursor, 4)
+        reserve_X, reserve_Y, reserves_cursor = vault.getAllReservesPage(cursor, 4)
+        assert reserves_cursor == next_cursor
+        pages.append(page)
+        total_reserves = [total_reserves[0] + reserve_X, total_reserves[1] + reserve_Y]
+        if next_cursor == 0:
+            break
+        cursor = next_cursor
+    assert [len(page) for page in pages] == [4, 4, 3]
+    assert [bin for page in pages for bin in page] == deposited_bins
+    assert tuple(total_reserves) == vault.getAllReserves()
+    # A cursor that is not a deposited bin starts from the next one
+    assert vault.getDepositedBinsPage(deposited_bins[0] - 10, 2) == (deposited_bins[:2], deposited_bins[2])
+
+    vault.harvestPage(0, 4, user1_params)
+    with reverts():
+        vault.withdrawAllLiquidityPage(0, 4, user1_params)
+    strategy.withdrawAllLiquidityPage(0, 4, strategist_params)
+    assert vault.getDepositedBins() == deposited_bins[4:]
+    while vault.depositedBinsCount() > 0:
+        strategy.withdrawAllLiquidityPage(0, 4, strategist_params)
+    assert vault.getDepositedBinsPage(0, 4) == ((), 0)
+
+    deploy_parameters = deployment.ACCOUNTS.deployer.parameters()
+    vault.setMaxDepositedBins(5, deploy_parameters)
+    assert vault.maxDepositedBins() == 5
+    with reverts("Too much bins"):
+        strategy.setParams(delta_ids, [0] * 5 + [10**18 // 6] * 6, [10**18 // 6] * 6 + [0] * 5, False, False, strategist_params)
+    vault.setMaxDepositedBins(0, deploy_parameters)
+    assert vault.maxDepositedBins() == vault.DEFAULT_MAX_DEPOSITED_BINS()
+
+
+def test_withdrawal_plan(view_helper):
+    active = 2**23
+    bins = [active - 2, active - 1, active, active + 1]
+    reserves_X = [0, 0, 100, 300]
+    reserves_Y = [200, 400, 100, 0]
+    receipts = [20, 40, 10, 30]
+    # Y from the lowest bin up, the active bin is untouched while the other bins cover the amounts
+    (ids, amounts) = view_helper.computeWithdrawalPlan(150, 300, active, bins, reserves_X, reserves_Y, receipts)
+    assert ids == (active - 2, active - 1, active + 1)
+    assert amounts == (20, 10, 15)
+    # 50 Y missing outside of the active bin: half of the active bin is burnt, it also yields 50 X
+    (ids, amounts) = view_helper.computeWithdrawalPlan(300, 650, active, bins, reserves_X, reserves_Y, receipts)
+    assert ids == (active - 2, active - 1, active, active + 1)
+    assert amounts == (20, 40, 5, 25)
+    with reverts("Not enough reserves"):
+        view_helper.computeWithdrawalPlan(0, 701, active, bins, reserves_X, reserves_Y, receipts)
+    assert view_helper.computeWithdrawalPlan(0, 0, active, bins, reserves_X, reserves_Y, receipts) == ((), ())
+
+
+def test_harvest_policy(deployment: DeploymentMap, user1, strategist, pool_contracts):
+    user1_params = {"from": user1}
+    vault = pool_contracts.vault
+    tokenX, tokenY = deployment.get_tokens_for_joe_lb(pool_contracts)
+    deploy_parameters = deployment.ACCOUNTS.deployer.parameters()
+    with reverts():
+        vault.setHarvestPolicy(HOUR, 0, user1_params)
+    vault.setHarvestPolicy(HOUR, 0, deploy_parameters)
+    assert vault.harvestInterval() == HOUR
+
+    deposit_user(of * tokenX, of * tokenY, tokenX, tokenY, user1_params, vault)
+    first_harvest = vault.lastHarvest()
+    assert first_harvest > 0
+    chain.sleep(HOUR // 2)
+    deposit_user(of * tokenX, of * tokenY, tokenX, tokenY, user1_params, vault)
+    assert vault.lastHarvest() == first_harvest
+    chain.sleep(HOUR)
+    deposit_user(of * tokenX, of * tokenY, tokenX, tokenY, user1_params, vault)
+    assert vault.lastHarvest() > first_harvest
+
+    # Nothing is pending without liquidity in the bins, so the value check skips the harvest
+    vault.setHarvestPolicy(0, 1, deploy_parameters)
+    second_harvest = vault.lastHarvest()
+    chain.sleep(HOUR)
+    deposit_user(of * tokenX, of * tokenY, tokenX, tokenY, user1_params, vault)
+    assert vault.lastHarvest() == second_harvest
+    # Explicit harvests ignore the policy
+    vault.harvest(user1, user1_params)
+    assert vault.lastHarvest() > second_harvest
+
+
+def test_receipt_mirror(deployment: DeploymentMap, user1, strategist, pool_contracts):
+    user1_params = {"from": user1}
+    strategist_params = {"from": strategist}
+    strategy = pool_contracts.strategy
+    vault = pool_contracts.vault
+    tokenX, tokenY = deployment.get_tokens_for_joe_lb(pool_contracts)
+    joe_receipt = interface.ILBToken(vault.receiptToken())
+    (_, _, active_bin) = vault.getPairInfos()
+    deposit_user(100 * of * tokenX, 100 * of * tokenY, tokenX, tokenY, user1_params, vault)
+    strategy.setParams([-2, -1, 0, 1, 2], [0, 0, 2 * 10**17, 4 * 10**17, 4 * 10**17],
+                       [4 * 10**17, 4 * 10**17, 2 * 10**17, 0, 0], False, False, strategist_params)
+    strategy.addAllLiquidity(False, strategist_params)
+    assert_receipt_mirror(vault)
+    # The reserves read from the mirror match the ones read from the pair balances
+    reserves = [vault.getReserveForBin(bin) for bin in vault.getDepositedBins()]
+    assert vault.getAllReserves() == (sum(r[0] for r in reserves), sum(r[1] for r in reserves))
+
+    deposit_user(10 * of * tokenX, 10 * of * tokenY, tokenX, tokenY, user1_params, vault)
+    strategy.addAllLiquidity(False, strategist_params)
+    assert_receipt_mirror(vault)
+
+    vault.withdraw(20 * of * tokenX, 20 * of * tokenY, False, user1_params)
+    assert_receipt_mirror(vault)
+
+    strategy.setParams([-1, 1, 3], [0, 5 * 10**17, 5 * 10**17], [10**18, 0, 0], False, False, strategist_params)
+    strategy.executeIncrementalRebalance(False, strategist_params)
+    assert_receipt_mirror(vault)
+    assert vault.binReceiptBalance(active_bin - 2) == 0
+
+    strategy.withdrawAllLiquidityPage(0, 2, strategist_params)
+    assert_receipt_mirror(vault)
+
+    # A mirror out of sync is restored from the pair by the owner
+    bins = vault.getDepositedBins()
+    deploy_parameters = deployment.ACCOUNTS.deployer.parameters()
+    with reverts():
+        vault.syncReceiptBalances(bins, user1_params)
+    # Every deposited bin has to be synced, a stale one would make removing its liquidity revert
+    with reverts("Deposited bins not synced"):
+        vault.syncReceiptBalances(bins[1:], deploy_parameters)
+    with reverts("Not ascending order"):
+        vault.syncReceiptBalances(bins + bins[:1], deploy_parameters)
+    vault.syncReceiptBalances(bins, deploy_parameters)
+    assert_receipt_mirror(vault)
+    strategy.withdrawAllLiquidity(strategist_params)
+    for bin in bins:
+        assert vault.binReceiptBalance(bin) == 0
+        assert joe_receipt.balanceOf(vault.receiptsManager(), bin) == 0
+
+
+def test_oracle_helper(deployment: DeploymentMap, user1, pool_contracts):
+    vault = pool_contracts.vault
+    oracle = interface.IOracleHelper(vault.oracle())
+    tokenX, tokenY = deployment.get_tokens_for_joe_lb(pool_contracts)
+    for token in [tokenX, tokenY]:
+        assert oracle.tokenUnit(token) == 10 ** token.decimals()
+        feed = oracle.tokenToFeed(token)
+        if feed != ZERO_ADDRESS:
+            assert oracle.feedScale(token) == 10 ** (18 - interface.AggregatorV3Interface(feed).decimals())
+    expected_price = (oracle.getPrice(tokenX) * 10**18 * 10 ** tokenY.decimals()) // (
+        oracle.getPrice(tokenY) * 10 ** tokenX.decimals()
+    )
+    assert oracle.getPriceOfXInYUnits(tokenX, tokenY) == expected_price
+    assert vault.getOraclePrice() == expected_price
+    assert oracle.getPricesOfXInYUnits([tokenX, tokenY], [tokenY, tokenX]) == (
+        expected_price,
+        oracle.getPriceOfXInYUnits(tokenY, tokenX),
+    )
+    with reverts("Length mismatch"):
+        oracle.getPricesOfXInYUnits([tokenX], [])
+    with reverts():
+        oracle.setIsStable(tokenX, True, {"from": user1})
+
+
+def test_oracle_pair_source(deployment: DeploymentMap, user1, pool_contracts):
+    vault = pool_contracts.vault
+    oracle = interface.IOracleHelper(vault.oracle())
+    tokenX, tokenY = deployment.get_tokens_for_joe_lb(pool_contracts)
+    deploy_parameters = deployment.ACCOUNTS.deployer.parameters()
+    pair = vault.pair()
+    with reverts():
+        oracle.setPairSource(tokenX, tokenY, pair, HOUR, {"from": user1})
+    with reverts("Wrong pair"):
+        oracle.setPairSource(tokenY, tokenX, pair, HOUR, deploy_parameters)
+    # The vault would check the active bin against itself
+    with reverts("Spot price"):
+        oracle.setPairSource(tokenX, tokenY, pair, 0, deploy_parameters)
+
+    # Without any swap the average id over the period is the active one
+    interface.ILBPair(pair).increaseOracleLength(10, deploy_parameters)
+    chain.sleep(2 * HOUR)
+    chain.mine()
+    oracle.setPairSource(tokenX, tokenY, pair, HOUR, deploy_parameters)
+    assert oracle.pairSources(tokenX, tokenY) == (pair, HOUR, vault.binStep(), False)
+    assert oracle.pairSources(tokenY, tokenX) == (pair, HOUR, vault.binStep(), True)
+    spot_price = vault.getPriceFromActiveBin()
+    assert oracle.getPriceOfXInYUnits(tokenX, tokenY) == spot_price
+    assert oracle.getPriceOfXInYUnits(tokenY, tokenX) == 10**36 // spot_price
+    assert vault.getOraclePrice() == spot_price
+
+    oracle.setPairSource(tokenX, tokenY, ZERO_ADDRESS, 0, deploy_parameters)
+    assert oracle.pairSources(tokenY, tokenX) == (ZERO_ADDRESS, 0, 0, True)
+    assert approx(oracle.getPriceOfXInYUnits(tokenX, tokenY), rel=0.05) == spot_price
+
+
 def test_swap(deployment: DeploymentMap, user1, strategist, pool_contracts, view_helper):
     # WARNING : CAN MISBEHAVE WHEN NOT RUN ALONE
     # TODO : Fix the fee part
@@ -859,6 +1220,250 @@ def test_rebalance(deployment: DeploymentMap, user1, strategist, pool_contracts,
         assert approx(normalized_value(tokenX.balanceOf(user1), tokenY.balanceOf(user1), price)) == approx(normalized_value(initial_balanceA, initial_balanceB, price))
 
 
+def test_incremental_rebalance_plan(view_helper):
+    active = 2**23
+    snapshot = (active, [active - 1, active, active + 1], [0, 50, 100], [100, 50, 0], [10, 10, 10])
+    # Shape moved one bin up: total of 150 X and 150 Y, Y in the active bin and X split over the two bins above
+    plan = view_helper.computeIncrementalRebalance(snapshot, 0, 0, [0, 1, 2], [0, 5 * 10**17, 5 * 10**17], [10**18, 0, 0])
+    (removed_ids, removed_amounts, added_delta_ids, added_distribution_X, added_distribution_Y, amount_X, amount_Y) = plan
+    assert removed_ids == (active - 1, active, active + 1)
+    assert removed_amounts == (10, 10, 2)
+    assert added_delta_ids == (0, 2)
+    assert added_distribution_X == (0, 10**18)
+    assert added_distribution_Y == (10**18, 0)
+    assert (amount_X, amount_Y) == (75, 150)
+    # Nothing moves when the bins already hold their target
+    snapshot = (active, [active - 1, active, active + 1], [0, 50, 150], [150, 50, 0], [10, 10, 10])
+    plan = view_helper.computeIncrementalRebalance(snapshot, 0, 0, [-1, 0, 1], [0, 25 * 10**16, 75 * 10**16], [75 * 10**16, 25 * 10**16, 0])
+    assert plan == ((), (), (), (), (), 0, 0)
+
+
+@pytest.mark.parametrize("respect_ratio", [False, True])
+def test_incremental_rebalance(deployment: DeploymentMap, user1, strategist, pool_contracts, view_helper, respect_ratio):
+    user1_params = {"from": user1}
+    strategist_params = {"from": strategist}
+    strategy = pool_contracts.strategy
+    vault = pool_contracts.vault
+    tokenX, tokenY = deployment.get_tokens_for_joe_lb(pool_contracts)
+
+    deposit_user(100 * of * tokenX, 100 * of * tokenY, tokenX, tokenY, user1_params, vault)
+    strategy.setParams([-2, -1, 1, 2], [0, 0, 5 * 10**17, 5 * 10**17], [5 * 10**17, 5 * 10**17, 0, 0], False, False, strategist_params)
+    strategy.addAllLiquidity(False, strategist_params)
+    (_, _, active_bin) = vault.getPairInfos()
+    kept_reserve = vault.getReserveForBin(active_bin + 1)
+    initial_funds = vault.getTotalFunds()
+
+    strategy.setParams([-1, 1, 3], [0, 5 * 10**17, 5 * 10**17], [10**18, 0, 0], False, False, strategist_params)
+    # The active bin is not topped up, the ratio has nothing to apply to
+    strategy.executeIncrementalRebalance(respect_ratio, strategist_params)
+    assert vault.getDepositedBins() == [active_bin - 1, active_bin + 1, active_bin + 3]
+    # The bin that keeps its target is not burnt, at most topped up with the idle dust
+    assert approx(vault.getReserveForBin(active_bin + 1)[0]) == kept_reserve[0]
+    assert vault.getReserveForBin(active_bin + 1)[0] >= kept_reserve[0]
+    assert approx(vault.getReserveForBin(active_bin - 1)[1]) == initial_funds[1]
+    assert approx(vault.getReserveForBin(active_bin + 3)[0]) == kept_reserve[0]
+    assert approx(vault.getTotalFunds()[0]) == initial_funds[0]
+    assert approx(vault.getTotalFunds()[1]) == initial_funds[1]
+
+    # Back into the active bin, topped up respecting its ratio or not
+    strategy.setParams([-1, 0, 1], [0, 5 * 10**17, 5 * 10**17], [5 * 10**17, 5 * 10**17, 0], False, False, strategist_params)
+    strategy.executeIncrementalRebalance(respect_ratio, strategist_params)
+    assert vault.getDepositedBins() == [active_bin - 1, active_bin, active_bin + 1]
+    assert approx(vault.getTotalFunds()[0], rel=1e-2) == initial_funds[0]
+    assert approx(vault.getTotalFunds()[1], rel=1e-2) == initial_funds[1]
+    reserves = view_helper.getMaximumWithdrawalTokenXWithoutSwapping(vault, user1)
+    vault.withdraw(reserves[0], reserves[1], False, user1_params)
+
+
+def test_batched_user_views(deployment: DeploymentMap, user1, user2, strategist, pool_contracts, view_helper):
+    strategist_params = {"from": strategist}
+    strategy = pool_contracts.strategy
+    vault = pool_contracts.vault
+    tokenX, tokenY = deployment.get_tokens_for_joe_lb(pool_contracts)
+    users = [user1, user2, accounts[5]]
+    # Empty vault, nobody can withdraw
+    assert view_helper.getMaximumWithdrawalsTokenYWithoutSwapping(vault, users) == ((0, 0, 0), (0, 0, 0))
+
+    deposit_user(100 * of * tokenX, 30 * of * tokenY, tokenX, tokenY, {"from": user1}, vault)
+    deposit_user(20 * of * tokenX, 80 * of * tokenY, tokenX, tokenY, {"from": user2}, vault)
+    strategy.setParams([-1, 0, 1], [0, 5 * 10**17, 5 * 10**17], [5 * 10**17, 5 * 10**17, 0], False, False, strategist_params)
+    strategy.addAllLiquidity(False, strategist_params)
+
+    for batched, single in [
+        (view_helper.getMaximumWithdrawalsTokenXWithoutSwapping, view_helper.getMaximumWithdrawalTokenXWithoutSwapping),
+        (view_helper.getMaximumWithdrawalsTokenYWithoutSwapping, view_helper.getMaximumWithdrawalTokenYWithoutSwapping),
+    ]:
+        amounts_X, amounts_Y = batched(vault, users)
+        assert list(zip(amounts_X, amounts_Y)) == [single(vault, user) for user in users]
+        assert amounts_X[2] == amounts_Y[2] == 0
+
+    shares = [vault.balanceOf(user1), vault.balanceOf(user2), 0, 10**18]
+    price = vault.getOraclePrice()
+    values_X, values_Y = view_helper.getDepositTokensForSharesBatch(vault, shares)
+    assert list(values_X) == [view_helper.getDepositTokensXForShares(amount, price, vault)[0] for amount in shares]
+    assert list(values_Y) == [view_helper.getDepositTokensYForShares(amount, price, vault)[0] for amount in shares]
+
+
+SNAPSHOT_FIELDS = [
+    "vault", "pair", "activeId", "oraclePrice", "activeBinPrice", "balanceX", "balanceY", "totalSupply",
+    "bins", "receiptBalances", "reservesX", "reservesY", "pendingFeesX", "pendingFeesY",
+    "managerFee", "callerFee", "protocolFee", "protocolFeeRecipient",
+]
+
+
+def test_vault_snapshot(deployment: DeploymentMap, user1, strategist, pool_contracts, view_helper):
+    strategist_params = {"from": strategist}
+    strategy = pool_contracts.strategy
+    vault = pool_contracts.vault
+    tokenX, tokenY = deployment.get_tokens_for_joe_lb(pool_contracts)
+    receipts_holder = interface.IReceiptsHolder(vault.receiptsManager())
+    deposit_user(100 * of * tokenX, 100 * of * tokenY, tokenX, tokenY, {"from": user1}, vault)
+    strategy.setParams([-1, 0, 1], [0, 5 * 10**17, 5 * 10**17], [5 * 10**17, 5 * 10**17, 0], False, False, strategist_params)
+    strategy.addAllLiquidity(False, strategist_params)
+
+    snapshot = dict(zip(SNAPSHOT_FIELDS, view_helper.getVaultSnapshot(vault)))
+    bins = vault.getDepositedBins()
+    assert (snapshot["vault"], snapshot["pair"]) == (vault.address, vault.pair())
+    assert snapshot["activeId"] == vault.getPairInfos()[2]
+    assert snapshot["oraclePrice"] == vault.getOraclePrice()
+    assert snapshot["activeBinPrice"] == vault.getPriceFromActiveBin()
+    assert (snapshot["balanceX"], snapshot["balanceY"]) == vault.getBalances()
+    assert snapshot["totalSupply"] == vault.totalSupply()
+    assert snapshot["bins"] == bins
+    assert list(snapshot["receiptBalances"]) == [vault.binReceiptBalance(bin) for bin in bins]
+    assert list(zip(snapshot["reservesX"], snapshot["reservesY"])) == [vault.getReserveForBin(bin) for bin in bins]
+    assert list(zip(snapshot["pendingFeesX"], snapshot["pendingFeesY"])) == [
+        interface.ILBPair(vault.pair()).pendingFees(receipts_holder, [bin]) for bin in bins
+    ]
+    assert (snapshot["managerFee"], snapshot["callerFee"], snapshot["protocolFee"]) == (
+        receipts_holder.MANAGER_FEE(),
+        receipts_holder.CALLER_FEE(),
+        receipts_holder.PROTOCOL_FEE(),
+    )
+    assert snapshot["protocolFeeRecipient"] == receipts_holder.protocolFeeRecipient()
+
+    snapshots = view_helper.getVaultSnapshots([vault, vault])
+    assert len(snapshots) == 2
+    assert snapshots[0] == snapshots[1] == view_helper.getVaultSnapshot(vault)
+
+
+def deploy_pool_factory(deployment: DeploymentMap, vault):
+    deploy_parameters = deployment.ACCOUNTS.deployer.parameters()
+    return LBPoolFactory.deploy(
+        LBPool.deploy(deploy_parameters),
+        ReceiptsHolder.deploy(deploy_parameters),
+        Strategy.deploy(deploy_parameters),
+        deployment.JOE.LB.ROUTER,
+        vault.viewHelper(),
+        vault.oracle(),
+        deploy_parameters,
+    )
+
+
+def test_pool_factory(deployment: DeploymentMap, user1, strategist, pool_contracts):
+    deploy_parameters = deployment.ACCOUNTS.deployer.parameters()
+    owner = deploy_parameters["from"]
+    tokenX, tokenY = deployment.get_tokens_for_joe_lb(pool_contracts)
+    factory = deploy_pool_factory(deployment, pool_contracts.vault)
+    assert factory.vaultBeacon() != ZERO_ADDRESS
+    parameters = (
+        pool_contracts.vault.pair(), owner, strategist,
+        10**16, 10**16, 10**16, 10**17, 10**17, 10, 0, HOUR, 10,
+    )
+    with reverts():
+        factory.createPool(parameters, {"from": user1})
+    tx = factory.createPool(parameters, deploy_parameters)
+    vault = interface.ILBPool(tx.return_value[0])
+    receipts_holder = interface.IReceiptsHolder(tx.return_value[1])
+    strategy = interface.IStrategy(tx.return_value[2])
+    assert tx.events["PoolCreated"]["vault"] == vault.address
+    assert factory.vaults(0) == vault.address and factory.vaultsLength() == 1
+
+    assert (vault.tokenX(), vault.tokenY(), vault.binStep()) == (tokenX, tokenY, pool_contracts.bin_step)
+    assert (vault.receiptsManager(), vault.strategy()) == (receipts_holder.address, strategy.address)
+    assert (vault.oracle(), vault.viewHelper()) == (pool_contracts.vault.oracle(), pool_contracts.vault.viewHelper())
+    assert (vault.depositThreshold(), vault.swapMaxValue(), vault.deltaSwapSafeguard()) == (10**16, 10**17, 10)
+    assert (vault.withdrawalFeeDelay(), vault.withdrawalFee()) == (HOUR, 10)
+    assert (receipts_holder.vault(), receipts_holder.strategy()) == (vault.address, strategy.address)
+    assert (strategy.vault(), strategy.manager()) == (vault.address, strategist)
+    assert vault.owner() == receipts_holder.owner() == strategy.owner() == owner
+
+    deposit_user(10 * of * tokenX, 10 * of * tokenY, tokenX, tokenY, {"from": user1}, vault)
+    assert vault.balanceOf(user1) > 0
+
+
+HARVEST, REBALANCE, INCREMENTAL_REBALANCE, ADD_ALL_LIQUIDITY = range(4)
+
+
+def deploy_strategy_controller(deployment: DeploymentMap, keeper):
+    deploy_parameters = deployment.ACCOUNTS.deployer.parameters()
+    controller = StrategyController.deploy(deploy_parameters)
+    controller.setKeeper(keeper, True, deploy_parameters)
+    return controller
+
+
+def test_strategy_controller(deployment: DeploymentMap, user1, strategist, pool_contracts):
+    deploy_parameters = deployment.ACCOUNTS.deployer.parameters()
+    strategist_params = {"from": strategist}
+    strategy = pool_contracts.strategy
+    vault = pool_contracts.vault
+    tokenX, tokenY = deployment.get_tokens_for_joe_lb(pool_contracts)
+    controller = deploy_strategy_controller(deployment, strategist)
+
+    deposit_user(100 * of * tokenX, 100 * of * tokenY, tokenX, tokenY, {"from": user1}, vault)
+    strategy.setParams(delta_ids, distribution_X, distribution_Y, False, False, strategist_params)
+    with reverts("Not Keeper"):
+        controller.execute([(strategy, ADD_ALL_LIQUIDITY, False)], {"from": user1})
+    with reverts("Not Manager or Keeper"):
+        strategy.addAllLiquidity(False, {"from": user1})
+    with reverts():
+        strategy.setKeeper(controller, strategist_params)
+
+    # The controller is not the keeper yet, the failure is reported without reverting the batch
+    tx = controller.execute([(strategy, ADD_ALL_LIQUIDITY, False), (strategy, HARVEST, False)], strategist_params)
+    assert tx.return_value == (False, True)
+    assert tx.events["OperationFailed"]["strategy"] == strategy.address
+    assert tx.events["OperationFailed"]["action"] == ADD_ALL_LIQUIDITY
+    assert vault.getDepositedBins() == []
+    # Nor does a strategy without a vault to harvest
+    tx = controller.execute([(tokenX, HARVEST, False)], strategist_params)
+    assert tx.return_value == (False,)
+    assert tx.events["OperationFailed"]["strategy"] == tokenX.address
+
+    strategy.setKeeper(controller, deploy_parameters)
+    assert strategy.keeper() == controller.address
+    tx = controller.execute(
+        [
+            (strategy, ADD_ALL_LIQUIDITY, False),
+            (strategy, REBALANCE, False),
+            (strategy, INCREMENTAL_REBALANCE, False),
+            (strategy, HARVEST, False),
+        ],
+        strategist_params,
+    )
+    assert tx.return_value == (True, True, True, True)
+    assert "OperationFailed" not in tx.events
+    (_, _, active_bin) = vault.getPairInfos()
+    assert vault.getDepositedBins() == [active_bin + delta for delta in delta_ids]
+    # An address without code fails on its own instead of passing as a call to an account would
+    codeless = accounts[8]
+    tx = controller.execute(
+        [(codeless, REBALANCE, False), (strategy, HARVEST, False), (codeless, HARVEST, False)], strategist_params
+    )
+    assert tx.return_value == (False, True, False)
+    assert [event["strategy"] for event in tx.events["OperationFailed"]] == [codeless.address] * 2
+
+    receipts_holder = interface.IReceiptsHolder(vault.receiptsManager())
+    with reverts():
+        controller.claimFees([receipts_holder], {"from": user1})
+    controller.claimFees([receipts_holder], deploy_parameters)
+    assert receipts_holder.claimableFees(controller, tokenX) == receipts_holder.claimableFees(controller, tokenY) == 0
+    with reverts():
+        controller.sweep(tokenX, user1, {"from": user1})
+    controller.sweep(tokenX, user1, deploy_parameters)
+    assert tokenX.balanceOf(controller) == 0
+
+
 def test_multiple_user_share_calculation(deployment: DeploymentMap, user1, user2, strategist, pool_contracts):
     user1_params = {"from": user1}
     user2_params = {"from": user2}
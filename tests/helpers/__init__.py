@@ -0,0 +1,3 @@
+"""Helpers shared by the deployment and the local tests: the BinHelper math port, the pair reader and the
+Liquidity Book simulator. Imported from the project root, which brownie puts on the path.
+"""
@@ -0,0 +1,152 @@
+"""Bit-exact port of the fixed-point math of BinHelper.sol.
+
+Every function returns what its Solidity counterpart returns, or raises ValueError where it reverts. Values are
+plain Python integers: the 128.128 prices and their products do not fit in fixed-width arrays.
+"""
+
+SCALE_OFFSET = 128
+SCALE = 1 << SCALE_OFFSET
+BASIS_POINT_MAX = 10_000
+REAL_ID_SHIFT = 1 << 23
+MAX_UINT256 = 2**256 - 1
+MAX_INT256 = 2**255 - 1
+LOG_SCALE_OFFSET = 127
+LOG_SCALE = 1 << LOG_SCALE_OFFSET
+LOG_SCALE_SQUARED = LOG_SCALE * LOG_SCALE
+POWER_BITS = 20
+
+
+def mul_shift_round_down(x, y, offset):
+    if offset > 255:
+        raise ValueError("Offset too large")
+    result = (x * y) >> offset
+    if result > MAX_UINT256:
+        raise ValueError("Result overflows")
+    return result
+
+
+def mul_shift_round_up(x, y, offset):
+    result = mul_shift_round_down(x, y, offset)
+    # Unchecked in Solidity, the round up wraps
+    return (result + 1) & MAX_UINT256 if (x * y) % (1 << offset) != 0 else result
+
+
+def shift_div_round_down(x, offset, denominator):
+    if offset > 255:
+        raise ValueError("Offset too large")
+    if denominator == 0:
+        raise ValueError("Division by zero")
+    result = (x << offset) // denominator
+    if result > MAX_UINT256:
+        raise ValueError("Result overflows")
+    return result
+
+
+def shift_div_round_up(x, offset, denominator):
+    result = shift_div_round_down(x, offset, denominator)
+    return (result + 1) & MAX_UINT256 if (x << offset) % denominator != 0 else result
+
+
+def log2(x):
+    """Math128x128.log2, the binary logarithm of a 128.128 number as a signed 128.128 number."""
+    if x == 1:
+        return 0
+    if x == 0:
+        raise ValueError("Logarithm of zero")
+    x >>= 1
+    if x >= LOG_SCALE:
+        sign = 1
+    else:
+        sign = -1
+        x = LOG_SCALE_SQUARED // x
+    n = (x >> LOG_SCALE_OFFSET).bit_length() - 1
+    result = n << LOG_SCALE_OFFSET
+    y = x >> n
+    if y != LOG_SCALE:
+        delta = 1 << (LOG_SCALE_OFFSET - 1)
+        while delta > 0:
+            y = ((y * y) & MAX_UINT256) >> LOG_SCALE_OFFSET
+            if y >= 1 << (LOG_SCALE_OFFSET + 1):
+                result += delta
+                y >>= 1
+            delta >>= 1
+    return (result * sign) << 1
+
+
+def _power_table(x):
+    # The successive squarings of power, they only depend on x so batches share them
+    invert = False
+    pow = x
+    if x > 2**128 - 1:
+        pow = MAX_UINT256 // pow
+        invert = True
+    table = [pow]
+    for _ in range(POWER_BITS - 1):
+        pow = ((pow * pow) & MAX_UINT256) >> SCALE_OFFSET
+        table.append(pow)
+    return table, invert
+
+
+def _power_from_table(table, base_invert, y):
+    if y == 0:
+        return SCALE
+    abs_y = abs(y)
+    if abs_y >= 1 << POWER_BITS:
+        raise ValueError("Exponent too large")
+    result = SCALE
+    bit = 0
+    while abs_y:
+        if abs_y & 1:
+            result = ((result * table[bit]) & MAX_UINT256) >> SCALE_OFFSET
+        abs_y >>= 1
+        bit += 1
+    if result == 0:
+        raise ValueError("Power underflows")
+    return MAX_UINT256 // result if (y < 0) != base_invert else result
+
+
+def power(x, y):
+    """Math128x128.power, x ** y for a 128.128 number x and an integer y in ]-2**20; 2**20[."""
+    if y == 0:
+        return SCALE
+    return _power_from_table(*_power_table(x), y)
+
+
+def get_bp_value(bin_step):
+    if bin_step == 0 or bin_step > BASIS_POINT_MAX:
+        raise ValueError("Wrong bin step")
+    return SCALE + (bin_step << SCALE_OFFSET) // BASIS_POINT_MAX
+
+
+def get_price_from_id(bin_id, bin_step):
+    """BinHelper.getPriceFromId, the price of Y per X of the bin as a 128.128 number."""
+    if bin_id > MAX_INT256:
+        raise ValueError("Id too large")
+    return power(get_bp_value(bin_step), bin_id - REAL_ID_SHIFT)
+
+
+def get_prices_from_ids(ids, bin_step):
+    """get_price_from_id for many ids, the squarings of the base are computed once for the whole batch."""
+    table, invert = _power_table(get_bp_value(bin_step))
+    return [_power_from_table(table, invert, bin_id - REAL_ID_SHIFT) for bin_id in ids]
+
+
+def get_price_ladder(first_id, count, bin_step):
+    """Prices of the count bins starting at first_id, see get_prices_from_ids."""
+    return get_prices_from_ids(range(first_id, first_id + count), bin_step)
+
+
+def get_id_from_price(price, bin_step):
+    """BinHelper.getIdFromPrice, the id of a 128.128 price, may be off by one as on chain."""
+    price_log, step_log = log2(price), log2(get_bp_value(bin_step))
+    # Solidity rounds the signed division towards zero
+    quotient = abs(price_log) // abs(step_log)
+    bin_id = REAL_ID_SHIFT + (quotient if (price_log < 0) == (step_log < 0) else -quotient)
+    if bin_id < 0 or bin_id > 2**24 - 1:
+        raise ValueError("Id out of range")
+    return bin_id
+
+
+def to_decimal_price(price, decimals=18):
+    """A 128.128 price scaled by 10**decimals, as ViewHelper.getPriceFromBin does with 18 decimals."""
+    return (price * 10**decimals) >> SCALE_OFFSET
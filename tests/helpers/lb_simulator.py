@@ -0,0 +1,591 @@
+"""Offline model of a Liquidity Book pair and of the LBPool vault built on it.
+
+The pair follows the integer math of LBPair (swaps crossing bins, variable fees, composition fees, receipt
+supply and fees per share) and the vault follows LBPool's share accounting, withdrawal plan and harvest, so a
+scenario can be played without a fork and compared with the chain, see test_simulator_parity in main_test.
+"""
+from copy import copy
+from dataclasses import dataclass, field
+
+from brownie import chain, interface, multicall
+from tests.helpers.bin_math import (
+    BASIS_POINT_MAX, SCALE_OFFSET, get_price_from_id, mul_shift_round_down, mul_shift_round_up, shift_div_round_down,
+    shift_div_round_up
+)
+from tests.helpers.pair_reader import pair_reader
+
+
+PRECISION = 10**18
+VAULT_PRECISION = 10_000
+
+
+def diff_or_zero(a, b):
+    return a - b if a > b else 0
+
+
+@dataclass
+class FeeParameters:
+    bin_step: int
+    base_factor: int
+    filter_period: int
+    decay_period: int
+    reduction_factor: int
+    variable_fee_control: int
+    protocol_share: int
+    max_volatility_accumulated: int
+    volatility_accumulated: int = 0
+    volatility_reference: int = 0
+    index_ref: int = 0
+    time: int = 0
+
+    def base_fee(self):
+        return self.base_factor * self.bin_step * 10**10
+
+    def variable_fee(self):
+        prod = self.volatility_accumulated * self.bin_step
+        return (prod * prod * self.variable_fee_control + 99) // 100
+
+    def total_fee(self):
+        return self.base_fee() + self.variable_fee()
+
+    def fee_amount(self, amount):
+        # Fee to add on top of amount
+        fee = self.total_fee()
+        denominator = PRECISION - fee
+        return (amount * fee + denominator - 1) // denominator
+
+    def fee_amount_from(self, amount_with_fees):
+        # Fee included in amount_with_fees
+        return (amount_with_fees * self.total_fee() + PRECISION - 1) // PRECISION
+
+    def fee_amount_for_composition(self, amount):
+        fee = self.total_fee()
+        return (amount * fee * (fee + PRECISION)) // (PRECISION * PRECISION)
+
+    def fee_distribution(self, fees):
+        return fees, (fees * self.protocol_share) // BASIS_POINT_MAX
+
+    def update_variable_fee_parameters(self, active_id, timestamp):
+        delta_t = timestamp - self.time
+        if delta_t >= self.filter_period:
+            self.index_ref = active_id
+            if delta_t < self.decay_period:
+                self.volatility_reference = (
+                    self.volatility_accumulated * self.reduction_factor // BASIS_POINT_MAX
+                )
+            else:
+                self.volatility_reference = 0
+
+    def update_volatility_accumulated(self, active_id):
+        accumulated = self.volatility_reference + abs(active_id - self.index_ref) * BASIS_POINT_MAX
+        self.volatility_accumulated = min(accumulated, self.max_volatility_accumulated)
+
+
+@dataclass
+class Bin:
+    reserve_x: int = 0
+    reserve_y: int = 0
+    total_supply: int = 0
+    acc_x_per_share: int = 0
+    acc_y_per_share: int = 0
+
+
+class SimulationError(Exception):
+    ...
+
+
+class LBPairSimulator:
+    """LBPair of Liquidity Book v1, only the bins that were loaded or touched are known."""
+
+    def __init__(self, active_id, fee_parameters: FeeParameters, timestamp=0):
+        self.active_id = active_id
+        self.fee_parameters = fee_parameters
+        self.timestamp = timestamp
+        self.bins = {}
+        self.balances = {}
+        # (account, id) -> (debt X, debt Y), account -> [unclaimed X, unclaimed Y]
+        self.debts = {}
+        self.unclaimed = {}
+        self.protocol_fees = [0, 0]
+
+    @classmethod
+    def from_pair(cls, pair, bins, accounts=()):
+        """Loads the fee parameters and the given bins of an on-chain pair, with the receipts of accounts.
+
+        Fees accrued before the snapshot are not loaded, only the ones of the simulated swaps are tracked.
+        """
+        receipt = interface.ILBToken(pair.address)
+        (_, _, active_id), reserves = pair_reader.read(pair, bins)
+        with multicall(block_identifier=chain[-1]["number"]):
+            fee_parameters = pair.feeParameters()
+            supplies = [receipt.totalSupply(bin_id) for bin_id in bins]
+            balances = [[receipt.balanceOf(account, bin_id) for bin_id in bins] for account in accounts]
+        fee_parameters = FeeParameters(*fee_parameters)
+        simulator = cls(active_id, fee_parameters, fee_parameters.time)
+        for bin_id, supply in zip(bins, supplies):
+            simulator.bins[bin_id] = Bin(*reserves[bin_id], supply)
+        for account, account_balances in zip(accounts, balances):
+            for bin_id, balance in zip(bins, account_balances):
+                if balance > 0:
+                    simulator.balances[(str(account), bin_id)] = balance
+        return simulator
+
+    def get_bin(self, bin_id):
+        return self.bins.setdefault(bin_id, Bin())
+
+    def get_reserves_and_id(self):
+        return (
+            sum(bin.reserve_x for bin in self.bins.values()),
+            sum(bin.reserve_y for bin in self.bins.values()),
+            self.active_id,
+        )
+
+    def balance_of(self, account, bin_id):
+        return self.balances.get((str(account), bin_id), 0)
+
+    def _get_amounts(self, bin: Bin, swap_for_y, amount_in):
+        fee_parameters = self.fee_parameters
+        price = get_price_from_id(self.active_id, fee_parameters.bin_step)
+        if swap_for_y:
+            reserve = bin.reserve_y
+            max_amount_in = shift_div_round_up(reserve, SCALE_OFFSET, price)
+        else:
+            reserve = bin.reserve_x
+            max_amount_in = mul_shift_round_up(price, reserve, SCALE_OFFSET)
+        fee_parameters.update_volatility_accumulated(self.active_id)
+        fees = fee_parameters.fee_distribution(fee_parameters.fee_amount(max_amount_in))
+        if max_amount_in + fees[0] <= amount_in:
+            return max_amount_in, reserve, fees
+        fees = fee_parameters.fee_distribution(fee_parameters.fee_amount_from(amount_in))
+        amount_in_to_bin = amount_in - fees[0]
+        if swap_for_y:
+            amount_out = mul_shift_round_down(price, amount_in_to_bin, SCALE_OFFSET)
+        else:
+            amount_out = shift_div_round_down(amount_in_to_bin, SCALE_OFFSET, price)
+        return amount_in_to_bin, min(amount_out, reserve), fees
+
+    def _next_non_empty_bin(self, swap_for_y):
+        # Selling tokenX moves the active bin down, towards the bins holding tokenY
+        candidates = [
+            bin_id for bin_id, bin in self.bins.items()
+            if (bin.reserve_y if swap_for_y else bin.reserve_x) > 0
+            and (bin_id < self.active_id if swap_for_y else bin_id > self.active_id)
+        ]
+        if not candidates:
+            raise SimulationError("No liquidity left in the loaded bins")
+        return max(candidates) if swap_for_y else min(candidates)
+
+    def swap(self, amount_in, swap_for_y, timestamp=None):
+        """Swaps amount_in of tokenX for tokenY if swap_for_y, tokenY for tokenX otherwise.
+
+        Returns the amount of the other token sent out.
+        """
+        if timestamp is not None:
+            self.timestamp = timestamp
+        fee_parameters = self.fee_parameters
+        fee_parameters.update_variable_fee_parameters(self.active_id, self.timestamp)
+        amount_out = 0
+        while True:
+            bin = self.get_bin(self.active_id)
+            if (bin.reserve_y if swap_for_y else bin.reserve_x) != 0:
+                amount_in_to_bin, amount_out_of_bin, fees = self._get_amounts(bin, swap_for_y, amount_in)
+                if amount_in_to_bin != 0:
+                    self._add_fees(bin, fees, swap_for_y)
+                    if swap_for_y:
+                        bin.reserve_x += amount_in_to_bin
+                        bin.reserve_y -= amount_out_of_bin
+                    else:
+                        bin.reserve_y += amount_in_to_bin
+                        bin.reserve_x -= amount_out_of_bin
+                    amount_in -= amount_in_to_bin + fees[0]
+                    amount_out += amount_out_of_bin
+            if amount_in == 0:
+                break
+            self.active_id = self._next_non_empty_bin(swap_for_y)
+        fee_parameters.time = self.timestamp
+        return amount_out
+
+    def get_amount_in_to_reach(self, target_id, active_ratio=0.5):
+        """Amount to swap so that the swap ends in target_id, having bought active_ratio of its reserve.
+
+        The bins before the target are drained and priced exactly as swap does, with the fees they would charge,
+        the pair itself is not changed. Bins towards tokenY are reached by selling tokenX, the others by selling
+        tokenY, and the bins in between must be loaded.
+        """
+        swap_for_y = target_id < self.active_id
+        fee_parameters = copy(self.fee_parameters)
+        fee_parameters.update_variable_fee_parameters(self.active_id, self.timestamp)
+        amount_in = 0
+        for bin_id in range(self.active_id, target_id, -1 if swap_for_y else 1):
+            reserve = self._get_reserve_out(bin_id, swap_for_y)
+            # The swap skips the empty bins without updating the volatility
+            if reserve == 0:
+                continue
+            price = get_price_from_id(bin_id, fee_parameters.bin_step)
+            if swap_for_y:
+                max_amount_in = shift_div_round_up(reserve, SCALE_OFFSET, price)
+            else:
+                max_amount_in = mul_shift_round_up(price, reserve, SCALE_OFFSET)
+            fee_parameters.update_volatility_accumulated(bin_id)
+            amount_in += max_amount_in + fee_parameters.fee_amount(max_amount_in)
+
+        reserve = self._get_reserve_out(target_id, swap_for_y)
+        if reserve == 0:
+            raise SimulationError(f"Bin {target_id} holds none of the bought token, the swap would go past it")
+        price = get_price_from_id(target_id, fee_parameters.bin_step)
+        fee_parameters.update_volatility_accumulated(target_id)
+        amount_out = reserve * round(active_ratio * PRECISION) // PRECISION
+        if swap_for_y:
+            amount_in_to_bin = shift_div_round_up(amount_out, SCALE_OFFSET, price)
+        else:
+            amount_in_to_bin = mul_shift_round_up(price, amount_out, SCALE_OFFSET)
+        # At least 1 wei has to reach the bin, the swap would move on from it otherwise
+        amount_in_to_bin = max(amount_in_to_bin, 1)
+        # The fee of a partial swap is taken from the amount, find the smallest amount leaving amount_in_to_bin
+        amount_with_fees = amount_in_to_bin + fee_parameters.fee_amount(amount_in_to_bin)
+        while amount_with_fees - fee_parameters.fee_amount_from(amount_with_fees) < amount_in_to_bin:
+            amount_with_fees += 1
+        while amount_with_fees - 1 - fee_parameters.fee_amount_from(amount_with_fees - 1) >= amount_in_to_bin:
+            amount_with_fees -= 1
+        return amount_in + amount_with_fees
+
+    def _get_reserve_out(self, bin_id, swap_for_y):
+        bin = self.bins.get(bin_id, Bin())
+        return bin.reserve_y if swap_for_y else bin.reserve_x
+
+    def _add_fees(self, bin: Bin, fees, is_token_x):
+        total, protocol = fees
+        self.protocol_fees[0 if is_token_x else 1] += protocol
+        if bin.total_supply == 0:
+            return
+        per_share = ((total - protocol) << SCALE_OFFSET) // bin.total_supply
+        if is_token_x:
+            bin.acc_x_per_share += per_share
+        else:
+            bin.acc_y_per_share += per_share
+
+    def _cache_fees(self, account, bin_id):
+        # Moves the fees earned by the current balance to the unclaimed fees, before the balance changes
+        bin = self.get_bin(bin_id)
+        key = (str(account), bin_id)
+        balance = self.balances.get(key, 0)
+        debt_x, debt_y = self.debts.get(key, (0, 0))
+        unclaimed = self.unclaimed.setdefault(str(account), [0, 0])
+        unclaimed[0] += (balance * (bin.acc_x_per_share - debt_x)) >> SCALE_OFFSET
+        unclaimed[1] += (balance * (bin.acc_y_per_share - debt_y)) >> SCALE_OFFSET
+        self.debts[key] = (bin.acc_x_per_share, bin.acc_y_per_share)
+
+    def pending_fees(self, account, ids):
+        amount_x, amount_y = 0, 0
+        for bin_id in ids:
+            bin = self.get_bin(bin_id)
+            key = (str(account), bin_id)
+            balance = self.balances.get(key, 0)
+            debt_x, debt_y = self.debts.get(key, (0, 0))
+            amount_x += (balance * (bin.acc_x_per_share - debt_x)) >> SCALE_OFFSET
+            amount_y += (balance * (bin.acc_y_per_share - debt_y)) >> SCALE_OFFSET
+        unclaimed = self.unclaimed.get(str(account), [0, 0])
+        return amount_x + unclaimed[0], amount_y + unclaimed[1]
+
+    def collect_fees(self, account, ids):
+        for bin_id in ids:
+            self._cache_fees(account, bin_id)
+        amounts = tuple(self.unclaimed.get(str(account), [0, 0]))
+        self.unclaimed[str(account)] = [0, 0]
+        return amounts
+
+    def mint(self, ids, distribution_x, distribution_y, amount_x_in, amount_y_in, to):
+        """Mints the liquidity of each bin, as LBPair.mint.
+
+        Returns the amounts added to the pair and the liquidity minted per bin, the rest goes back to the sender.
+        """
+        fee_parameters = self.fee_parameters
+        added_x, added_y, liquidity_minted = 0, 0, []
+        for bin_id, weight_x, weight_y in zip(ids, distribution_x, distribution_y):
+            amount_x = amount_x_in * weight_x // PRECISION
+            amount_y = amount_y_in * weight_y // PRECISION
+            bin = self.get_bin(bin_id)
+            price = get_price_from_id(bin_id, fee_parameters.bin_step)
+            if bin_id >= self.active_id:
+                if bin_id == self.active_id:
+                    amount_x, amount_y = self._charge_composition_fee(bin, price, amount_x, amount_y)
+                elif amount_y != 0:
+                    raise SimulationError(f"Composition factor flawed in bin {bin_id}")
+            elif amount_x != 0:
+                raise SimulationError(f"Composition factor flawed in bin {bin_id}")
+            liquidity = mul_shift_round_down(price, amount_x, SCALE_OFFSET) + amount_y
+            if liquidity == 0:
+                raise SimulationError(f"Insufficient liquidity minted in bin {bin_id}")
+            bin.reserve_x += amount_x
+            bin.reserve_y += amount_y
+            self._cache_fees(to, bin_id)
+            self.balances[(str(to), bin_id)] = self.balance_of(to, bin_id) + liquidity
+            bin.total_supply += liquidity
+            added_x += amount_x
+            added_y += amount_y
+            liquidity_minted.append(liquidity)
+        return added_x, added_y, liquidity_minted
+
+    def _charge_composition_fee(self, bin: Bin, price, amount_x, amount_y):
+        # LBPair.mint works on a memory copy of the fee parameters, the update is not stored
+        fee_parameters = copy(self.fee_parameters)
+        user_liquidity = mul_shift_round_down(price, amount_x, SCALE_OFFSET) + amount_y
+        received_x = user_liquidity * (bin.reserve_x + amount_x) // (bin.total_supply + user_liquidity)
+        received_y = user_liquidity * (bin.reserve_y + amount_y) // (bin.total_supply + user_liquidity)
+        fee_parameters.update_variable_fee_parameters(self.active_id, self.timestamp)
+        if amount_x > received_x:
+            fees = fee_parameters.fee_distribution(fee_parameters.fee_amount_for_composition(amount_x - received_x))
+            amount_x -= fees[0]
+            self._add_fees(bin, fees, True)
+        elif amount_y > received_y:
+            fees = fee_parameters.fee_distribution(fee_parameters.fee_amount_for_composition(amount_y - received_y))
+            amount_y -= fees[0]
+            self._add_fees(bin, fees, False)
+        return amount_x, amount_y
+
+    def burn(self, ids, amounts, account):
+        """Burns the receipts of account, returns the amounts of tokenX and tokenY sent back."""
+        amount_x, amount_y = 0, 0
+        for bin_id, amount in zip(ids, amounts):
+            bin = self.get_bin(bin_id)
+            if amount > self.balance_of(account, bin_id):
+                raise SimulationError(f"Burn exceeds balance in bin {bin_id}")
+            out_x = amount * bin.reserve_x // bin.total_supply
+            out_y = amount * bin.reserve_y // bin.total_supply
+            self._cache_fees(account, bin_id)
+            self.balances[(str(account), bin_id)] -= amount
+            bin.total_supply -= amount
+            bin.reserve_x -= out_x
+            bin.reserve_y -= out_y
+            amount_x += out_x
+            amount_y += out_y
+        return amount_x, amount_y
+
+    def add_liquidity(self, amount_x, amount_y, delta_ids, distribution_x, distribution_y, to):
+        """ILBRouter.addLiquidity around the active bin, returns the deposit ids and the liquidity minted."""
+        ids = [self.active_id + delta for delta in delta_ids]
+        _, _, liquidity_minted = self.mint(ids, distribution_x, distribution_y, amount_x, amount_y, to)
+        return ids, liquidity_minted
+
+
+@dataclass
+class LBPoolSimulator:
+    """LBPool on top of a simulated pair, amounts of the vault are tracked as its balances.
+
+    oracle_price is the price of tokenX in tokenY scaled by 1e18, as returned by getOraclePrice. The harvest fees
+    are kept per recipient in claimable_fees, as (tokenX, tokenY), like ReceiptsHolder.claimableFees.
+    """
+    pair: LBPairSimulator
+    decimals_x: int
+    oracle_price: int
+    receipts_holder: str = "receipts_holder"
+    manager: str = "manager"
+    protocol_fee_recipient: str = "protocol_fee_recipient"
+    withdrawal_fee: int = 0
+    withdrawal_fee_delay: int = 0
+    harvest_interval: int = 0
+    min_harvest_value: int = 0
+    caller_fee: int = 0
+    manager_fee: int = 0
+    protocol_fee: int = 0
+    balance_x: int = 0
+    balance_y: int = 0
+    total_supply: int = 0
+    last_harvest: int = 0
+    shares: dict = field(default_factory=dict)
+    last_deposited_time: dict = field(default_factory=dict)
+    bin_receipt_balance: dict = field(default_factory=dict)
+    claimable_fees: dict = field(default_factory=dict)
+
+    def get_deposited_bins(self):
+        return sorted(bin_id for bin_id, balance in self.bin_receipt_balance.items() if balance > 0)
+
+    def get_reserve_for_bin(self, bin_id):
+        receipt_balance = self.bin_receipt_balance.get(bin_id, 0)
+        bin = self.pair.get_bin(bin_id)
+        if receipt_balance == 0 or bin.total_supply == 0:
+            return 0, 0
+        return (
+            bin.reserve_x * receipt_balance // bin.total_supply,
+            bin.reserve_y * receipt_balance // bin.total_supply,
+        )
+
+    def get_total_funds(self):
+        total_x, total_y = self.balance_x, self.balance_y
+        for bin_id in self.get_deposited_bins():
+            reserve_x, reserve_y = self.get_reserve_for_bin(bin_id)
+            total_x += reserve_x
+            total_y += reserve_y
+        return total_x, total_y
+
+    def get_shares_for_deposit_tokens(self, amount, pending_x=0, pending_y=0):
+        total_x, total_y = self.get_total_funds()
+        total_deposits = total_y + pending_y + (total_x + pending_x) * self.oracle_price // 10**18
+        if self.total_supply == 0 or total_deposits == 0:
+            return amount * 10 ** (18 - self.decimals_x + 12)
+        return amount * self.total_supply // total_deposits
+
+    def get_harvest_fee(self):
+        return self.caller_fee + self.manager_fee + self.protocol_fee
+
+    def harvest(self, caller, timestamp=None):
+        """LBPool.harvest, each fee is rounded down on its own and the vault gets the rest."""
+        if timestamp is not None:
+            self.last_harvest = timestamp
+        bins = self.get_deposited_bins()
+        if not bins:
+            return
+        collected = self.pair.collect_fees(self.receipts_holder, bins)
+        for recipient, fee in (
+            (caller, self.caller_fee),
+            (self.manager, self.manager_fee),
+            (self.protocol_fee_recipient, self.protocol_fee),
+        ):
+            fees = [amount * fee // VAULT_PRECISION for amount in collected]
+            claimable = self.claimable_fees.get(recipient, (0, 0))
+            self.claimable_fees[recipient] = (claimable[0] + fees[0], claimable[1] + fees[1])
+            collected = (collected[0] - fees[0], collected[1] - fees[1])
+        self.balance_x += collected[0]
+        self.balance_y += collected[1]
+
+    def harvest_if_due(self, caller, timestamp):
+        """LBPool._harvestIfDue, returns the fees left in the pair net of the harvest fees."""
+        due = timestamp >= self.last_harvest + self.harvest_interval
+        if due and self.min_harvest_value == 0:
+            self.harvest(caller, timestamp)
+            return 0, 0
+        pending_x, pending_y = self.pair.pending_fees(self.receipts_holder, self.get_deposited_bins())
+        if due and pending_x * self.oracle_price // 10**18 + pending_y >= self.min_harvest_value:
+            self.harvest(caller, timestamp)
+            return 0, 0
+        harvest_fee = self.get_harvest_fee()
+        return (
+            pending_x - pending_x * harvest_fee // VAULT_PRECISION,
+            pending_y - pending_y * harvest_fee // VAULT_PRECISION,
+        )
+
+    def deposit(self, user, amount_x, amount_y, timestamp=0):
+        pending_x, pending_y = self.harvest_if_due(user, timestamp)
+        shares = self.get_shares_for_deposit_tokens(
+            amount_x * self.oracle_price // 10**18 + amount_y, pending_x, pending_y
+        )
+        if shares == 0:
+            raise SimulationError("Cannot mint 0 shares")
+        self.balance_x += amount_x
+        self.balance_y += amount_y
+        self.shares[user] = self.shares.get(user, 0) + shares
+        self.total_supply += shares
+        self.last_deposited_time[user] = timestamp
+        return shares
+
+    def add_liquidity(self, amount_x, amount_y, delta_ids, distribution_x, distribution_y):
+        ids, liquidity_minted = self.pair.add_liquidity(
+            amount_x, amount_y, delta_ids, distribution_x, distribution_y, self.receipts_holder
+        )
+        for bin_id, liquidity in zip(ids, liquidity_minted):
+            self.bin_receipt_balance[bin_id] = self.bin_receipt_balance.get(bin_id, 0) + liquidity
+        # The pair only takes the amounts of the distributions, the rest stays in the vault
+        used_x = sum(amount_x * weight // PRECISION for weight in distribution_x)
+        used_y = sum(amount_y * weight // PRECISION for weight in distribution_y)
+        self.balance_x -= used_x
+        self.balance_y -= used_y
+        return ids, liquidity_minted
+
+    def add_all_liquidity(self, delta_ids, distribution_x, distribution_y):
+        return self.add_liquidity(self.balance_x, self.balance_y, delta_ids, distribution_x, distribution_y)
+
+    def remove_liquidity(self, ids, amounts):
+        amount_x, amount_y = self.pair.burn(ids, amounts, self.receipts_holder)
+        for bin_id, amount in zip(ids, amounts):
+            self.bin_receipt_balance[bin_id] -= amount
+        self.balance_x += amount_x
+        self.balance_y += amount_y
+
+    def withdraw_all_liquidity(self):
+        bins = self.get_deposited_bins()
+        if bins:
+            self.remove_liquidity(bins, [self.bin_receipt_balance[bin_id] for bin_id in bins])
+
+    def execute_rebalance(self, delta_ids, distribution_x, distribution_y):
+        self.withdraw_all_liquidity()
+        self.add_all_liquidity(delta_ids, distribution_x, distribution_y)
+
+    def compute_withdrawal_plan(self, amount_x, amount_y):
+        """ViewHelper.computeWithdrawalPlan on the current bins, returns the ids and receipts to burn."""
+        bins = self.get_deposited_bins()
+        reserves = [self.get_reserve_for_bin(bin_id) for bin_id in bins]
+        receipts = [self.bin_receipt_balance[bin_id] for bin_id in bins]
+        active_id = self.pair.active_id
+        outside_x = sum(reserve[0] for bin_id, reserve in zip(bins, reserves) if bin_id != active_id)
+        outside_y = sum(reserve[1] for bin_id, reserve in zip(bins, reserves) if bin_id != active_id)
+        needed_x, needed_y = diff_or_zero(amount_x, outside_x), diff_or_zero(amount_y, outside_y)
+        reserve_x, reserve_y = self.get_reserve_for_bin(active_id)
+        if needed_x > reserve_x or needed_y > reserve_y:
+            raise SimulationError("Not enough reserves")
+        shares_from_active = 0
+        if needed_x or needed_y:
+            receipt_balance = self.bin_receipt_balance[active_id]
+            if needed_x == 0 or needed_y * reserve_x > reserve_y * needed_x:
+                shares_from_active = needed_y * receipt_balance // reserve_y
+                amount_x = diff_or_zero(amount_x, reserve_x * shares_from_active // receipt_balance)
+                amount_y -= needed_y
+            else:
+                shares_from_active = needed_x * receipt_balance // reserve_x
+                amount_y = diff_or_zero(amount_y, reserve_y * shares_from_active // receipt_balance)
+                amount_x -= needed_x
+
+        plan = []
+        # tokenY is taken from the lowest bins up, then the active bin, then tokenX from the highest bins down
+        for amount, is_token_x in ((amount_y, False), (None, None), (amount_x, True)):
+            if is_token_x is None:
+                if shares_from_active > 0:
+                    plan.append((active_id, shares_from_active))
+                continue
+            side = [
+                (bin_id, reserve[int(not is_token_x)], receipt)
+                for bin_id, reserve, receipt in zip(bins, reserves, receipts)
+                if (bin_id > active_id if is_token_x else bin_id < active_id)
+            ]
+            for bin_id, bin_reserve, receipt in (reversed(side) if is_token_x else side):
+                if amount == 0:
+                    break
+                if receipt == 0 or bin_reserve == 0:
+                    continue
+                if bin_reserve >= amount:
+                    if amount * receipt // bin_reserve > 0:
+                        plan.append((bin_id, amount * receipt // bin_reserve))
+                    break
+                amount -= bin_reserve
+                plan.append((bin_id, receipt))
+        return [bin_id for bin_id, _ in plan], [amount for _, amount in plan]
+
+    def withdraw(self, user, amount_x, amount_y, timestamp=0):
+        """LBPool.withdraw without harvest, returns the amounts sent to the user."""
+        needed_shares = self.get_shares_for_deposit_tokens(amount_x * self.oracle_price // 10**18 + amount_y + 1) + 1
+        if needed_shares > self.shares.get(user, 0):
+            raise SimulationError("Burn amount exceeds balance")
+        self.shares[user] -= needed_shares
+        self.total_supply -= needed_shares
+        fee = 0
+        if timestamp < self.last_deposited_time.get(user, 0) + self.withdrawal_fee_delay:
+            fee = self.withdrawal_fee
+        amount_x_after_fee = amount_x - amount_x * fee // VAULT_PRECISION
+        amount_y_after_fee = amount_y - amount_y * fee // VAULT_PRECISION
+        missing_x = diff_or_zero(amount_x_after_fee, self.balance_x)
+        missing_y = diff_or_zero(amount_y_after_fee, self.balance_y)
+        if missing_x > 0 or missing_y > 0:
+            self.remove_liquidity(*self.compute_withdrawal_plan(missing_x, missing_y))
+        sent_x = min(amount_x_after_fee, self.balance_x) if missing_x > 0 else amount_x_after_fee
+        sent_y = min(amount_y_after_fee, self.balance_y) if missing_y > 0 else amount_y_after_fee
+        if sent_x > self.balance_x or sent_y > self.balance_y:
+            raise SimulationError("Transfer amount exceeds balance")
+        self.balance_x -= sent_x
+        self.balance_y -= sent_y
+        return sent_x, sent_y
+
+    def withdraw_by_shares(self, user, shares, timestamp=0):
+        total_x, total_y = self.get_total_funds()
+        effective_shares = shares - (self.get_shares_for_deposit_tokens(1) + 1)
+        amount_x = total_x * effective_shares // self.total_supply
+        amount_y = total_y * effective_shares // self.total_supply
+        return self.withdraw(user, amount_x, amount_y, timestamp)
@@ -0,0 +1,50 @@
+"""Batched and block-pinned reads of Liquidity Book pairs, for the test helpers.
+
+Every read goes through brownie's multicall, which deploys a Multicall2 on development networks, and is pinned to
+the latest block. The results are cached until the chain moves to another block, so the helpers of a test can
+share them instead of calling getBin and getReservesAndId again.
+"""
+from brownie import chain, multicall
+
+
+class PairReader:
+    def __init__(self):
+        self._block = None
+        self._cache = {}
+
+    def _get_cache(self, pair):
+        latest = chain[-1]
+        # The hash tells the block apart from the one mined at the same height before a revert
+        block = (latest["number"], latest["hash"])
+        if block != self._block:
+            self._block = block
+            self._cache = {}
+        return self._cache.setdefault(pair.address, {"bins": {}})
+
+    def read(self, pair, bins=()):
+        """Returns the reserves and active id of the pair and the reserves of bins, in one call per block.
+
+        Only what is not cached for the latest block yet is fetched.
+        """
+        cache = self._get_cache(pair)
+        missing = [bin for bin in dict.fromkeys(bins) if bin not in cache["bins"]]
+        if missing or "reserves_and_id" not in cache:
+            with multicall(block_identifier=self._block[0]):
+                reserves_and_id = pair.getReservesAndId() if "reserves_and_id" not in cache else None
+                reserves = [pair.getBin(bin) for bin in missing]
+            if reserves_and_id is not None:
+                cache["reserves_and_id"] = tuple(reserves_and_id)
+            cache["bins"].update(zip(missing, (tuple(reserve) for reserve in reserves)))
+        return cache["reserves_and_id"], {bin: cache["bins"][bin] for bin in bins}
+
+    def get_reserves_and_id(self, pair):
+        return self.read(pair)[0]
+
+    def get_active_id(self, pair):
+        return self.read(pair)[0][2]
+
+    def get_reserves_for_bins(self, pair, bins):
+        return self.read(pair, bins)[1]
+
+
+pair_reader = PairReader()
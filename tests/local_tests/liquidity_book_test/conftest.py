@@ -0,0 +1,155 @@
+"""Vault stack on a plain development chain, with the mocks of contracts/mocks in place of Trader Joe.
+
+The pair, router and factory are MockLBPair, MockLBRouter and MockLBFactory, the tokens are MockERC20 priced by
+MockAggregator feeds, so nothing is read from a fork and every test starts from the same state.
+
+Only the tests of this directory run on the mocks. The deployment tests (main_test, no_external_test and
+gas_benchmark_test) are built on the mainnet pools, tokens and accounts of py_vector's DeploymentMap and still need
+a fork of Avalanche.
+"""
+from types import SimpleNamespace
+
+import pytest
+from brownie import (
+    LBPool, LBPoolFactory, MockAggregator, MockERC20, MockLBFactory, MockLBPair, MockLBRouter, OracleHelper,
+    ReceiptsHolder, Strategy, ViewHelper, accounts, chain
+)
+
+HOUR = 3600
+ACTIVE_ID = 2**23
+BIN_STEP = 20
+# binStep, baseFactor, filterPeriod, decayPeriod, reductionFactor, variableFeeControl, protocolShare,
+# maxVolatilityAccumulated, then the variable part set by the factory
+FEE_PARAMETERS = (BIN_STEP, 5_000, 30, 600, 5_000, 40_000, 1_000, 350_000, 0, 0, 0, 0)
+# Liquidity of the pair before the vault joins, spread evenly on both sides of the active bin
+SEED_RADIUS = 10
+SEED_AMOUNT = 1_000 * 10**18
+
+
+@pytest.fixture(scope="module")
+def deployer():
+    return accounts[0]
+
+
+@pytest.fixture(scope="module")
+def strategist():
+    return accounts[-1]
+
+
+@pytest.fixture(scope="module")
+def liquidity_provider():
+    return accounts[2]
+
+
+@pytest.fixture(scope="module")
+def tokens(deployer):
+    return (
+        MockERC20.deploy("Token X", "TKNX", 18, {"from": deployer}),
+        MockERC20.deploy("Token Y", "TKNY", 18, {"from": deployer}),
+    )
+
+
+@pytest.fixture(scope="module")
+def feeds(deployer):
+    # Both tokens at 1 USD, as the pair starts at a price of 1
+    return (
+        MockAggregator.deploy(8, 10**8, {"from": deployer}),
+        MockAggregator.deploy(8, 10**8, {"from": deployer}),
+    )
+
+
+@pytest.fixture(scope="module")
+def router(deployer):
+    return MockLBRouter.deploy(MockLBFactory.deploy({"from": deployer}), {"from": deployer})
+
+
+@pytest.fixture(scope="module")
+def pair(deployer, router, tokens, liquidity_provider):
+    tokenX, tokenY = tokens
+    factory = MockLBFactory.at(router.factory())
+    factory.createLBPair(tokenX, tokenY, ACTIVE_ID, FEE_PARAMETERS, {"from": deployer})
+    pair = MockLBPair.at(factory.getLBPairInformation(tokenX, tokenY, BIN_STEP)[1])
+    add_liquidity(router, tokens, liquidity_provider, SEED_AMOUNT, SEED_AMOUNT, SEED_RADIUS)
+    return pair
+
+
+@pytest.fixture(scope="module")
+def oracle(deployer, tokens, feeds):
+    oracle = OracleHelper.deploy({"from": deployer})
+    for token, feed in zip(tokens, feeds):
+        oracle.setFeedForToken(token, feed, {"from": deployer})
+    return oracle
+
+
+@pytest.fixture(scope="module")
+def view_helper(deployer):
+    view_helper = ViewHelper.deploy({"from": deployer})
+    view_helper.__ViewHelper_init({"from": deployer})
+    return view_helper
+
+
+@pytest.fixture(scope="module")
+def pool_contracts(deployer, strategist, router, pair, oracle, view_helper):
+    pool_factory = LBPoolFactory.deploy(
+        LBPool.deploy({"from": deployer}),
+        ReceiptsHolder.deploy({"from": deployer}),
+        Strategy.deploy({"from": deployer}),
+        router,
+        view_helper,
+        oracle,
+        {"from": deployer},
+    )
+    tx = pool_factory.createPool(
+        (pair, deployer, strategist, 10**16, 10**16, 10**16, 10**17, 10**17, 10, 0, HOUR, 10),
+        {"from": deployer},
+    )
+    vault, receipts_holder, strategy = tx.return_value
+    return SimpleNamespace(
+        vault=LBPool.at(vault),
+        receipts_holder=ReceiptsHolder.at(receipts_holder),
+        strategy=Strategy.at(strategy),
+        pool_v2=pair,
+        bin_step=BIN_STEP,
+    )
+
+
+@pytest.fixture(scope="module")
+def user1(tokens):
+    return fund(accounts[3], tokens)
+
+
+@pytest.fixture(scope="module")
+def user2(tokens):
+    return fund(accounts[4], tokens)
+
+
+@pytest.fixture(scope="function", autouse=True)
+def isolation(fn_isolation):
+    pass
+
+
+def fund(account, tokens, amount=1_000 * 10**18):
+    for token in tokens:
+        token.mint(account, amount, {"from": account})
+    return account
+
+
+def add_liquidity(router, tokens, account, amountX, amountY, radius):
+    """Adds amountX in the active bin and the radius bins above it, amountY in the active bin and the ones below."""
+    tokenX, tokenY = tokens
+    fund(account, tokens, max(amountX, amountY))
+    tokenX.approve(router, amountX, {"from": account})
+    tokenY.approve(router, amountY, {"from": account})
+    delta_ids = list(range(-radius, radius + 1))
+    weight = 10**18 // (radius + 1)
+    distribution_X = [weight if delta >= 0 else 0 for delta in delta_ids]
+    distribution_Y = [weight if delta <= 0 else 0 for delta in delta_ids]
+    pair = MockLBFactory.at(router.factory()).getLBPairInformation(tokenX, tokenY, BIN_STEP)[1]
+    (_, _, active_id) = MockLBPair.at(pair).getReservesAndId()
+    return router.addLiquidity(
+        (
+            tokenX, tokenY, BIN_STEP, amountX, amountY, 0, 0, active_id, 0, delta_ids, distribution_X,
+            distribution_Y, account, chain.time() + HOUR,
+        ),
+        {"from": account},
+    )
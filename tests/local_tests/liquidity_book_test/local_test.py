@@ -0,0 +1,196 @@
+from dataclasses import astuple
+
+import pytest
+from brownie import accounts, chain, reverts
+from pytest import approx
+from tests.helpers.bin_math import get_price_from_id, get_price_ladder, to_decimal_price
+from tests.helpers.lb_simulator import LBPairSimulator
+
+
+HOUR = 3600
+TOTAL_WEIGHT_1_PCT = 10**16
+
+delta_ids = [-2, -1, 0, 1]
+distribution_X = [0, 0, 50 * TOTAL_WEIGHT_1_PCT, 50 * TOTAL_WEIGHT_1_PCT]
+distribution_Y = [50 * TOTAL_WEIGHT_1_PCT, 50 * TOTAL_WEIGHT_1_PCT, 0, 0]
+
+
+@pytest.fixture(scope="module")
+def trader():
+    return accounts[5]
+
+
+def swap(router, tokens, account, amount_in, swap_for_y, bin_step):
+    """Sells amount_in of tokenX if swap_for_y, of tokenY otherwise, through the router."""
+    token_in, token_out = tokens if swap_for_y else tokens[::-1]
+    token_in.mint(account, amount_in, {"from": account})
+    token_in.approve(router, amount_in, {"from": account})
+    return router.swapExactTokensForTokens(
+        amount_in, 0, [bin_step], [token_in, token_out], account, chain.time() + HOUR, {"from": account}
+    )
+
+
+def get_active_id(pair):
+    return pair.getReservesAndId()[2]
+
+
+def test_vault_lifecycle(pool_contracts, tokens, feeds, router, user1, strategist, trader):
+    user1_params = {"from": user1}
+    strategist_params = {"from": strategist}
+    vault, strategy, pair = pool_contracts.vault, pool_contracts.strategy, pool_contracts.pool_v2
+    receipts_holder = pool_contracts.receipts_holder
+    tokenX, tokenY = tokens
+    initial_balances = (tokenX.balanceOf(user1), tokenY.balanceOf(user1))
+    active_id = get_active_id(pair)
+
+    amount = 100 * 10**18
+    tokenX.approve(vault, amount, user1_params)
+    tokenY.approve(vault, amount, user1_params)
+    vault.deposit(amount, amount, user1_params)
+    strategy.setParams(delta_ids, distribution_X, distribution_Y, False, False, strategist_params)
+    strategy.addAllLiquidity(False, strategist_params)
+    assert tokenX.balanceOf(vault) == tokenY.balanceOf(vault) == 0
+    assert sorted(vault.getDepositedBins()) == [active_id + delta for delta in delta_ids]
+    for bin in vault.getDepositedBins():
+        assert vault.binReceiptBalance(bin) == pair.balanceOf(receipts_holder, bin) > 0
+
+    # Buying tokenX moves the price up and leaves fees in tokenY for the bins crossed
+    swap(router, tokens, trader, 200 * 10**18, False, pool_contracts.bin_step)
+    new_active_id = get_active_id(pair)
+    assert new_active_id > active_id
+    assert pair.pendingFees(receipts_holder, vault.getDepositedBins())[1] > 0
+    new_price = get_price_from_id(new_active_id, pool_contracts.bin_step)
+    feeds[0].setAnswer(to_decimal_price(new_price, 8), {"from": strategist})
+    assert approx(vault.getOraclePrice(), rel=1e-7) == vault.getPriceFromActiveBin()
+
+    chain.sleep(HOUR)
+    tx = vault.harvest(user1, user1_params)
+    assert tx.events["Harvest"]["amountY"] > 0
+    assert pair.pendingFees(receipts_holder, vault.getDepositedBins()) == (0, 0)
+
+    vault.withdrawByShares(vault.balanceOf(user1), False, user1_params)
+    assert vault.balanceOf(user1) == 0
+    withdrawn = (
+        tokenX.balanceOf(user1) - initial_balances[0] + amount,
+        tokenY.balanceOf(user1) - initial_balances[1] + amount,
+    )
+    # The vault sold some tokenX on the way up, it is worth about what holding the deposit would be
+    value = (withdrawn[0] * new_price >> 128) + withdrawn[1]
+    assert approx(value, rel=1e-2) == (amount * new_price >> 128) + amount
+
+
+def test_deposit_values_pending_fees(pool_contracts, tokens, feeds, router, user1, user2, deployer, strategist, trader):
+    strategist_params = {"from": strategist}
+    vault, strategy, pair = pool_contracts.vault, pool_contracts.strategy, pool_contracts.pool_v2
+    receipts_holder = pool_contracts.receipts_holder
+    tokenX, tokenY = tokens
+    strategy.setManagerFee(1_000, strategist_params)
+    strategy.setCallerFee(100, strategist_params)
+    amount = 100 * 10**18
+    for user in [user1, user2]:
+        tokenX.approve(vault, amount, {"from": user})
+        tokenY.approve(vault, amount, {"from": user})
+    vault.deposit(amount, amount, {"from": user1})
+    strategy.setParams(delta_ids, distribution_X, distribution_Y, False, False, strategist_params)
+    strategy.addAllLiquidity(False, strategist_params)
+    swap(router, tokens, trader, 200 * 10**18, False, pool_contracts.bin_step)
+    feeds[0].setAnswer(to_decimal_price(get_price_from_id(get_active_id(pair), pool_contracts.bin_step), 8), {"from": deployer})
+
+    def value_per_share(pendingX=0, pendingY=0):
+        totalX, totalY = vault.getTotalFunds()
+        return ((totalX + pendingX) * vault.getOraclePrice() // 10**18 + totalY + pendingY) / vault.totalSupply()
+
+    # The next deposit is throttled and leaves the fees in the pair, valued without what the harvest will take
+    vault.setHarvestPolicy(HOUR, 0, {"from": deployer})
+    last_harvest = vault.lastHarvest()
+    pending = pair.pendingFees(receipts_holder, vault.getDepositedBins())
+    assert pending[1] > 0
+    kept = vault.PRECISION() - receipts_holder.getHarvestFee()
+    value_before = value_per_share(*[fee * kept // vault.PRECISION() for fee in pending])
+    vault.deposit(amount, amount, {"from": user2})
+    assert vault.lastHarvest() == last_harvest
+    assert pair.pendingFees(receipts_holder, vault.getDepositedBins()) == pending
+
+    # Once harvested, the holders before the deposit were not diluted
+    vault.harvest(user1, {"from": user1})
+    assert approx(value_per_share(), rel=1e-9) == value_before
+
+
+def test_pair_matches_simulator(pool_contracts, tokens, router, liquidity_provider, trader):
+    pair, bin_step = pool_contracts.pool_v2, pool_contracts.bin_step
+    active_id = get_active_id(pair)
+    bins = range(active_id - 12, active_id + 13)
+    simulated_pair = LBPairSimulator.from_pair(pair, bins, [liquidity_provider])
+
+    def assert_parity():
+        assert simulated_pair.get_reserves_and_id() == pair.getReservesAndId()
+        for bin in bins:
+            simulated_bin = simulated_pair.get_bin(bin)
+            assert (simulated_bin.reserve_x, simulated_bin.reserve_y) == pair.getBin(bin)
+            assert simulated_bin.total_supply == pair.totalSupply(bin)
+        assert astuple(simulated_pair.fee_parameters) == pair.feeParameters()
+        assert simulated_pair.pending_fees(liquidity_provider, bins) == pair.pendingFees(liquidity_provider, bins)
+
+    # Within and past the filter and decay periods, so every branch of the variable fee is taken
+    for delay, amount_in, swap_for_y in [
+        (0, 150 * 10**18, True), (10, 40 * 10**18, False), (60, 300 * 10**18, False), (700, 10**16, True)
+    ]:
+        chain.sleep(delay)
+        tx = swap(router, tokens, trader, amount_in, swap_for_y, bin_step)
+        assert simulated_pair.swap(amount_in, swap_for_y, tx.timestamp) == tx.return_value
+        assert_parity()
+
+    # Off the composition of the active bin, the deposit pays the composition fee
+    tokenX, tokenY = tokens
+    amount = 30 * 10**18
+    for token in tokens:
+        token.mint(liquidity_provider, amount, {"from": liquidity_provider})
+        token.approve(router, amount, {"from": liquidity_provider})
+    ids = [get_active_id(pair) + delta for delta in delta_ids]
+    tx = router.addLiquidity(
+        (
+            tokenX, tokenY, bin_step, amount, amount, 0, 0, get_active_id(pair), 0, delta_ids, distribution_X,
+            distribution_Y, liquidity_provider, chain.time() + HOUR,
+        ),
+        {"from": liquidity_provider},
+    )
+    simulated_pair.timestamp = tx.timestamp
+    _, _, liquidity_minted = simulated_pair.mint(
+        ids, distribution_X, distribution_Y, amount, amount, liquidity_provider
+    )
+    assert tx.return_value == (ids, liquidity_minted)
+    assert_parity()
+
+    amounts = [pair.balanceOf(liquidity_provider, bin) // 2 for bin in ids]
+    pair.setApprovalForAll(router, True, {"from": liquidity_provider})
+    tx = router.removeLiquidity(
+        tokenX, tokenY, bin_step, 0, 0, ids, amounts, liquidity_provider, chain.time() + HOUR,
+        {"from": liquidity_provider},
+    )
+    assert simulated_pair.burn(ids, amounts, liquidity_provider) == tx.return_value
+    assert_parity()
+
+
+def test_oracle_twap(pool_contracts, oracle, tokens, router, deployer, trader):
+    pair, bin_step = pool_contracts.pool_v2, pool_contracts.bin_step
+    tokenX, tokenY = tokens
+    active_id = get_active_id(pair)
+    with reverts("Spot price"):
+        oracle.setPairSource(tokenX, tokenY, pair, 0, {"from": deployer})
+    assert oracle.getPairPrice(pair, 0, bin_step) == to_decimal_price(get_price_from_id(active_id, bin_step))
+
+    chain.sleep(HOUR)
+    target_id = active_id + 4
+    simulated_pair = LBPairSimulator.from_pair(pair, range(active_id, target_id + 1))
+    simulated_pair.timestamp = chain.time()
+    swap(router, tokens, trader, simulated_pair.get_amount_in_to_reach(target_id), False, bin_step)
+    assert get_active_id(pair) == target_id
+    chain.sleep(HOUR // 2)
+    chain.mine()
+
+    # About half of the period at each id, the average lands strictly between them
+    oracle.setPairSource(tokenX, tokenY, pair, HOUR, {"from": deployer})
+    twap = oracle.getPriceOfXInYUnits(tokenX, tokenY)
+    ladder = get_price_ladder(active_id, target_id - active_id + 1, bin_step)
+    ids_by_price = {to_decimal_price(price): id for id, price in zip(range(active_id, target_id + 1), ladder)}
+    assert active_id < ids_by_price[twap] < target_id